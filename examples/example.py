@@ -6,9 +6,9 @@ import yaml
 
 ssc = ssc32.SSC32('/dev/ttyUSB0', 115200,
                   autocommit=1000,
-                  config='example.cfg')
+                  config='arm.cfg')
 
-# see example config.cfg
+# see arm.cfg
 joint0 = ssc['joint0']
 joint1 = ssc['joint1']
 joint2 = ssc['joint2']
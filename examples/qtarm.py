@@ -3,29 +3,30 @@
 
 import os
 import sys
-import glob
 import threading
 from PyQt4 import Qt
 
 sys.path = [".."] + sys.path
 from ssc32 import SSC32
 #import ssc32
-from ssc32yaml import load_yaml, load_config
+from ssc32.registry import ScriptRegistry
+from ssc32yaml import load_config
 
 
 class MainWindow(Qt.QMainWindow):
     def __init__(self, parent=None):
         super(MainWindow, self).__init__(parent)
 
-        self.scripts = {}
         config = load_config()
-
-        for scr in glob.glob(os.path.join(os.path.dirname(__file__), 'scripts', '*.yaml')):
-            self.scripts[os.path.basename(scr)] = load_yaml(scr)
-            
         print(config)
 
         self.ssc = SSC32(config['port'], config['baud'], config=config['config'])
+        ## Scripts run on a worker thread while sliders commit from the GUI thread
+        self.ssc.start_scheduler()
+
+        ## Edited scripts are reloaded when they are run next
+        self.scripts = ScriptRegistry(os.path.join(os.path.dirname(__file__), 'scripts'), self.ssc)
+        self.scripts.start(period=1.0)
 
         widget = Qt.QWidget()
         layout = Qt.QHBoxLayout()
@@ -53,11 +54,11 @@ class MainWindow(Qt.QMainWindow):
         self.state = Qt.QLabel("Connected")
         blayout.addWidget(self.state)
 
-        for name, script in self.scripts.iteritems():
+        for name in self.scripts.names():
             button = Qt.QPushButton(name)
             blayout.addWidget(button)
             self.connect(button, Qt.SIGNAL('clicked()'),
-                         self.on_run_script(script))
+                         self.on_run_script(name))
 
     def on_movement_done(self, pn, move):
         self.update_state()
@@ -81,11 +82,12 @@ class MainWindow(Qt.QMainWindow):
         for name, slider in self.axis.iteritems():
             slider.setValue(self.ssc[name].position)
 
-    def on_run_script(self, script):
+    def on_run_script(self, name):
         def inner():
             def thread_run():
+                script = self.scripts.get(name)
                 script.on_movement_done = self.on_movement_done
-                script(self.ssc)
+                script.run(self.ssc)
                 self.update_sliders()
                 self.update_state()
 
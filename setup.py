@@ -32,5 +32,6 @@ setup(
     packages = ['ssc32'],
     scripts = ['ssc32yaml.py'],
     install_requires = ['pyserial', 'pyyaml'],
+    extras_require = {'numpy': ['numpy']},
     platforms = 'any',
 )
@@ -8,6 +8,7 @@ __version_tuple__ = (0, 5, 0)
 __version__ = '{0}.{1}.{2}'.format(*__version_tuple__)
 
 from .ssc32 import *
+from .protocol import *
 from .script import *
 
 try:
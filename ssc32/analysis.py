@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+Static timing analysis of scripts, without a board.
+
+A script is walked the way Movement.run() plays it: send the commit line,
+poll ``Q`` every 10 ms until the group move is over, then sleep the
+movement's wait. Serial time is 10 bits per byte at the link's baud rate;
+move times follow ssc32.motion.MotionModel.
+
+Example:
+::
+
+    from ssc32.emulator import EmulatedSSC32
+
+    ssc = EmulatedSSC32(baudrate=9600, config='examples/arm.cfg')
+    profile = script.analyze(ssc)
+    print(profile)
+    for frame in profile.overruns:
+        print(frame)
+"""
+
+import yaml
+
+from .motion import MotionModel
+from .ssc32 import Servo
+
+__all__ = [
+    'analyze',
+    'offline_controller',
+    'FrameProfile',
+    'ScriptProfile',
+    'POLL_PERIOD',
+]
+
+## Sleep between two movement-done polls in Movement.run()
+POLL_PERIOD = 0.01
+
+## "Q" + CR out, one status byte back
+_POLL_BYTES = 3
+
+
+def offline_controller(config, baudrate=None):
+    """
+    Controller with the servos and baud rate of a configuration file, on an emulated board
+
+    :param str config: Servo configuration file
+    :param int baudrate: (Optional) Default: the configuration's serial baud rate
+    :rtype: ssc32.emulator.EmulatedSSC32
+    """
+    from .emulator import EmulatedSSC32
+
+    if baudrate is None:
+        with open(config, 'r') as f:
+            baudrate = yaml.safe_load(f.read())['serial']['baud']
+    return EmulatedSSC32(baudrate=baudrate, config=config)
+
+
+def _commit_line(targets, time_ms):
+    line = ''.join('#{0}P{1}'.format(servo.num, pwm) +
+                   ('S{0}'.format(servo.speed) if servo.speed else '')
+                   for servo, pwm in targets)
+    if line != '' and time_ms is not None:
+        line += 'T{0}'.format(time_ms)
+    return line
+
+
+class FrameProfile(object):
+    """
+    Timing of one movement. Times are in seconds from the start of the script.
+    """
+
+    def __init__(self, index, line, start, wire_time, move_time, polls, poll_time, wait):
+        self.index = index
+        self.line = line
+        self.start = start
+        self.wire_time = wire_time
+        self.move_time = move_time
+        self.polls = polls
+        self.poll_time = poll_time
+        self.wait = wait
+
+    @property
+    def bytes(self):
+        """
+        Bytes of the commit line, CR included
+
+        :type: int
+        """
+        return len(self.line) + 1
+
+    @property
+    def poll_bytes(self):
+        """
+        Bytes of the movement-done polls, both ways
+
+        :type: int
+        """
+        return self.polls*_POLL_BYTES
+
+    @property
+    def duration(self):
+        """
+        Time until the next movement is sent
+
+        :type: float
+        """
+        return self.wire_time + max(self.move_time, self.poll_time) + self.wait
+
+    @property
+    def rate(self):
+        """
+        Average traffic over the movement in bytes per second
+
+        :type: float
+        """
+        if self.duration <= 0:
+            return 0.0
+        return (self.bytes + self.poll_bytes)/self.duration
+
+    @property
+    def overrun(self):
+        """
+        True if the commit line takes longer to send than the movement lasts
+        (its move time plus its wait), so the script runs late
+
+        :type: bool
+        """
+        return self.wire_time > self.move_time + self.wait
+
+    def __repr__(self):
+        return '<FrameProfile #{0} bytes={1} wire={2:.1f}ms move={3:.1f}ms polls={4}{5}>'.format(
+            self.index, self.bytes, self.wire_time*1000, self.move_time*1000, self.polls,
+            ' OVERRUN' if self.overrun else '')
+
+
+class ScriptProfile(object):
+    """
+    Result of analyze(): one FrameProfile per movement
+    """
+
+    def __init__(self, baudrate, frames):
+        self.baudrate = baudrate
+        self.frames = frames
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __iter__(self):
+        return iter(self.frames)
+
+    @property
+    def duration(self):
+        """
+        :type: float
+        """
+        return sum(f.duration for f in self.frames)
+
+    @property
+    def bytes(self):
+        """
+        Bytes of commit lines
+
+        :type: int
+        """
+        return sum(f.bytes for f in self.frames)
+
+    @property
+    def poll_bytes(self):
+        """
+        Bytes of movement-done polls
+
+        :type: int
+        """
+        return sum(f.poll_bytes for f in self.frames)
+
+    @property
+    def polls(self):
+        """
+        :type: int
+        """
+        return sum(f.polls for f in self.frames)
+
+    @property
+    def wire_time(self):
+        """
+        Time the link spends sending commit lines
+
+        :type: float
+        """
+        return sum(f.wire_time for f in self.frames)
+
+    @property
+    def link_rate(self):
+        """
+        Capacity of the link in bytes per second, None if unknown
+
+        :type: float or None
+        """
+        return self.baudrate/10.0 if self.baudrate else None
+
+    @property
+    def peak_rate(self):
+        """
+        Highest average traffic of a movement in bytes per second
+
+        :type: float
+        """
+        return max([f.rate for f in self.frames] or [0.0])
+
+    @property
+    def overruns(self):
+        """
+        :type: list(ssc32.analysis.FrameProfile)
+        """
+        return [f for f in self.frames if f.overrun]
+
+    def report(self):
+        """
+        Per-movement table, as printed by ``ssc32yaml --dry-run --profile``
+
+        :rtype: str
+        """
+        lines = ['{0:>5} {1:>9} {2:>6} {3:>9} {4:>9} {5:>6} {6:>9}'.format(
+            'move', 'start(s)', 'bytes', 'wire(ms)', 'move(ms)', 'polls', 'wait(ms)')]
+        for f in self.frames:
+            lines.append('{0:>5} {1:>9.3f} {2:>6} {3:>9.2f} {4:>9.1f} {5:>6} {6:>9.1f}{7}'.format(
+                f.index, f.start, f.bytes, f.wire_time*1000, f.move_time*1000, f.polls,
+                f.wait*1000, '  OVERRUN' if f.overrun else ''))
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return ('<ScriptProfile movements={0} duration={1:.3f}s bytes={2} poll_bytes={3} '
+                'peak_rate={4:.0f}B/s overruns={5}>').format(
+            len(self.frames), self.duration, self.bytes, self.poll_bytes, self.peak_rate,
+            len(self.overruns))
+
+
+def analyze(script, ssc, baudrate=None):
+    """
+    Time a script without playing it
+
+    :param script: Script to analyze
+    :type script: ssc32.Script
+    :param ssc: Controller whose servos resolve the joints, or a servo configuration file
+    :type ssc: ssc32.SSC32 or str
+    :param int baudrate: (Optional) Default: the controller's port baud rate. 0 ignores serial time.
+    :rtype: ssc32.analysis.ScriptProfile
+    """
+    if isinstance(ssc, str):
+        ssc = offline_controller(ssc, baudrate)
+    if baudrate is None:
+        baudrate = getattr(ssc.ser, 'baudrate', None) or 0
+    byte_time = 10.0/baudrate if baudrate else 0.0
+    poll_wire = _POLL_BYTES*byte_time
+
+    model = MotionModel(Servo.MAX_CHANNEL + 1)
+    now = 0.0
+    frames = []
+    for no, move in enumerate(script.iter_movements()):
+        time_ = move.time if move.time else script.time
+        time_ms = int(time_*1000)
+        targets = move.targets(ssc)
+        line = _commit_line(targets, time_ms)
+
+        wire = (len(line) + 1)*byte_time
+        moves = [(servo.num, pwm, servo.speed or None) for servo, pwm in targets]
+        move_time = model.move(moves, time_ms, now + wire) if moves else 0.0
+
+        ## Polls until one finds the move over, POLL_PERIOD apart
+        polls = 1
+        poll_time = poll_wire
+        while poll_time < move_time:
+            poll_time += POLL_PERIOD + poll_wire
+            polls += 1
+
+        frame = FrameProfile(no, line, now, wire, move_time, polls, poll_time, move.wait)
+        frames.append(frame)
+        now += frame.duration
+    return ScriptProfile(baudrate, frames)
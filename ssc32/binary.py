@@ -0,0 +1,407 @@
+# -*- coding: utf-8 -*-
+"""
+Compact binary script format.
+
+A compiled script is a header followed by fixed-width records:
+::
+
+    header   '<8sHHII'   magic, version, columns, records, offset of the first record
+    columns  '<BB' + name, per column: channel, length of the UTF-8 name
+    records  '<HII' + columns*'H', per movement: time (ms), wait (ms),
+             column mask, pulse widths (0 for columns the movement leaves alone)
+
+Angles are turned into pulse widths when compiling, with the servo
+configuration (and calibration) of the SSC32 given to compile_script().
+"""
+
+import mmap
+import yaml
+import struct
+import threading
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .script import Script, Movement, StreamingScript, ScriptError
+
+__all__ = [
+    'CompiledScript',
+    'BinaryScript',
+    'compile_script',
+    'yaml_to_binary',
+    'binary_to_yaml',
+]
+
+MAGIC = b'SSC32BIN'
+VERSION = 1
+
+_HEADER = struct.Struct('<8sHHII')
+_COLUMN = struct.Struct('<BB')
+_RECORD_HEAD = '<HII'
+
+
+def _record_struct(columns):
+    return struct.Struct(_RECORD_HEAD + 'H'*columns)
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("NumPy is required for array access to compiled scripts")
+
+
+class _Frames(object):
+    """
+    Playback and conversion shared by the in-memory and memory-mapped scripts.
+    Subclasses provide `channels`, `names`, __len__() and record().
+    """
+
+    def frames(self):
+        """
+        Iterate over the command lines of the script
+
+        :return: ``(record, line)`` per movement, see record()
+        :rtype: iterator of tuple
+        """
+        prefixes = ['#{0}P'.format(c) for c in self.channels]
+        columns = range(len(prefixes))
+        for i in range(len(self)):
+            record = self.record(i)
+            time_ms, _, mask, pwm = record
+            cmd = ''.join(prefixes[k] + str(pwm[k]) for k in columns if mask >> k & 1)
+            if time_ms and cmd != '':
+                cmd += 'T{0}'.format(time_ms)
+            yield record, cmd
+
+    def run(self, ssc):
+        """
+        Play the script like Script.run(): send each frame, wait for the
+        board to finish it, then wait the movement's wait time
+
+        :type ssc: ssc32.SSC32
+        """
+        self._stop.clear()
+        ## Columns hold servo numbers, not indexes
+        by_num = dict((s.num, s) for s in ssc._servos)
+        servos = [by_num[c] for c in self.channels]
+        count = len(self)
+        for no, (record, cmd) in enumerate(self.frames()):
+            if self._stop.is_set():
+                break
+            _, wait_ms, mask, pwm = record
+            if cmd != '':
+                ssc._send(cmd)
+                for k, servo in enumerate(servos):
+                    if mask >> k & 1:
+                        servo._pos = pwm[k]
+                        servo.is_changed = False
+                        servo.is_moving = True
+            while not ssc.is_done():
+                ssc.clock.sleep(0.01)
+            ssc.clock.sleep(wait_ms/1000.0)
+            self.on_movement_done((no+1, count), record)
+
+    def __call__(self, ssc):
+        self.run(ssc)
+
+    def stop(self):
+        """
+        Stop run() after the current movement. May be called from another thread.
+        """
+        self._stop.set()
+
+    def to_script(self):
+        """
+        Convert back to a Script. Joints are given as pulse widths.
+
+        :rtype: ssc32.Script
+        """
+        script = Script(time=0.0)
+        for i in range(len(self)):
+            time_ms, wait_ms, mask, pwm = self.record(i)
+            move = Movement(time=time_ms/1000.0, wait=wait_ms/1000.0)
+            move.joints = [(self.names[k], None, None, pwm[k])
+                           for k in range(len(self.names)) if mask >> k & 1]
+            script.movements.append(move)
+        return script
+
+
+class CompiledScript(_Frames):
+    """
+    Script held as flat arrays: two bytes per joint and ten per movement
+
+    Example:
+    ::
+
+        from ssc32.binary import compile_script
+
+        compiled = compile_script(yaml.load(fd, Loader=yaml.Loader), ssc)
+        compiled.save('present_joints.ssb')
+    """
+
+    def __init__(self, channels, names):
+        """
+        :param list channels: Servo number of each column
+        :param list names: Joint name of each column, as written in the script
+        """
+        if len(channels) > 32:
+            raise ScriptError('a compiled script holds at most 32 channels')
+        self.channels = array('B', channels)
+        self.names = list(names)
+        self.times = array('H')
+        self.waits = array('I')
+        self.masks = array('I')
+        self.pwm = array('H')
+        self.on_movement_done = lambda pn, record: None
+        self._stop = threading.Event()
+
+    def __len__(self):
+        return len(self.times)
+
+    def __repr__(self):
+        return '<CompiledScript movements={0} channels={1}>'.format(
+            len(self), list(self.channels))
+
+    def append(self, time_ms, wait_ms, mask, pwm):
+        """
+        Add a movement
+
+        :param int time_ms: Movement time in ms, 0 for none
+        :param int wait_ms: Wait after the movement in ms
+        :param int mask: Bit k set if column k moves
+        :param list pwm: Pulse width per column
+        """
+        self.times.append(time_ms)
+        self.waits.append(wait_ms)
+        self.masks.append(mask)
+        self.pwm.extend(pwm)
+
+    def record(self, i):
+        """
+        :param int i: Movement index
+        :return: ``(time in ms, wait in ms, mask, pulse widths)``
+        :rtype: tuple
+        """
+        n = len(self.channels)
+        return self.times[i], self.waits[i], self.masks[i], self.pwm[i*n:(i + 1)*n]
+
+    def arrays(self):
+        """
+        The movements as NumPy arrays sharing this script's memory
+
+        :return: ``(times in ms, waits in ms, masks, pulse widths)``, the last of shape ``(movements, columns)``
+        :rtype: tuple(numpy.ndarray)
+        """
+        _require_numpy()
+        pwm = np.frombuffer(self.pwm, dtype=np.uint16).reshape(len(self), len(self.channels))
+        return (np.frombuffer(self.times, dtype=np.uint16),
+                np.frombuffer(self.waits, dtype=np.uint32),
+                np.frombuffer(self.masks, dtype=np.uint32),
+                pwm)
+
+    def save(self, filename):
+        """
+        Write the binary file
+
+        :param str filename: Output file
+        """
+        head, offset = _pack_header(self.channels, self.names, len(self))
+        record = _record_struct(len(self.channels))
+        with open(filename, 'wb') as fd:
+            fd.write(head)
+            fd.write(b'\0'*(offset - len(head)))
+            for i in range(len(self)):
+                time_ms, wait_ms, mask, pwm = self.record(i)
+                fd.write(record.pack(time_ms, wait_ms, mask, *pwm))
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Read a binary file into memory
+
+        :param str filename: Binary script
+        :rtype: ssc32.binary.CompiledScript
+        """
+        with BinaryScript(filename) as src:
+            ret = cls(src.channels, src.names)
+            for i in range(len(src)):
+                ret.append(*src.record(i))
+        return ret
+
+
+class BinaryScript(_Frames):
+    """
+    Binary script file played straight from a memory map
+
+    Records are decoded one at a time while playing, so only the header is
+    kept in memory whatever the script length.
+
+    Example:
+    ::
+
+        from ssc32.binary import BinaryScript
+
+        with BinaryScript('present_joints.ssb') as script:
+            script.run(ssc)
+    """
+
+    def __init__(self, filename):
+        """
+        :param str filename: Binary script
+
+        :raise ScriptError: if the file is not a compiled script
+        """
+        self.filename = filename
+        self.on_movement_done = lambda pn, record: None
+        self._stop = threading.Event()
+        self._fd = open(filename, 'rb')
+        try:
+            self._map = mmap.mmap(self._fd.fileno(), 0, access=mmap.ACCESS_READ)
+            self.channels, self.names, self._count, self._offset = _unpack_header(self._map)
+        except (ValueError, struct.error) as e:
+            self._fd.close()
+            raise ScriptError('{0} is not a compiled script: {1}'.format(filename, e))
+        self._record = _record_struct(len(self.channels))
+        if self._offset + self._count*self._record.size > len(self._map):
+            self.close()
+            raise ScriptError('{0} is truncated'.format(filename))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def __repr__(self):
+        return '<BinaryScript {0!r} movements={1} channels={2}>'.format(
+            self.filename, self._count, list(self.channels))
+
+    def close(self):
+        """
+        Unmap and close the file
+        """
+        self._map.close()
+        self._fd.close()
+
+    def record(self, i):
+        """
+        :param int i: Movement index
+        :return: ``(time in ms, wait in ms, mask, pulse widths)``
+        :rtype: tuple
+        """
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        values = self._record.unpack_from(self._map, self._offset + i*self._record.size)
+        return values[0], values[1], values[2], values[3:]
+
+    def arrays(self):
+        """
+        The movements as NumPy arrays over the memory map, without reading
+        the file into memory. They must be released before close().
+
+        :return: ``(times in ms, waits in ms, masks, pulse widths)``, the last of shape ``(movements, columns)``
+        :rtype: tuple(numpy.ndarray)
+        """
+        _require_numpy()
+        dtype = np.dtype([('time', '<u2'), ('wait', '<u4'), ('mask', '<u4'),
+                          ('pwm', '<u2', (len(self.channels),))])
+        records = np.frombuffer(self._map, dtype=dtype, count=self._count, offset=self._offset)
+        return records['time'], records['wait'], records['mask'], records['pwm']
+
+
+def _pack_header(channels, names, count):
+    columns = b''
+    for channel, name in zip(channels, names):
+        raw = str(name).encode('utf-8')
+        columns += _COLUMN.pack(channel, len(raw)) + raw
+    size = _HEADER.size + len(columns)
+    offset = (size + 3) & ~3
+    return _HEADER.pack(MAGIC, VERSION, len(channels), count, offset) + columns, offset
+
+
+def _unpack_header(buf):
+    magic, version, columns, count, offset = _HEADER.unpack_from(buf, 0)
+    if magic != MAGIC:
+        raise ValueError('bad magic {0!r}'.format(magic))
+    if version != VERSION:
+        raise ValueError('unsupported version {0}'.format(version))
+
+    channels = []
+    names = []
+    pos = _HEADER.size
+    for _ in range(columns):
+        channel, length = _COLUMN.unpack_from(buf, pos)
+        pos += _COLUMN.size
+        channels.append(channel)
+        names.append(bytes(buf[pos:pos + length]).decode('utf-8'))
+        pos += length
+    return array('B', channels), names, count, offset
+
+
+def compile_script(script, ssc):
+    """
+    Compile a script for the servo configuration of `ssc`
+
+    :param script: Script to compile. Loops are unrolled, one record per movement played.
+    :type script: ssc32.Script
+    :param ssc: Controller whose servo names, limits and calibrations are used
+    :type ssc: ssc32.SSC32
+    :rtype: ssc32.binary.CompiledScript
+    :raise KeyError: if a joint name is not configured
+    """
+    columns = {}
+    for move in script.iter_templates():
+        for joint, _, _, _ in move.joints:
+            servo = ssc[joint]
+            columns.setdefault(servo.num, joint)
+
+    channels = sorted(columns)
+    index = dict((c, k) for k, c in enumerate(channels))
+    ret = CompiledScript(channels, [columns[c] for c in channels])
+
+    for move in script.iter_movements():
+        time_s = move.time if move.time else script.time
+        time_ms = int(time_s*1000) if time_s else 0
+        if time_ms > 0xFFFF:
+            raise ScriptError('movement time {0}s is longer than the board allows'.format(time_s))
+
+        mask = 0
+        pwm = [0]*len(channels)
+        for servo, value in move.targets(ssc):
+            k = index[servo.num]
+            mask |= 1 << k
+            pwm[k] = value
+        ret.append(time_ms, int(round(move.wait*1000)), mask, pwm)
+    return ret
+
+
+def yaml_to_binary(source, target, ssc):
+    """
+    Compile a ``!Script`` YAML file into a binary file, streaming the input
+
+    :param str source: YAML script
+    :param str target: Output file
+    :type ssc: ssc32.SSC32
+    :rtype: ssc32.binary.CompiledScript
+    """
+    compiled = compile_script(StreamingScript(source), ssc)
+    compiled.save(target)
+    return compiled
+
+
+def binary_to_yaml(source, target):
+    """
+    Write a binary script back as a ``!Script`` YAML file, with pulse widths
+
+    :param str source: Binary script
+    :param str target: Output file
+    """
+    with BinaryScript(source) as script:
+        data = yaml.dump(script.to_script())
+    with open(target, 'w') as fd:
+        fd.write(data)
@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+"""
+TCP bridge sharing one SSC32 between several processes.
+
+Clients speak the SSC32 serial protocol over TCP, so RemoteSSC32 is an SSC32
+whose port is a socket. The server adds two things on top of forwarding:
+
+- Motion lines (``#<ch>P<pw>S<spd>... T<time>``) from every client are
+  collected for one frame period and sent as a single write, one line per
+  distinct ``T``. A later target for a channel replaces an earlier one.
+- A connection that sends ``!SUBSCRIBE`` receives telemetry instead: one JSON
+  line per poll, ``{"time", "pulse", "analog"}``, from a single poll loop.
+
+Queries and other commands are forwarded as they arrive, after the pending
+frame so each client sees its own commands in order.
+"""
+
+import re
+import json
+import time
+import select
+import socket
+import threading
+import socketserver
+
+from .ssc32 import SSC32
+from .protocol import Request, reply_length, PORT_ERRORS
+from .transport import Transport
+from .scheduler import PRIORITY_STOP
+
+__all__ = [
+    'BridgeServer',
+    'RemoteSSC32',
+    'SocketPort',
+    'Subscription',
+    'DEFAULT_PORT',
+]
+
+DEFAULT_PORT = 9032
+
+_MOTION = re.compile(r'^\s*(?:#\d+\s*(?:[PS]\s*\d+\s*)+)+(?:T\s*\d+)?\s*$', re.I)
+_MOTION_TOKEN = re.compile(r'#(\d+)\s*((?:[PS]\s*\d+\s*)+)', re.I)
+_TIME = re.compile(r'T\s*(\d+)\s*$', re.I)
+
+
+def _raw(view):
+    return view.tobytes()
+
+
+class _Handler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        bridge = self.server.bridge
+        buf = b''
+        while True:
+            data = self.request.recv(4096)
+            if not data:
+                return
+            buf += data.replace(b'\n', b'\r')
+            lines = buf.split(b'\r')
+            buf = lines.pop()
+            for line in lines:
+                line = line.decode('ascii', 'replace').strip()
+                if not line:
+                    continue
+                if line.upper() == '!SUBSCRIBE':
+                    bridge._subscribe(self.request)
+                    return
+                reply = bridge.command(line)
+                if reply:
+                    self.request.sendall(reply)
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class BridgeServer(object):
+    """
+    Serves one SSC32 to many TCP clients
+
+    Example:
+    ::
+
+        from ssc32.bridge import BridgeServer
+
+        ssc = ssc32.SSC32('/dev/ttyUSB0', 115200)
+        BridgeServer(ssc, ('localhost', 9032)).serve_forever()
+
+    A failed telemetry poll does not stop the thread: `error_count` counts
+    them and `last_error` holds the latest.
+    """
+
+    def __init__(self, ssc, address=('localhost', DEFAULT_PORT), frame_period=0.02,
+                 telemetry_period=0.05, channels=None, inputs='ABCD'):
+        """
+        :type ssc: ssc32.SSC32
+        :param tuple address: (Optional) ``(host, port)`` to listen on. Port 0 picks a free one.
+        :param float frame_period: (Optional) Time motion commands are collected, in seconds
+        :param float telemetry_period: (Optional) Telemetry poll period in seconds
+        :param list channels: (Optional) Servos reported in telemetry. Default: all
+        :param str inputs: (Optional) Analog inputs reported in telemetry
+        """
+        self.ssc = ssc
+        self.frame_period = frame_period
+        self.telemetry_period = telemetry_period
+        if channels is None:
+            channels = range(len(ssc))
+        self.channels = [ssc[c].num for c in channels]
+        self.inputs = inputs
+        self.error_count = 0
+        self.last_error = None
+
+        self._lock = threading.Lock()
+        self._frame = {}       # channel -> ("P..S..", T or None)
+        self._subscribers = []
+        self._stop = threading.Event()
+        self._threads = []
+
+        self._server = _Server(address, _Handler, bind_and_activate=True)
+        self._server.bridge = self
+        self.address = self._server.server_address
+
+        ssc.start_scheduler()
+
+    ##########
+    ## COMMANDS
+    ##########
+    def command(self, line):
+        """
+        Handle one command line from a client
+
+        :param str line: Command line without CR
+        :return: Reply bytes for queries, else None
+        :rtype: bytes or None
+        """
+        if _MOTION.match(line):
+            m = _TIME.search(line)
+            key = int(m.group(1)) if m else None
+            with self._lock:
+                for ch, args in _MOTION_TOKEN.findall(line):
+                    self._frame[int(ch)] = (re.sub(r'\s+', '', args).upper(), key)
+            return None
+
+        self.flush()
+        if line.upper().startswith('STOP'):
+            self.ssc._send(line, PRIORITY_STOP)
+            return None
+
+        length = reply_length(line)
+        if length == 0:
+            self.ssc._send(line)
+            return None
+
+        reply = self.ssc._request(Request(line, _raw, length))
+        if length is None:
+            reply += b'\r'
+        return reply
+
+    def flush(self):
+        """
+        Send the collected motion commands now, as one write
+        """
+        with self._lock:
+            frame, self._frame = self._frame, {}
+        if not frame:
+            return
+
+        ## One line per T, holding the channels whose latest target uses it
+        groups = {}
+        for ch, (args, key) in sorted(frame.items()):
+            groups.setdefault(key, []).append('#{0}{1}'.format(ch, args))
+        lines = []
+        for key, moves in groups.items():
+            line = ''.join(moves)
+            if key is not None:
+                line += 'T{0}'.format(key)
+            lines.append(line)
+        self.ssc._send('\r'.join(lines))
+
+    ##########
+    ## TELEMETRY
+    ##########
+    def _subscribe(self, sock):
+        done = threading.Event()
+        with self._lock:
+            self._subscribers.append((sock, done))
+        ## Keep the handler thread, and so the connection, until the client leaves
+        done.wait()
+
+    def poll(self):
+        """
+        Read the telemetry once, in one query
+
+        :rtype: dict
+        """
+        requests = [Request.pulse_width(self.channels)]
+        if self.inputs:
+            requests.append(Request.analog(self.inputs))
+        replies = self.ssc._requests(requests)
+        return {
+            'time': time.time(),
+            'channels': self.channels,
+            'pulse': replies[0],
+            'analog': replies[1] if self.inputs else [],
+        }
+
+    def _publish(self, sample):
+        data = json.dumps(sample).encode('utf-8') + b'\n'
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sock, done in subscribers:
+            try:
+                sock.sendall(data)
+            except (OSError, socket.error):
+                with self._lock:
+                    self._subscribers.remove((sock, done))
+                done.set()
+
+    ##########
+    ## LOOPS
+    ##########
+    def _frame_loop(self):
+        while not self._stop.wait(self.frame_period):
+            self.flush()
+
+    def _telemetry_loop(self):
+        while not self._stop.wait(self.telemetry_period):
+            with self._lock:
+                idle = not self._subscribers
+            if idle:
+                continue
+            try:
+                sample = self.poll()
+            except PORT_ERRORS as e:
+                self.last_error = e
+                self.error_count += 1
+                continue
+            self._publish(sample)
+
+    def start(self):
+        """
+        Serve on background threads
+        """
+        self._stop.clear()
+        for target in (self._frame_loop, self._telemetry_loop, self._server.serve_forever):
+            thread = threading.Thread(target=target, name='ssc32-bridge')
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def serve_forever(self):
+        """
+        Serve until shutdown() is called from another thread
+        """
+        self.start()
+        self._stop.wait()
+
+    def shutdown(self):
+        """
+        Stop serving and disconnect the subscribers
+        """
+        self._stop.set()
+        self._server.shutdown()
+        self._server.server_close()
+        with self._lock:
+            subscribers, self._subscribers = self._subscribers, []
+        for sock, done in subscribers:
+            done.set()
+        self.flush()
+
+
+class SocketPort(Transport):
+    """
+    Transport over a TCP connection to a BridgeServer
+    """
+
+    def __init__(self, address, timeout=1):
+        """
+        :param tuple address: ``(host, port)``
+        :param float timeout: Reply timeout in seconds
+        """
+        self.address = address
+        self.port = '{0}:{1}'.format(*address)
+        self.baudrate = None
+        self.timeout = timeout
+        self.inter_byte_timeout = 0.05
+        self.sock = socket.create_connection(address, timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def write(self, data):
+        self.sock.sendall(data)
+        return len(data)
+
+    def read_into(self, b):
+        """
+        Same timing as SSC32Serial.readinto: `timeout` for the first byte,
+        `inter_byte_timeout` for the rest
+        """
+        view = memoryview(b)
+        got = 0
+        wait = self.timeout
+        while got < len(view):
+            ready, _, _ = select.select([self.sock], [], [], wait)
+            if not ready:
+                break
+            n = self.sock.recv_into(view[got:])
+            if n == 0:
+                break
+            got += n
+            wait = self.inter_byte_timeout
+        return got
+
+    def reset_input(self):
+        while select.select([self.sock], [], [], 0)[0]:
+            if not self.sock.recv(4096):
+                break
+
+    def close(self):
+        self.sock.close()
+
+
+class RemoteSSC32(SSC32):
+    """
+    SSC32 reached through a BridgeServer, with the same API
+
+    Example:
+    ::
+
+        from ssc32.bridge import RemoteSSC32
+
+        ssc = RemoteSSC32(('localhost', 9032), config='arm.cfg')
+        ssc['grip'].position = 2000
+        ssc.commit(500)
+
+        sub = ssc.subscribe(lambda sample: print(sample['pulse']))
+    """
+
+    def __init__(self, address=('localhost', DEFAULT_PORT), count=32, timeout=1, config=None,
+                 autocommit=None):
+        """
+        :param tuple address: (Optional) Bridge ``(host, port)``
+        :param str config: (Optional) Configuration file for the servo names and limits. Its serial settings are ignored.
+        """
+        self.address = tuple(address)
+        super(RemoteSSC32, self).__init__(self.address, None, count, timeout, config, autocommit,
+                                          transport=SocketPort(self.address, timeout))
+
+    def subscribe(self, callback):
+        """
+        Receive the bridge's telemetry on a second connection
+
+        :param func callback: Called on a reader thread with each sample dict
+        :return: The subscription, call its close() to stop
+        :rtype: ssc32.bridge.Subscription
+        """
+        return Subscription(self.address, callback)
+
+
+class Subscription(object):
+    """
+    Telemetry connection to a BridgeServer
+    """
+
+    def __init__(self, address, callback):
+        self.callback = callback
+        self.sock = socket.create_connection(address)
+        self.sock.sendall(b'!SUBSCRIBE\r')
+        self._thread = threading.Thread(target=self._run, name='ssc32-subscription')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        fd = self.sock.makefile('rb')
+        try:
+            for line in fd:
+                self.callback(json.loads(line.decode('utf-8')))
+        except (OSError, ValueError):
+            pass
+
+    def close(self):
+        """
+        Disconnect and wait for the reader thread
+        """
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self._thread.join()
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Lookup-table servo calibration.
+
+Fitting needs NumPy, lookups do not.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+__all__ = [
+    'Calibration',
+    'CalibrationError',
+    'fit_calibrations',
+]
+
+
+class CalibrationError(Exception):
+    pass
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("NumPy is required to fit or vectorize calibrations")
+
+
+def _polyval(coefficients, x):
+    ret = 0.0
+    for c in reversed(coefficients):
+        ret = ret*x + c
+    return ret
+
+
+class Calibration(object):
+    """
+    Correction for a non linear servo
+
+    Maps the angle a joint should reach to the angle that has to be commanded
+    (through ``pwm_center + deg*pwm_per_degree``) to reach it. The mapping is a
+    polynomial fitted to measurements, compiled into a dense table so a lookup
+    is an index plus a linear interpolation.
+
+    Example:
+    ::
+
+        from ssc32.calibration import Calibration
+
+        commanded = [-90, -45, 0, 45, 90]
+        measured = [-81.0, -42.5, 1.0, 44.0, 84.5]
+        ssc['joint1'].calibration = Calibration.fit(commanded, measured)
+        ssc['joint1'].degrees = 30       # reaches 30°, not the commanded value
+        ssc.save_config()                # stored with the servo
+    """
+
+    def __init__(self, coefficients, domain, resolution=0.1, rms=None):
+        """
+        :param list coefficients: Polynomial from measured to commanded angle, lowest order first
+        :param tuple domain: ``(min, max)`` measured angles covered by the table
+        :param float resolution: (Optional) Table step in degrees
+        :param float rms: (Optional) Residual of the fit in degrees
+
+        :raise CalibrationError: if the domain is empty
+        """
+        lo, hi = float(min(domain)), float(max(domain))
+        if hi <= lo or resolution <= 0:
+            raise CalibrationError("Calibration domain must not be empty")
+
+        self.coefficients = [float(c) for c in coefficients]
+        self.domain = (lo, hi)
+        self.resolution = float(resolution)
+        self.rms = rms
+        self._compile()
+
+    def __repr__(self):
+        return '<Calibration domain={0[0]}°...{0[1]}° rms={1}>'.format(self.domain, self.rms)
+
+    @classmethod
+    def fit(cls, commanded, measured, degree=3, resolution=0.1):
+        """
+        Least squares fit from (commanded, measured) angle samples
+
+        :param commanded: Commanded angles in degrees
+        :param measured: Angles reached, in degrees
+        :param int degree: (Optional) Polynomial degree
+        :param float resolution: (Optional) Table step in degrees
+        :rtype: ssc32.calibration.Calibration
+        """
+        _require_numpy()
+        commanded = np.asarray(commanded, dtype=float)
+        measured = np.asarray(measured, dtype=float)
+        coefficients, rms = _fit(commanded[:, None], measured[:, None], degree)
+        return cls(coefficients[:, 0], (measured.min(), measured.max()),
+                   resolution, float(rms[0]))
+
+    def _compile(self):
+        lo, hi = self.domain
+        size = int(round((hi - lo)/self.resolution)) + 1
+        self._step = (hi - lo)/(size - 1)
+        self._inv_step = 1.0/self._step
+        grid = [lo + i*self._step for i in range(size)]
+        self._lut = [_polyval(self.coefficients, x) for x in grid]
+
+        ## Inverse table, from commanded angle back to the angle reached.
+        ## Assumes the servo is monotonic over the domain.
+        pairs = sorted(zip(self._lut, grid))
+        self._inv_domain = (pairs[0][0], pairs[-1][0])
+        span = self._inv_domain[1] - self._inv_domain[0]
+        self._inv_step_size = span/(size - 1) if span > 0 else 1.0
+        self._inv_lut = []
+        j = 0
+        for i in range(size):
+            x = self._inv_domain[0] + i*self._inv_step_size
+            while j < size - 2 and pairs[j + 1][0] < x:
+                j += 1
+            (x0, y0), (x1, y1) = pairs[j], pairs[j + 1]
+            f = 0.0 if x1 == x0 else min(max((x - x0)/(x1 - x0), 0.0), 1.0)
+            self._inv_lut.append(y0 + (y1 - y0)*f)
+
+        if np is not None:
+            self._lut_array = np.array(self._lut)
+
+    @staticmethod
+    def _lookup(lut, lo, inv_step, x):
+        x = (x - lo)*inv_step
+        last = len(lut) - 1
+        if x <= 0:
+            return lut[0]
+        if x >= last:
+            return lut[last]
+        i = int(x)
+        a = lut[i]
+        return a + (lut[i + 1] - a)*(x - i)
+
+    def commanded(self, degrees):
+        """
+        Angle to command so the joint reaches `degrees`. Clamped to the domain.
+
+        :param float degrees: Wanted angle
+        :rtype: float
+        """
+        return self._lookup(self._lut, self.domain[0], self._inv_step, degrees)
+
+    def measured(self, commanded):
+        """
+        Angle reached when commanding `commanded`, the inverse of commanded()
+
+        :param float commanded: Commanded angle
+        :rtype: float
+        """
+        return self._lookup(self._inv_lut, self._inv_domain[0], 1.0/self._inv_step_size, commanded)
+
+    def commanded_array(self, degrees):
+        """
+        Vectorized commanded()
+
+        :param degrees: Wanted angles
+        :type degrees: array_like
+        :rtype: numpy.ndarray
+        """
+        _require_numpy()
+        lut = self._lut_array
+        x = np.clip((np.asarray(degrees, dtype=float) - self.domain[0])*self._inv_step,
+                    0, len(lut) - 1)
+        i = np.minimum(x.astype(np.intp), len(lut) - 2)
+        return lut[i] + (lut[i + 1] - lut[i])*(x - i)
+
+    def to_dict(self):
+        """
+        Plain representation stored in the servo config
+
+        :rtype: dict
+        """
+        return {
+            'coefficients': list(self.coefficients),
+            'domain': list(self.domain),
+            'resolution': self.resolution,
+            'rms': self.rms,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        :param dict data: As returned by to_dict()
+        :rtype: ssc32.calibration.Calibration
+        """
+        return cls(data['coefficients'], data['domain'],
+                   data.get('resolution', 0.1), data.get('rms'))
+
+
+def _fit(commanded, measured, degree):
+    """
+    Fit one polynomial per column in a single batched least squares solve
+
+    :return: ``(coefficients (degree+1, K), rms (K,))``
+    """
+    n, k = measured.shape
+    if n <= degree:
+        raise CalibrationError("Need more than {0} samples for a degree {0} fit".format(degree))
+
+    ## Vandermonde matrices for every column: (K, N, degree+1)
+    vander = measured.T[:, :, None]**np.arange(degree + 1)
+    vt = vander.transpose(0, 2, 1)
+    coefficients = np.linalg.solve(np.matmul(vt, vander),
+                                   np.matmul(vt, commanded.T[:, :, None]))[:, :, 0]
+
+    residual = np.matmul(vander, coefficients[:, :, None])[:, :, 0] - commanded.T
+    rms = np.sqrt((residual**2).mean(axis=1))
+    return coefficients.T, rms
+
+
+def fit_calibrations(servos, commanded, measured, degree=3, resolution=0.1):
+    """
+    Fit and assign calibrations for several servos at once
+
+    :param list servos: Instances of ssc32.Servo, one per column
+    :param commanded: Commanded angles, shape ``(N, len(servos))``
+    :param measured: Angles reached, shape ``(N, len(servos))``
+    :param int degree: (Optional) Polynomial degree
+    :param float resolution: (Optional) Table step in degrees
+    :return: The new calibrations
+    :rtype: list(ssc32.calibration.Calibration)
+    """
+    _require_numpy()
+    commanded = np.asarray(commanded, dtype=float)
+    measured = np.asarray(measured, dtype=float)
+    coefficients, rms = _fit(commanded, measured, degree)
+
+    ret = []
+    for k, servo in enumerate(servos):
+        cal = Calibration(coefficients[:, k], (measured[:, k].min(), measured[:, k].max()),
+                          resolution, float(rms[k]))
+        servo.calibration = cal
+        ret.append(cal)
+    return ret
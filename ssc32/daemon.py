@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+Long running script server keeping the board connection open.
+
+Requests and replies are single lines of JSON on a Unix domain socket:
+::
+
+    {"cmd": "run", "script": "/path/to/script.yaml", "wait": false}
+    {"cmd": "stop"}
+    {"cmd": "status"}
+    {"cmd": "pose"}
+
+Every reply is ``{"ok": true, "result": ...}`` or ``{"ok": false, "error": "..."}``.
+"""
+
+import os
+import json
+import time
+import yaml
+import threading
+import socketserver
+
+from .protocol import Request
+from .binary import CompiledScript
+from .script import ScriptLoader
+
+__all__ = [
+    'ScriptDaemon',
+    'DaemonError',
+]
+
+
+class DaemonError(Exception):
+    pass
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line.decode('utf-8'))
+                reply = {'ok': True, 'result': self.server.daemon.handle(request)}
+            except Exception as e:
+                reply = {'ok': False, 'error': '{0}: {1}'.format(type(e).__name__, e)}
+            self.wfile.write(json.dumps(reply).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class ScriptDaemon(object):
+    """
+    Serves run, stop, status and pose requests for one board
+
+    Scripts are parsed once and kept until their file changes. One script
+    runs at a time, on a background thread; the board is shared with the
+    request threads through the SSC32 command scheduler.
+
+    Clients name the script files, so YAML files are parsed with
+    ssc32.ScriptLoader, and `directory` limits where they can be read from.
+
+    Example:
+    ::
+
+        from ssc32.daemon import ScriptDaemon
+
+        ssc = ssc32.SSC32(config='arm.cfg')
+        ScriptDaemon(ssc, '/tmp/ssc32.sock').serve_forever()
+    """
+
+    def __init__(self, ssc, path, directory=None):
+        """
+        :type ssc: ssc32.SSC32
+        :param str path: Unix socket path. A stale socket file is replaced.
+        :param str directory: (Optional) Only run scripts from this directory or below. Default: any
+        """
+        self.ssc = ssc
+        self.path = path
+        self.directory = os.path.realpath(directory) if directory is not None else None
+        self.started = time.time()
+        self._scripts = {}
+        self._lock = threading.Lock()
+        self._job = None
+        self._last = None
+        self._server = None
+
+        ssc.start_scheduler()
+
+    ##########
+    ## COMMANDS
+    ##########
+    def handle(self, request):
+        """
+        Dispatch one decoded request
+
+        :param dict request: Request with a ``cmd`` entry
+        :return: The command's result
+        :raise DaemonError: if the command is unknown
+        """
+        cmd = request.get('cmd')
+        if cmd == 'run':
+            return self.run(request['script'], request.get('wait', False))
+        elif cmd == 'stop':
+            return self.stop()
+        elif cmd == 'status':
+            return self.status()
+        elif cmd == 'pose':
+            return self.pose()
+        raise DaemonError('unknown command {0!r}'.format(cmd))
+
+    def load(self, filename):
+        """
+        Parsed script for a file, reusing the cached one if the file did not change
+
+        :param str filename: YAML script, or compiled ``.ssb`` script
+        :rtype: ssc32.Script or ssc32.binary.CompiledScript
+        :raise DaemonError: if the file is outside `directory`
+        """
+        if self.directory is not None:
+            real = os.path.realpath(filename)
+            if os.path.commonpath([self.directory, real]) != self.directory:
+                raise DaemonError('{0} is outside {1}'.format(filename, self.directory))
+        mtime = os.stat(filename).st_mtime
+        with self._lock:
+            cached = self._scripts.get(filename)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        if filename.endswith('.ssb'):
+            script = CompiledScript.load(filename)
+        else:
+            with open(filename, 'r') as fd:
+                script = yaml.load(fd, Loader=ScriptLoader)
+        with self._lock:
+            self._scripts[filename] = (mtime, script)
+        return script
+
+    def run(self, filename, wait=False):
+        """
+        Start a script
+
+        :param str filename: Script file
+        :param bool wait: (Optional) Return only once the script has finished
+        :return: Status after starting (or finishing) the script
+        :rtype: dict
+        :raise DaemonError: if a script is already running
+        """
+        filename = os.path.abspath(filename)
+        script = self.load(filename)
+
+        with self._lock:
+            if self._job is not None:
+                raise DaemonError('{0} is still running'.format(self._job['script']))
+            job = {'script': filename, 'started': time.time(), 'movement': None,
+                   'stopped': False, 'error': None}
+            thread = threading.Thread(target=self._play, args=(script, job),
+                                      name='ssc32-daemon-job')
+            thread.daemon = True
+            job['thread'] = thread
+            job['player'] = script
+            self._job = job
+        thread.start()
+
+        if wait:
+            thread.join()
+        return self.status()
+
+    def _play(self, script, job):
+        ## status() reads the job from request threads, under the lock
+        def progress(pn, movement):
+            with self._lock:
+                job['movement'] = list(pn)
+        script.on_movement_done = progress
+        try:
+            script.run(self.ssc)
+        except Exception as e:
+            with self._lock:
+                job['error'] = '{0}: {1}'.format(type(e).__name__, e)
+        finally:
+            with self._lock:
+                job['finished'] = time.time()
+                self._job = None
+                self._last = job
+
+    def stop(self):
+        """
+        Stop the running script and halt every servo where it is
+
+        :return: Status afterwards
+        :rtype: dict
+        """
+        with self._lock:
+            job = self._job
+            if job is not None:
+                job['stopped'] = True
+        if job is not None:
+            job['player'].stop()
+        self.ssc.emergency_stop()
+        if job is not None:
+            job['thread'].join()
+        return self.status()
+
+    def status(self):
+        """
+        :return: Daemon state, running script and the last finished one
+        :rtype: dict
+        """
+        with self._lock:
+            state = 'idle' if self._job is None else 'running'
+            job, last = _job_info(self._job), _job_info(self._last)
+            cached = sorted(self._scripts)
+        return {
+            'state': state,
+            'job': job,
+            'last': last,
+            'port': self.ssc.ser.port,
+            'uptime': time.time() - self.started,
+            'cached': cached,
+        }
+
+    def pose(self):
+        """
+        Target and measured pulse width of every named servo, measured in one query
+
+        :return: Per servo name: ``{"target", "pulse", "degrees"}``
+        :rtype: dict
+        """
+        servos = [s for s in self.ssc._servos if s.name is not None]
+        if not servos:
+            return {}
+        pulses = self.ssc._request(Request.pulse_width([s.num for s in servos]))
+        ret = {}
+        for servo, pulse in zip(servos, pulses):
+            ret[servo.name] = {
+                'target': servo.position,
+                'pulse': pulse,
+                'degrees': servo.degrees_from_pwm(pulse),
+            }
+        return ret
+
+    ##########
+    ## SERVER
+    ##########
+    def serve_forever(self):
+        """
+        Listen on the socket until shutdown() is called
+        """
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = _Server(self.path, _Handler)
+        self._server.daemon = self
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def shutdown(self):
+        """
+        Stop serve_forever(), from another thread
+        """
+        if self._server is not None:
+            self._server.shutdown()
+
+
+def _job_info(job):
+    if job is None:
+        return None
+    return dict((k, v) for k, v in job.items() if k not in ('thread', 'player'))
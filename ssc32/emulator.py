@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+In-memory SSC32 board for testing without hardware
+"""
+
+import re
+import time
+
+from .ssc32 import SSC32
+from .motion import MotionModel
+from .transport import Transport
+
+__all__ = [
+    'BoardEmulator',
+    'EmulatedPort',
+    'EmulatedSSC32',
+]
+
+_TOKEN = re.compile(r'''
+      \#(?P<ch>\d+)\s*(?:
+            :(?P<byte>\d+)
+          | (?P<level>[HL])
+          | (?P<move>(?:[PS]\s*-?\d+\s*)+))
+    | T\s*(?P<time>\d+)
+    | STOP\s*(?P<stop>\d+)
+    | (?P<ver>VER)
+    | QP\s*(?P<qp>\d+)
+    | (?P<q>Q)
+    | V(?P<analog>[A-H])
+    | (?P<digital>[A-H])(?P<latched>L?)
+    | \s+
+''', re.VERBOSE)
+
+_MOVE = re.compile(r'([PS])\s*(-?\d+)')
+
+
+def _move(ch, args):
+    pulse = speed = None
+    for kind, value in _MOVE.findall(args):
+        if kind == 'P':
+            pulse = int(value)
+        else:
+            speed = int(value)
+    return ch, pulse, speed
+
+
+class BoardEmulator(object):
+    """
+    Command interpreter answering like an SSC32
+
+    Servos follow ssc32.motion.MotionModel on `clock`. Input levels and
+    voltages are plain lists the test can set; digital inputs latch low
+    levels like the board.
+    """
+    VERSION = 'SSC32-V2.50USB'
+
+    def __init__(self, channels=32, clock=None, record=False):
+        """
+        :param int channels: (Optional) Number of servo channels
+        :param clock: (Optional) Object with ``time()``. Default: the time module
+        :param bool record: (Optional) Keep every trajectory, see MotionModel.history
+        """
+        self.clock = clock if clock is not None else time
+        self.motion = MotionModel(channels, record)
+        self.outputs = [None]*channels
+        self.analog = [0]*8
+        self.digital = [True]*8
+        self._latched = [True]*8
+        self.log = []
+
+    @property
+    def pulse(self):
+        """
+        Current pulse width of every channel
+
+        :type: list(int)
+        """
+        return self.motion.positions(self.clock.time())
+
+    def set_digital(self, index, level):
+        """
+        Set a digital input level. Low levels are latched until read with "AL".
+
+        :param int index: Input index, 0 for "A"
+        :param bool level: New level
+        """
+        self.digital[index] = bool(level)
+        if not level:
+            self._latched[index] = False
+
+    def execute(self, line):
+        """
+        Run one command line
+
+        :param str line: Command line without CR
+        :return: Reply bytes
+        :rtype: bytes
+        """
+        self.log.append(line)
+        now = self.clock.time()
+        reply = bytearray()
+        moves = []
+        group_time = None
+        pos = 0
+        line = line.upper()
+        while pos < len(line):
+            m = _TOKEN.match(line, pos)
+            if m is None:
+                ## The board ignores what it does not understand up to the end of the line
+                break
+            pos = m.end()
+
+            if m.group('move') is not None:
+                moves.append(_move(int(m.group('ch')), m.group('move')))
+            elif m.group('time') is not None:
+                group_time = int(m.group('time'))
+            elif m.group('level') is not None:
+                self.outputs[int(m.group('ch'))] = m.group('level') == 'H'
+            elif m.group('byte') is not None:
+                bank, value = int(m.group('ch')), int(m.group('byte'))
+                for bit in range(8):
+                    self.outputs[8*bank + bit] = bool(value >> bit & 1)
+            elif m.group('stop') is not None:
+                self.motion.stop(int(m.group('stop')), now)
+            elif m.group('ver') is not None:
+                reply += self.VERSION.encode() + b'\r'
+            elif m.group('qp') is not None:
+                reply.append(min(self.motion.position(int(m.group('qp')), now)//10, 255))
+            elif m.group('q') is not None:
+                reply += b'+' if self.motion.is_moving(now) else b'.'
+            elif m.group('analog') is not None:
+                reply.append(self.analog[ord(m.group('analog')) - ord('A')])
+            elif m.group('digital') is not None:
+                i = ord(m.group('digital')) - ord('A')
+                if m.group('latched'):
+                    level = self._latched[i]
+                    self._latched[i] = self.digital[i]
+                else:
+                    level = self.digital[i]
+                reply += b'1' if level else b'0'
+
+        moves = [move for move in moves if move[1] is not None]
+        if moves:
+            self.motion.move(moves, group_time, now)
+        return bytes(reply)
+
+
+class EmulatedPort(Transport):
+    """
+    Transport connected to a BoardEmulator
+    """
+
+    def __init__(self, board=None, port='emulator', baudrate=115200, timeout=1):
+        """
+        :param board: (Optional) Board to talk to. Default: a new BoardEmulator
+        :type board: ssc32.emulator.BoardEmulator
+        """
+        self.board = board if board is not None else BoardEmulator()
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self._input = bytearray()
+        self._output = bytearray()
+
+    def write(self, data):
+        self._input += memoryview(data).cast('B')
+        while True:
+            end = self._input.find(b'\r')
+            if end < 0:
+                break
+            line = bytes(self._input[:end]).decode('ascii', 'replace')
+            del self._input[:end + 1]
+            if line.strip():
+                self._output += self.board.execute(line)
+        return len(data)
+
+    def read_into(self, b):
+        n = min(len(b), len(self._output))
+        b[:n] = self._output[:n]
+        del self._output[:n]
+        return n
+
+    def read_line(self, size=500):
+        end = self._output.find(b'\r')
+        if end < 0:
+            end = min(len(self._output), size)
+        val = bytes(self._output[:end])
+        del self._output[:end + 1]
+        return val.decode()
+
+    def reset_input(self):
+        del self._output[:]
+
+
+class EmulatedSSC32(SSC32):
+    """
+    SSC32 driving a BoardEmulator instead of a serial port
+
+    Example:
+    ::
+
+        from ssc32.emulator import EmulatedSSC32
+
+        ssc = EmulatedSSC32(config='examples/arm.cfg')
+        ssc['grip'].position = 2000
+        ssc.commit(500)
+        print(ssc.board.pulse[ssc['grip'].num])
+    """
+
+    def __init__(self, port='emulator', baudrate=115200, count=32, timeout=1, config=None,
+                 autocommit=None, clock=None, board=None):
+        """
+        Same as SSC32, the serial settings only being reported back.
+
+        :param board: (Optional) Board to talk to. Default: a new BoardEmulator on `clock`
+        :type board: ssc32.emulator.BoardEmulator
+        """
+        self.board = board if board is not None else BoardEmulator(count, clock)
+        super(EmulatedSSC32, self).__init__(port, baudrate, count, timeout, config, autocommit, clock,
+                                            self._transport(port, baudrate, timeout))
+
+    def _transport(self, port, baudrate, timeout):
+        return EmulatedPort(self.board, port, baudrate, timeout)
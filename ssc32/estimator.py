@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Servo positions predicted from the commands sent, instead of queried.
+
+Every motion line goes through SSC32._send(); the estimator replays it on
+a ssc32.motion.MotionModel, which knows each channel's start, target, ``T``
+and ``S``. Positions then cost no round trip. One batched ``QP`` query
+re-syncs the model every `resync_interval` seconds, or when sync() is
+called, and the difference it finds is kept as the estimate's error.
+
+Example:
+::
+
+    estimator = ssc.start_estimator(resync_interval=1.0)
+    ssc['grip'].position = 2000
+    ssc.commit(500)
+    print(ssc['grip'].current_position)   # no query
+    print(estimator.sync())               # {channel: measured - estimated}
+"""
+
+import re
+import threading
+
+from .motion import MotionModel, parse_motion
+from .protocol import Request
+
+__all__ = [
+    'PositionEstimator',
+    'QP_RESOLUTION',
+]
+
+## QP replies are pulse widths divided by 10
+QP_RESOLUTION = 10
+
+_STOP = re.compile(r'^\s*STOP\s*(\d+)\s*$', re.I)
+
+
+class PositionEstimator(object):
+    """
+    Motion model of a board fed with the commands sent to it
+
+    Channels are unknown until a query has measured them once; asking for
+    an unknown channel's position syncs it first.
+    """
+
+    def __init__(self, ssc, resync_interval=None):
+        """
+        :type ssc: ssc32.SSC32
+        :param float resync_interval: (Optional) Seconds after which a position request re-syncs first. Default: only on sync()
+        """
+        self.ssc = ssc
+        self.resync_interval = resync_interval
+        from .ssc32 import Servo
+        ## Indexed by servo number
+        self.model = MotionModel(Servo.MAX_CHANNEL + 1)
+        self.errors = {}
+        self.max_errors = {}
+        self.last_sync = None
+        self._known = set()
+        self._lock = threading.RLock()
+
+    def observe(self, line, now=None):
+        """
+        Replay command lines sent to the board
+
+        :param str line: Command lines without the final CR
+        :param float now: (Optional) Time the board receives the lines. Default: now on the
+            controller's clock, plus their serial time at the port's baud rate
+        """
+        if now is None:
+            now = self.ssc.clock.time()
+            baudrate = getattr(self.ssc.ser, 'baudrate', None)
+            if baudrate:
+                now += (len(line) + 1)*10.0/baudrate
+        with self._lock:
+            for part in line.split('\r'):
+                m = _STOP.match(part)
+                if m is not None:
+                    self.model.stop(int(m.group(1)), now)
+                    continue
+                moves, time_ms = parse_motion(part)
+                if moves:
+                    self.model.move(moves, time_ms, now)
+
+    def position(self, servo):
+        """
+        Estimated pulse width of a servo
+
+        :param servo: Servo index, name or instance
+        :rtype: int
+        """
+        num = self.ssc[servo].num
+        with self._lock:
+            if num not in self._known:
+                self.sync()
+            elif self._resync_due():
+                self.sync()
+            return self.model.position(num, self.ssc.clock.time())
+
+    def positions(self, servos=None):
+        """
+        Estimated pulse widths
+
+        :param list servos: (Optional) Servos to report. Default: all
+        :return: Pulse width per servo number
+        :rtype: dict
+        """
+        if servos is None:
+            servos = range(len(self.ssc))
+        nums = [self.ssc[s].num for s in servos]
+        with self._lock:
+            if self._resync_due() or not self._known.issuperset(nums):
+                self.sync()
+            now = self.ssc.clock.time()
+            return dict((num, self.model.position(num, now)) for num in nums)
+
+    def is_moving(self, servos=None):
+        """
+        True while the model has a move in progress. Never queries the board.
+
+        :param list servos: (Optional) Servos to check. Default: all
+        :rtype: bool
+        """
+        channels = None if servos is None else [self.ssc[s].num for s in servos]
+        with self._lock:
+            return self.model.is_moving(self.ssc.clock.time(), channels)
+
+    def sync(self, servos=None):
+        """
+        Measure positions with one batched query and correct the model.
+        Differences within the query resolution are kept as estimated.
+
+        :param list servos: (Optional) Servos to measure. Default: every channel
+        :return: ``measured - estimated`` per servo number, 0 for channels measured the first time
+        :rtype: dict
+        """
+        if servos is None:
+            servos = range(len(self.ssc))
+        nums = [self.ssc[s].num for s in servos]
+        with self._lock:
+            measured = self.ssc._request(Request.pulse_width(nums))
+            now = self.ssc.clock.time()
+            errors = {}
+            for num, pulse in zip(nums, measured):
+                if num not in self._known:
+                    self._known.add(num)
+                    self.model.correct(num, pulse, now)
+                    errors[num] = 0
+                    continue
+                error = pulse - self.model.position(num, now)
+                errors[num] = error
+                self.max_errors[num] = max(self.max_errors.get(num, 0), abs(error))
+                if abs(error) >= QP_RESOLUTION:
+                    self.model.correct(num, pulse, now)
+            self.errors.update(errors)
+            self.last_sync = now
+            return errors
+
+    def _resync_due(self):
+        if self.resync_interval is None:
+            return False
+        return self.last_sync is None or \
+            self.ssc.clock.time() - self.last_sync >= self.resync_interval
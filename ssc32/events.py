@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+Events from one shared poll loop: movement completion and input edges.
+
+An EventBus polls the board with a single batched query per tick: ``Q``
+for movement completion, the levels of the watched inputs and their
+latched levels (``AL``..``DL``), which also catch a low pulse shorter than
+the poll period. However many listeners subscribe, the board sees one
+poll.
+
+Events are delivered on the bus's callback thread, so a slow listener
+never delays polling, or on an asyncio loop given when subscribing.
+
+Example:
+::
+
+    bus = ssc.start_events(period=0.02)
+    bus.subscribe('falling', lambda e: print('button', e.input, 'pressed'), input='A')
+    bus.subscribe('move_complete', on_done)
+
+    ## or, from a coroutine
+    bus.subscribe('rising', handler, loop=asyncio.get_running_loop())
+"""
+
+import threading
+import itertools
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from .motion import parse_motion
+from .protocol import Request, PORT_ERRORS
+
+__all__ = [
+    'EventBus',
+    'Event',
+    'MOVE_COMPLETE',
+    'RISING',
+    'FALLING',
+]
+
+MOVE_COMPLETE = 'move_complete'
+RISING = 'rising'
+FALLING = 'falling'
+
+_KINDS = (MOVE_COMPLETE, RISING, FALLING)
+
+
+class Event(object):
+    """
+    Something the poll loop noticed
+
+    `input` is the input letter of edges, None for movement completion.
+    `time` is the poll time on the controller's clock.
+    """
+    __slots__ = ('kind', 'input', 'time')
+
+    def __init__(self, kind, input=None, time=None):
+        self.kind = kind
+        self.input = input
+        self.time = time
+
+    def __repr__(self):
+        if self.input is None:
+            return '<Event {0} t={1}>'.format(self.kind, self.time)
+        return '<Event {0} {1} t={2}>'.format(self.kind, self.input, self.time)
+
+
+class EventBus(object):
+    """
+    Publishes board events to subscribers from a single poll loop
+
+    Usually created with SSC32.start_events(). The controller reports every
+    motion line to observe() once it is written, so a move finishing is only
+    announced once the board has received it.
+
+    Failed polls and exceptions raised by callbacks do not stop the threads:
+    `error_count` counts them and `last_error` holds the latest.
+    """
+
+    def __init__(self, ssc, period=0.02, inputs='ABCD'):
+        """
+        :type ssc: ssc32.SSC32
+        :param float period: (Optional) Poll period in seconds
+        :param str inputs: (Optional) Digital inputs watched for edges
+        """
+        self.ssc = ssc
+        self.period = period
+        self.inputs = ''.join(i.upper() for i in inputs if 'A' <= i.upper() <= 'D')
+        self.levels = None
+        self.error_count = 0
+        self.last_error = None
+
+        self._requests = [Request.movement_done()]
+        if self.inputs:
+            self._requests.append(Request.digital(self.inputs))
+            self._requests.append(Request.digital(self.inputs, latched=True))
+
+        self._subscribers = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._sent = 0
+        self._completed = 0
+        self._stop = threading.Event()
+        self._queue = queue.Queue()
+        self._threads = []
+
+    ##########
+    ## SUBSCRIPTIONS
+    ##########
+    def subscribe(self, kind, callback, input=None, loop=None):
+        """
+        Call `callback` with every matching Event
+
+        :param str kind: ``'move_complete'``, ``'rising'`` or ``'falling'``
+        :param func callback: Function, or coroutine function when `loop` is given
+        :param str input: (Optional) Only edges of this input letter
+        :param loop: (Optional) asyncio loop to run the callback on, instead of the callback thread
+        :return: Token for unsubscribe()
+        :rtype: int
+        :raise ValueError: if `kind` is unknown
+        """
+        if kind not in _KINDS:
+            raise ValueError('unknown event {0!r}, expected one of {1}'.format(kind, ', '.join(_KINDS)))
+        token = next(self._ids)
+        with self._lock:
+            self._subscribers[token] = (kind, input.upper() if input else None, callback, loop)
+        return token
+
+    def unsubscribe(self, token):
+        """
+        :param int token: Value returned by subscribe()
+        """
+        with self._lock:
+            self._subscribers.pop(token, None)
+
+    def emit(self, event):
+        """
+        Queue an event for its subscribers
+
+        :type event: ssc32.events.Event
+        """
+        with self._lock:
+            targets = [(callback, loop) for kind, input, callback, loop in self._subscribers.values()
+                       if kind == event.kind and (input is None or input == event.input)]
+        for callback, loop in targets:
+            if loop is None:
+                self._queue.put((callback, event))
+            else:
+                _call_soon(loop, callback, event)
+
+    ##########
+    ## POLLING
+    ##########
+    def observe(self, line):
+        """
+        Count the motion lines written to the board
+
+        :param str line: Command lines without the final CR, already written
+        """
+        for part in line.split('\r'):
+            if parse_motion(part)[0]:
+                with self._lock:
+                    self._sent += 1
+                return
+
+    def poll(self):
+        """
+        Query the board once and emit what changed since the previous poll
+
+        :return: The events emitted
+        :rtype: list(ssc32.events.Event)
+        """
+        ## Moves counted here were written before the query is queued, so its reply covers them
+        with self._lock:
+            sent = self._sent
+        replies = self.ssc._requests(self._requests)
+        now = self.ssc.clock.time()
+
+        events = []
+        if replies[0] and sent > self._completed:
+            self._completed = sent
+            events.append(Event(MOVE_COMPLETE, None, now))
+
+        if self.inputs:
+            levels, latched = replies[1], replies[2]
+            if self.levels is not None:
+                for name, was, level, held in zip(self.inputs, self.levels, levels, latched):
+                    if was and (not level or not held):
+                        events.append(Event(FALLING, name, now))
+                    if level and (not was or not held):
+                        events.append(Event(RISING, name, now))
+            self.levels = levels
+
+        for event in events:
+            self.emit(event)
+        return events
+
+    ##########
+    ## THREADS
+    ##########
+    def _poll_loop(self):
+        while not self._stop.wait(self.period):
+            try:
+                self.poll()
+            except PORT_ERRORS as e:
+                self._error(e)
+
+    def _callback_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            callback, event = item
+            try:
+                callback(event)
+            except Exception as e:
+                ## The subscriber's code: the other subscribers still get their events
+                self._error(e)
+
+    def _error(self, e):
+        with self._lock:
+            self.last_error = e
+            self.error_count += 1
+
+    def start(self):
+        """
+        Start the poll loop and the callback thread. Starts the controller's
+        scheduler so the polls can share the port with other threads.
+        """
+        if self._threads:
+            return
+        self.ssc.start_scheduler()
+        self._stop.clear()
+        for target, name in ((self._callback_loop, 'ssc32-events'), (self._poll_loop, 'ssc32-poll')):
+            thread = threading.Thread(target=target, name=name)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """
+        Stop polling, deliver the queued events and wait for the threads
+        """
+        if not self._threads:
+            return
+        self._stop.set()
+        callbacks, poller = self._threads
+        poller.join()
+        self._queue.put(None)
+        callbacks.join()
+        self._threads = []
+
+
+def _call_soon(loop, callback, event):
+    import asyncio
+    if asyncio.iscoroutinefunction(callback):
+        asyncio.run_coroutine_threadsafe(callback(event), loop)
+    else:
+        loop.call_soon_threadsafe(callback, event)
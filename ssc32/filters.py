@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+Target filtering between Servo.position and commit() (requires NumPy).
+
+With a FilterChain set on the controller, commit() no longer sends the
+targets as they are: every channel with a target goes through the chain,
+as one array, and only channels whose filtered pulse width differs from
+the one last sent are written. A jittering input that the chain filters
+out costs no bytes at all, not even an empty line.
+
+Filters keep their own state between commits and use the time elapsed
+on the controller's clock, so a teleoperation loop calling commit() at a
+steady rate converges on the targets:
+
+- LowPass: exponential smoothing with a time constant,
+- SlewLimit: at most `rate` pulse width per second,
+- Deadband: changes smaller than `width` are ignored.
+
+Parameters are one value for every servo or ``{servo: value}``.
+
+Example:
+::
+
+    from ssc32.filters import LowPass, SlewLimit, Deadband
+
+    ssc.set_filters(LowPass(0.05), SlewLimit({'grip': 500}, default=1500), Deadband(6))
+    while True:
+        ssc['joint0'].position = joystick_x()
+        ssc.commit()
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+__all__ = [
+    'FilterChain',
+    'LowPass',
+    'SlewLimit',
+    'Deadband',
+]
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("NumPy is required for target filters")
+
+
+class _Filter(object):
+    """
+    A filter over the targets of every servo. Subclasses implement step().
+    """
+
+    def __init__(self, value, default=None):
+        self.value = value
+        self.default = default
+        self.state = None
+
+    def bind(self, ssc):
+        """
+        Resolve the parameter for the servos of `ssc` and forget the state
+        """
+        count = len(ssc)
+        if isinstance(self.value, dict):
+            default = np.inf if self.default is None else self.default
+            self.param = np.full(count, float(default))
+            index = dict((s.num, k) for k, s in enumerate(ssc._servos))
+            for servo, value in self.value.items():
+                self.param[index[ssc[servo].num]] = value
+        else:
+            self.param = np.full(count, float(self.value))
+        self.state = np.full(count, np.nan)
+
+    def __call__(self, target, dt):
+        ## A channel without history starts on its target
+        prev = np.where(np.isnan(self.state), target, self.state)
+        out = self.step(target, prev, dt)
+        self.state = np.where(np.isnan(target), self.state, out)
+        return out
+
+    def step(self, target, prev, dt):
+        raise NotImplementedError
+
+
+class LowPass(_Filter):
+    """
+    First order low-pass: ``out += (target - out)*(1 - exp(-dt/time_constant))``
+    """
+
+    def __init__(self, time_constant, default=None):
+        """
+        :param time_constant: Seconds, 0 to pass through
+        :type time_constant: float or dict
+        :param float default: (Optional) For servos missing from a dict. Default: pass through
+        """
+        super(LowPass, self).__init__(time_constant, 0.0 if default is None else default)
+
+    def step(self, target, prev, dt):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            alpha = np.where(self.param > 0, 1 - np.exp(-dt/self.param), 1.0)
+        return prev + (target - prev)*alpha
+
+
+class SlewLimit(_Filter):
+    """
+    Rate limit: move at most ``rate*dt`` toward the target per commit
+    """
+
+    def __init__(self, rate, default=None):
+        """
+        :param rate: Pulse width per second
+        :type rate: float or dict
+        :param float default: (Optional) For servos missing from a dict. Default: unlimited
+        """
+        super(SlewLimit, self).__init__(rate, default)
+
+    def step(self, target, prev, dt):
+        with np.errstate(invalid='ignore'):
+            limit = np.where(np.isinf(self.param), np.inf, self.param*dt)
+        return prev + np.clip(target - prev, -limit, limit)
+
+
+class Deadband(_Filter):
+    """
+    Hold the output until the target moves `width` away from it
+    """
+
+    def __init__(self, width, default=None):
+        """
+        :param width: Pulse width
+        :type width: float or dict
+        :param float default: (Optional) For servos missing from a dict. Default: 0
+        """
+        super(Deadband, self).__init__(width, 0.0 if default is None else default)
+
+    def step(self, target, prev, dt):
+        return np.where(np.abs(target - prev) < self.param, prev, target)
+
+
+class FilterChain(object):
+    """
+    Filters applied in order to the targets of every servo at each commit.
+    Usually created with SSC32.set_filters().
+    """
+
+    def __init__(self, ssc, filters):
+        """
+        :type ssc: ssc32.SSC32
+        :param list filters: LowPass, SlewLimit and Deadband instances, applied in order
+        """
+        _require_numpy()
+        self.ssc = ssc
+        self.filters = list(filters)
+        self.reset()
+
+    def reset(self):
+        """
+        Forget the filter states: the next commit sends the targets as they are
+        """
+        for f in self.filters:
+            f.bind(self.ssc)
+        self.sent = np.full(len(self.ssc), np.nan)
+        self.active = np.zeros(len(self.ssc), dtype=bool)
+        self.last_time = None
+
+    def __call__(self, target):
+        """
+        Filter an array of targets, one per servo, NaN for none
+
+        :type target: numpy.ndarray
+        :return: Filtered targets
+        :rtype: numpy.ndarray
+        """
+        now = self.ssc.clock.time()
+        dt = 0.0 if self.last_time is None else max(now - self.last_time, 0.0)
+        self.last_time = now
+        out = np.asarray(target, dtype=float)
+        for f in self.filters:
+            out = f(out, dt)
+        return out
+
+    def commit_line(self, time=None):
+        """
+        Command line moving the servos whose filtered pulse width changed.
+        Servos are filtered from their first change after reset() on, so
+        targets nobody set are not sent. Marks every servo as sent.
+
+        :param int time: (Optional) Time in ms for entire move
+        :rtype: str
+        """
+        servos = self.ssc._servos
+        self.active |= np.array([s.is_changed for s in servos], dtype=bool)
+        target = np.array([np.nan if s._pos is None else s._pos for s in servos], dtype=float)
+        target[~self.active] = np.nan
+        out = np.rint(self(target))
+        send = ~np.isnan(out) & (out != self.sent)
+        self.sent = np.where(send, out, self.sent)
+
+        cmd = ''
+        for k in np.flatnonzero(send):
+            servo = servos[k]
+            cmd += '#{0}P{1}'.format(servo.num, int(out[k]))
+            if servo.speed:
+                cmd += 'S{0}'.format(servo.speed)
+            servo.is_moving = True
+        for servo in servos:
+            servo.is_changed = False
+
+        if time is not None and cmd != '':
+            cmd += 'T{0}'.format(time)
+        return cmd
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+Precomputed gait tables for legged robots.
+
+Requires NumPy.
+"""
+
+import threading
+import numpy as np
+
+from .kinematics import degrees_to_pwm
+
+__all__ = [
+    'Leg',
+    'Gait',
+    'GaitError',
+    'QUADRUPED_LEGS',
+    'TROT',
+    'WALK',
+]
+
+
+class GaitError(Exception):
+    pass
+
+
+class Leg(object):
+    """
+    Three joint leg: hip yaw (base), hip pitch (thigh) and knee (toe)
+    """
+
+    def __init__(self, base, thigh, toe, side=1, neutral=(0.0, 0.0, 0.0)):
+        """
+        :param base: Hip yaw servo name or number
+        :param thigh: Hip pitch servo name or number
+        :param toe: Knee servo name or number
+        :param int side: +1 for legs on the left, -1 for legs on the right
+        :param tuple neutral: (Optional) Standing pose in degrees for (base, thigh, toe)
+        """
+        self.joints = (base, thigh, toe)
+        self.side = side
+        self.neutral = tuple(float(n) for n in neutral)
+
+    def __repr__(self):
+        return '<Leg {0} side={1}>'.format(self.joints, self.side)
+
+
+## Leg layout of examples/test.py
+QUADRUPED_LEGS = (
+    Leg('fl_base', 'fl_thigh', 'fl_toe', side=1),
+    Leg('bl_base', 'bl_thigh', 'bl_toe', side=1),
+    Leg('fr_base', 'fr_thigh', 'fr_toe', side=-1),
+    Leg('br_base', 'br_thigh', 'br_toe', side=-1),
+)
+
+## Phase offsets for QUADRUPED_LEGS
+TROT = (0.0, 0.5, 0.5, 0.0)
+WALK = (0.0, 0.25, 0.5, 0.75)
+
+
+class Gait(object):
+    """
+    Cyclic gait engine
+
+    One gait cycle is precomputed as a table of pulse widths for every speed and
+    turn rate in a grid. Streaming only indexes into the current table, shifting
+    each leg by its phase offset. Changing speed or turn rate cross-fades from the
+    old table to the new one over `blend_steps` frames.
+
+    Example:
+    ::
+
+        from ssc32.gait import Gait, TROT
+
+        gait = Gait(ssc, offsets=TROT, cycle_time=1.0)
+        gait.set_motion(speed=1.0)
+        gait.run(cycles=10)
+    """
+
+    def __init__(self, ssc, legs=QUADRUPED_LEGS, offsets=TROT, steps=32, cycle_time=1.0,
+                 speeds=(-1.0, -0.5, 0.0, 0.5, 1.0), turns=(-1.0, -0.5, 0.0, 0.5, 1.0),
+                 stride=20.0, lift=25.0, knee=15.0, duty=0.75, blend_steps=8):
+        """
+        :param ssc: Controller holding the leg servos
+        :type ssc: ssc32.SSC32
+        :param tuple legs: (Optional) Instances of Leg
+        :param tuple offsets: (Optional) Phase offset in [0, 1) per leg
+        :param int steps: (Optional) Frames per gait cycle
+        :param float cycle_time: (Optional) Duration of one gait cycle in seconds
+        :param tuple speeds: (Optional) Speeds to precompute, -1 (backward) to 1 (forward)
+        :param tuple turns: (Optional) Turn rates to precompute, -1 (right) to 1 (left)
+        :param float stride: (Optional) Hip yaw amplitude in degrees at full speed
+        :param float lift: (Optional) Thigh lift in degrees during swing
+        :param float knee: (Optional) Knee flex in degrees during swing
+        :param float duty: (Optional) Fraction of the cycle a foot is on the ground
+        :param int blend_steps: (Optional) Frames used to cross-fade between tables
+
+        :raise GaitError: if `offsets` does not match `legs`
+        """
+        if len(offsets) != len(legs):
+            raise GaitError("One phase offset is needed per leg")
+        if not 0.0 < duty < 1.0:
+            raise GaitError("Duty factor must be between 0 and 1")
+
+        self.ssc = ssc
+        self.legs = tuple(legs)
+        self.steps = int(steps)
+        self.cycle_time = float(cycle_time)
+        self.speeds = np.asarray(sorted(speeds), dtype=float)
+        self.turns = np.asarray(sorted(turns), dtype=float)
+        self.stride = float(stride)
+        self.lift = float(lift)
+        self.knee = float(knee)
+        self.duty = float(duty)
+        self.blend_steps = int(blend_steps)
+
+        self.servos = [ssc[j] for leg in self.legs for j in leg.joints]
+        self.channels = [s.num for s in self.servos]
+
+        self.tables = self._build_tables()
+        self.offsets = offsets
+
+        self._key = self._index(0.0, 0.0)
+        self._table = self.tables[self._key]
+        self._previous = None
+        self._blend = 0
+        self._tick = 0
+        self._last = None
+        self._stop = threading.Event()
+
+    ##########
+    ## TABLES
+    ##########
+    def _build_tables(self):
+        """
+        Precompute every (speed, turn) table
+
+        :return: Pulse widths, shape ``(speeds, turns, steps, legs, 3)``
+        :rtype: numpy.ndarray
+        """
+        n_legs = len(self.legs)
+        phase = np.arange(self.steps)/float(self.steps)
+
+        ## Yaw goes from +1 to -1 while on the ground and back during swing
+        stance = phase < self.duty
+        swing = np.where(stance, 0.0, (phase - self.duty)/(1.0 - self.duty))
+        yaw = np.where(stance, 1.0 - 2.0*phase/self.duty, -1.0 + 2.0*swing)
+        bump = np.where(stance, 0.0, np.sin(np.pi*swing))
+
+        side = np.array([leg.side for leg in self.legs], dtype=float)
+        neutral = np.array([leg.neutral for leg in self.legs], dtype=float)
+
+        ## Amplitude per (speed, turn, leg); turning drives the sides in opposition
+        amp = self.speeds[:, None, None] - self.turns[None, :, None]*side[None, None, :]
+        amp = np.clip(amp, -1.0, 1.0)*self.stride*side
+
+        deg = np.empty((len(self.speeds), len(self.turns), self.steps, n_legs, 3))
+        deg[..., 0] = neutral[:, 0] + amp[:, :, None, :]*yaw[None, None, :, None]
+        moving = (amp != 0.0)[:, :, None, :]
+        deg[..., 1] = neutral[:, 1] + moving*self.lift*bump[None, None, :, None]
+        deg[..., 2] = neutral[:, 2] - moving*self.knee*bump[None, None, :, None]
+
+        shape = deg.shape
+        pwm = degrees_to_pwm(self.servos, deg.reshape(shape[:3] + (n_legs*3,)))
+        return pwm.reshape(shape)
+
+    def _index(self, speed, turn):
+        i = int(np.abs(self.speeds - speed).argmin())
+        j = int(np.abs(self.turns - turn).argmin())
+        return i, j
+
+    @property
+    def offsets(self):
+        """
+        Phase offset of each leg in [0, 1). May be changed while streaming.
+
+        :type: tuple(float)
+        """
+        return tuple(self._shift/float(self.steps))
+
+    @offsets.setter
+    def offsets(self, offsets):
+        if len(offsets) != len(self.legs):
+            raise GaitError("One phase offset is needed per leg")
+        self._shift = (np.round(np.asarray(offsets, dtype=float)*self.steps)).astype(np.intp)
+        self._legs = np.arange(len(self.legs))
+
+    def set_motion(self, speed=0.0, turn=0.0):
+        """
+        Select the table closest to `speed` and `turn`, cross-fading into it.
+        A cross-fade in progress is continued from the pose it has reached.
+
+        :param float speed: Speed from -1 (backward) to 1 (forward)
+        :param float turn: Turn rate from -1 (right) to 1 (left)
+        """
+        key = self._index(speed, turn)
+        if key == self._key:
+            return
+        self._previous = self._blended_table()
+        self._key = key
+        self._table = self.tables[key]
+        self._blend = self.blend_steps
+
+    def _blended_table(self):
+        """
+        The table frame() currently plays, cross-fade included
+        """
+        if self._blend > 0 and self._previous is not None:
+            w = self._blend/float(self.blend_steps + 1)
+            return (w*self._previous + (1.0 - w)*self._table).astype(self._table.dtype)
+        return self._table
+
+    ##########
+    ## STREAMING
+    ##########
+    def frame(self, tick=None):
+        """
+        Pulse widths for one frame
+
+        :param int tick: (Optional) Frame counter. Default: the current frame
+        :return: Pulse widths for :attr:`channels`
+        :rtype: numpy.ndarray of int
+        """
+        if tick is None:
+            tick = self._tick
+        rows = (tick + self._shift) % self.steps
+        pwm = self._table[rows, self._legs].reshape(-1)
+
+        if self._blend > 0 and self._previous is not None:
+            w = self._blend/float(self.blend_steps + 1)
+            old = self._previous[rows, self._legs].reshape(-1)
+            pwm = (w*old + (1.0 - w)*pwm).astype(pwm.dtype)
+        return pwm
+
+    def step(self):
+        """
+        Send the current frame and advance by one
+        """
+        pwm = self.frame()
+        period = int(1000*self.cycle_time/self.steps)
+
+        if self._last is None:
+            changed = range(len(pwm))
+        else:
+            changed = np.flatnonzero(pwm != self._last)
+
+        cmd = ''
+        for k in changed:
+            servo = self.servos[k]
+            servo._pos = int(pwm[k])
+            cmd += '#{0}P{1}'.format(servo.num, servo._pos)
+        if cmd != '':
+            self.ssc._send(cmd + 'T{0}'.format(period))
+
+        self._last = pwm
+        self._tick = (self._tick + 1) % self.steps
+        if self._blend > 0:
+            self._blend -= 1
+            if self._blend == 0:
+                self._previous = None
+
+    def run(self, cycles=None):
+        """
+        Stream frames at the gait rate until stop() is called or `cycles` have passed
+
+        :param int cycles: (Optional) Number of gait cycles to run. Default: forever
+        """
+        self._stop.clear()
+        period = self.cycle_time/self.steps
+        remaining = None if cycles is None else int(cycles*self.steps)
+        clock = self.ssc.clock
+        deadline = clock.time()
+
+        while not self._stop.is_set() and remaining != 0:
+            self.step()
+            if remaining is not None:
+                remaining -= 1
+            deadline += period
+            delay = deadline - clock.time()
+            if delay > 0:
+                clock.sleep(delay)
+
+    def stop(self):
+        """
+        Stop run() after the current frame
+        """
+        self._stop.set()
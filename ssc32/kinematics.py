@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+"""
+Batched forward/inverse kinematics for the OR-LC-ARM layout.
+
+Requires NumPy.
+"""
+
+import numpy as np
+
+__all__ = [
+    'Arm',
+    'KinematicsError',
+    'servo_arrays',
+    'degrees_to_pwm',
+]
+
+
+class KinematicsError(Exception):
+    pass
+
+
+def servo_arrays(servos):
+    """
+    Collect the calibration of several servos into arrays
+
+    :param list servos: Instances of ssc32.Servo
+    :return: ``(channels, pwm_center, pwm_per_degree, pwm_min, pwm_max)``
+    :rtype: tuple(numpy.ndarray)
+    """
+    channels = np.array([s.num for s in servos], dtype=np.intp)
+    center = np.array([s.pwm_center for s in servos], dtype=float)
+    per_degree = np.array([s.pwm_per_degree for s in servos], dtype=float)
+    pwm_min = np.array([s.min for s in servos], dtype=np.int64)
+    pwm_max = np.array([s.max for s in servos], dtype=np.int64)
+    return channels, center, per_degree, pwm_min, pwm_max
+
+
+def degrees_to_pwm(servos, degrees):
+    """
+    Vectorized version of the ``Servo.degrees`` setter, calibration tables included
+
+    :param list servos: Instances of ssc32.Servo, one per column of `degrees`
+    :param degrees: Angles in degrees, shape ``(..., len(servos))``
+    :type degrees: array_like
+    :return: Pulse widths clamped to the servo limits
+    :rtype: numpy.ndarray of int
+    """
+    _, center, per_degree, pwm_min, pwm_max = servo_arrays(servos)
+    degrees = np.asarray(degrees, dtype=float)
+    if any(s.calibration is not None for s in servos):
+        degrees = degrees.copy()
+        for k, s in enumerate(servos):
+            if s.calibration is not None:
+                degrees[..., k] = s.calibration.commanded_array(degrees[..., k])
+    pwm = (degrees*per_degree + center).astype(np.int64)
+    return np.clip(pwm, pwm_min, pwm_max)
+
+
+class Arm(object):
+    """
+    Kinematic model of a 5 joint arm: base yaw (JOINT0), shoulder, elbow and
+    wrist pitch (JOINT1..JOINT3) and wrist roll (JOINT4).
+
+    With every joint at 0° the arm points straight up, positive pitch leans
+    towards +x. A pose is ``(x, y, z, pitch)`` where `pitch` is the angle of the
+    hand from vertical in radians. Wrist roll does not move the tool point and is
+    passed through.
+
+    Example:
+    ::
+
+        import numpy as np
+        from ssc32.kinematics import Arm
+
+        arm = Arm(ssc, lengths=(70.0, 105.0, 98.0, 60.0))
+        path = np.column_stack([x, y, z, pitch])     # (1000, 4)
+        pwm = arm.pwm_trajectory(path)               # (1000, 5)
+    """
+
+    JOINTS = ('JOINT0', 'JOINT1', 'JOINT2', 'JOINT3', 'JOINT4')
+
+    def __init__(self, ssc, lengths, joints=JOINTS, offsets=None, signs=None,
+                 pitch_weight=100.0):
+        """
+        :param ssc: Controller holding the servo calibration
+        :type ssc: ssc32.SSC32
+        :param tuple lengths: ``(base height, upper arm, forearm, hand)`` in any length unit
+        :param tuple joints: (Optional) Servo names or numbers for the five joints
+        :param offsets: (Optional) Servo angle in degrees at the model's zero for each joint
+        :param signs: (Optional) +1 or -1 per joint, direction of the servo relative to the model
+        :param float pitch_weight: (Optional) Length units per radian of pitch error used when solving
+
+        :raise KinematicsError: if `lengths` or `joints` have the wrong size
+        """
+        if len(lengths) != 4:
+            raise KinematicsError("lengths must be (base, upper arm, forearm, hand)")
+        if len(joints) != 5:
+            raise KinematicsError("Arm needs exactly five joints")
+
+        self.ssc = ssc
+        self.lengths = tuple(float(l) for l in lengths)
+        self.servos = [ssc[j] for j in joints]
+        self.offsets = np.zeros(5) if offsets is None else np.asarray(offsets, dtype=float)
+        self.signs = np.ones(5) if signs is None else np.asarray(signs, dtype=float)
+        self.pitch_weight = float(pitch_weight)
+
+        self.tolerance = 0.1
+        self.max_iterations = 100
+        self.damping = 1.0
+        self.jacobian_refresh = 4
+
+        self._solution = None
+        self._jacobian = None
+
+    ##########
+    ## JOINT SPACE
+    ##########
+    def _limits(self):
+        """
+        Joint limits in model radians
+        """
+        lo = np.array([min(s.deg_min, s.deg_max) for s in self.servos])
+        hi = np.array([max(s.deg_min, s.deg_max) for s in self.servos])
+        a = np.radians((lo - self.offsets)*self.signs)
+        b = np.radians((hi - self.offsets)*self.signs)
+        return np.minimum(a, b), np.maximum(a, b)
+
+    def to_servo_degrees(self, q):
+        """
+        Convert model joint angles to servo degrees
+
+        :param q: Joint angles in radians, shape ``(N, 5)``
+        :rtype: numpy.ndarray
+        """
+        return self.offsets + self.signs*np.degrees(q)
+
+    def from_servo_degrees(self, degrees):
+        """
+        Convert servo degrees to model joint angles in radians
+
+        :param degrees: Servo angles, shape ``(N, 5)``
+        :rtype: numpy.ndarray
+        """
+        return np.radians((np.asarray(degrees, dtype=float) - self.offsets)*self.signs)
+
+    def current(self):
+        """
+        Target joint angles currently set on the servos
+
+        :return: Joint angles in radians, shape ``(5,)``
+        :rtype: numpy.ndarray
+        """
+        return self.from_servo_degrees([s.degrees for s in self.servos])
+
+    ##########
+    ## FORWARD
+    ##########
+    def _forward(self, q):
+        h, l1, l2, l3 = self.lengths
+        a1 = q[:, 1]
+        a2 = a1 + q[:, 2]
+        a3 = a2 + q[:, 3]
+
+        r = l1*np.sin(a1) + l2*np.sin(a2) + l3*np.sin(a3)
+        pose = np.empty((q.shape[0], 4))
+        pose[:, 0] = r*np.cos(q[:, 0])
+        pose[:, 1] = r*np.sin(q[:, 0])
+        pose[:, 2] = h + l1*np.cos(a1) + l2*np.cos(a2) + l3*np.cos(a3)
+        pose[:, 3] = a3
+        return pose
+
+    def _jacobians(self, q):
+        _, l1, l2, l3 = self.lengths
+        a1 = q[:, 1]
+        a2 = a1 + q[:, 2]
+        a3 = a2 + q[:, 3]
+        s1, s2, s3 = l1*np.sin(a1), l2*np.sin(a2), l3*np.sin(a3)
+        c1, c2, c3 = l1*np.cos(a1), l2*np.cos(a2), l3*np.cos(a3)
+        cy, sy = np.cos(q[:, 0]), np.sin(q[:, 0])
+        r = s1 + s2 + s3
+
+        dr = np.column_stack([c1 + c2 + c3, c2 + c3, c3])
+        dz = -np.column_stack([s1 + s2 + s3, s2 + s3, s3])
+
+        jac = np.zeros((q.shape[0], 4, 4))
+        jac[:, 0, 0] = -r*sy
+        jac[:, 1, 0] = r*cy
+        jac[:, 0, 1:] = dr*cy[:, None]
+        jac[:, 1, 1:] = dr*sy[:, None]
+        jac[:, 2, 1:] = dz
+        jac[:, 3, 1:] = self.pitch_weight
+        return jac
+
+    def forward(self, degrees):
+        """
+        Forward kinematics for many joint configurations at once
+
+        :param degrees: Servo angles for JOINT0..JOINT4, shape ``(N, 5)`` or ``(5,)``
+        :return: Poses ``(x, y, z, pitch)``, shape ``(N, 4)`` or ``(4,)``
+        :rtype: numpy.ndarray
+        """
+        degrees = np.asarray(degrees, dtype=float)
+        single = degrees.ndim == 1
+        pose = self._forward(self.from_servo_degrees(np.atleast_2d(degrees)))
+        return pose[0] if single else pose
+
+    ##########
+    ## INVERSE
+    ##########
+    def _seed(self, n):
+        if self._solution is not None and self._solution.shape[0] == n:
+            return self._solution.copy(), self._jacobian
+        if self._solution is not None:
+            return np.tile(self._solution[-1], (n, 1)), None
+        return np.tile(self.current(), (n, 1)), None
+
+    def inverse(self, poses, roll=None, seed=None):
+        """
+        Inverse kinematics for many poses at once
+
+        All poses are solved together with damped least squares (the damping
+        adapts per pose, Levenberg-Marquardt style). Each solve
+        starts from the previous solution (or its last row when the batch size
+        changed) and reuses its Jacobians, so consecutive calls along a path
+        converge in a few iterations. Jacobians are only refreshed every
+        `jacobian_refresh` iterations or when a step makes things worse.
+        Targets out of reach converge to the closest reachable pose.
+
+        :param poses: Targets ``(x, y, z, pitch)``, shape ``(N, 4)`` or ``(4,)``
+        :param roll: (Optional) Wrist roll in servo degrees, scalar or shape ``(N,)``
+        :param seed: (Optional) Initial servo angles, shape ``(N, 5)`` or ``(5,)``
+        :return: Servo angles for JOINT0..JOINT4, shape ``(N, 5)`` or ``(5,)``
+        :rtype: numpy.ndarray
+        """
+        poses = np.asarray(poses, dtype=float)
+        single = poses.ndim == 1
+        poses = np.atleast_2d(poses)
+        n = poses.shape[0]
+
+        if seed is not None:
+            seed = np.atleast_2d(self.from_servo_degrees(seed))
+            full, jac = np.array(np.broadcast_to(seed, (n, 5))), None
+        else:
+            full, jac = self._seed(n)
+        q = full[:, :4]
+        fresh = np.zeros(n, dtype=bool)
+        lam = np.full(n, self.damping)
+        if jac is None:
+            jac = self._jacobians(q)
+            fresh[:] = True
+
+        lo, hi = self._limits()
+        lo, hi = lo[:4], hi[:4]
+        weight = np.array([1.0, 1.0, 1.0, self.pitch_weight])
+
+        err = (poses - self._forward(q))*weight
+        norm = np.linalg.norm(err, axis=1)
+        active = np.flatnonzero(norm > self.tolerance)
+        age = 0
+
+        for _ in range(self.max_iterations):
+            if active.size == 0:
+                break
+
+            ja = jac[active]
+            jjt = np.matmul(ja, ja.transpose(0, 2, 1))
+            jjt += (lam[active]**2)[:, None, None]*np.eye(4)
+            step = np.matmul(ja.transpose(0, 2, 1),
+                             np.linalg.solve(jjt, err[active][:, :, None]))[:, :, 0]
+
+            trial = np.clip(q[active] + step, lo, hi)
+            trial_err = (poses[active] - self._forward(trial))*weight
+            trial_norm = np.linalg.norm(trial_err, axis=1)
+
+            better = trial_norm < norm[active]
+            moved = active[better]
+            q[moved] = trial[better]
+            err[moved] = trial_err[better]
+            norm[moved] = trial_norm[better]
+            fresh[moved] = False
+            lam[moved] = np.maximum(lam[moved]*0.1, 1e-3)
+
+            ## Retry a failed step with a fresh Jacobian, then with more damping.
+            ## A point that cannot improve even then is as close as it gets.
+            failed = active[~better]
+            retry = failed[~fresh[failed]]
+            damped = failed[fresh[failed]]
+            lam[damped] *= 10.0
+            stuck = damped[lam[damped] > 1e6]
+
+            active = active[(norm[active] > self.tolerance) & ~np.isin(active, stuck)]
+
+            age += 1
+            if age >= self.jacobian_refresh:
+                jac[active] = self._jacobians(q[active])
+                fresh[active] = True
+                age = 0
+            elif retry.size:
+                jac[retry] = self._jacobians(q[retry])
+                fresh[retry] = True
+
+        self._solution = full
+        self._jacobian = jac
+
+        degrees = self.to_servo_degrees(full)
+        if roll is not None:
+            degrees[:, 4] = roll
+        return degrees[0] if single else degrees
+
+    ##########
+    ## PWM
+    ##########
+    @property
+    def channels(self):
+        """
+        Servo channels of JOINT0..JOINT4
+
+        :type: list(int)
+        """
+        return [s.num for s in self.servos]
+
+    def to_pwm(self, degrees):
+        """
+        Convert servo angles to pulse widths with each servo's calibration
+
+        :param degrees: Servo angles, shape ``(N, 5)`` or ``(5,)``
+        :rtype: numpy.ndarray of int
+        """
+        return degrees_to_pwm(self.servos, degrees)
+
+    def pwm_trajectory(self, poses, roll=None):
+        """
+        Convert a Cartesian path to pulse widths in a single batched call
+
+        :param poses: Targets ``(x, y, z, pitch)``, shape ``(N, 4)``
+        :param roll: (Optional) Wrist roll in servo degrees, scalar or shape ``(N,)``
+        :return: Pulse widths for :attr:`channels`, shape ``(N, 5)``
+        :rtype: numpy.ndarray of int
+        """
+        return self.to_pwm(self.inverse(poses, roll=roll))
+
+    def apply(self, degrees):
+        """
+        Set one configuration on the servos (does not commit)
+
+        :param degrees: Servo angles for JOINT0..JOINT4, shape ``(5,)``
+        """
+        for servo, deg in zip(self.servos, degrees):
+            servo.degrees = deg
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Servo motion model of the SSC32 firmware.
+
+A group move (one command line) makes every servo in it arrive at the same
+time: the line's ``T``, or longer if a servo's ``S`` (µs per second) does
+not allow it. A servo without pulse (0, just powered) jumps to its first
+target. Between commands positions are linear in time.
+"""
+
+import re
+
+__all__ = [
+    'MotionModel',
+    'parse_motion',
+]
+
+_GROUP = re.compile(r'#\s*(\d+)\s*((?:[PS]\s*-?\d+\s*)+)', re.I)
+_ARG = re.compile(r'([PS])\s*(-?\d+)', re.I)
+_TIME = re.compile(r'T\s*(\d+)', re.I)
+
+
+def parse_motion(line):
+    """
+    Extract the servo moves of a command line
+
+    :param str line: Command line, eg. ``#0P1500S750#1P900T1000``
+    :return: ``(moves, time in ms or None)``, moves being ``(channel, pulse, speed or None)``
+    :rtype: tuple
+    """
+    moves = []
+    for ch, args in _GROUP.findall(line):
+        pulse = speed = None
+        for kind, value in _ARG.findall(args):
+            if kind.upper() == 'P':
+                pulse = int(value)
+            else:
+                speed = int(value)
+        if pulse is not None:
+            moves.append((int(ch), pulse, speed))
+    m = _TIME.search(line)
+    return moves, int(m.group(1)) if m else None
+
+
+class MotionModel(object):
+    """
+    Pulse widths of every channel as a function of time
+
+    Optionally keeps the breakpoints of each channel's trajectory, which
+    describe it exactly since it is linear in between (see history).
+    """
+
+    def __init__(self, channels=32, record=False):
+        """
+        :param int channels: (Optional) Number of servo channels
+        :param bool record: (Optional) Keep the breakpoints of every trajectory
+        """
+        self.start = [0]*channels
+        self.target = [0]*channels
+        self.t0 = [0.0]*channels
+        self.t1 = [0.0]*channels
+        self.history = [[(0.0, 0)] for _ in range(channels)] if record else None
+
+    def __len__(self):
+        return len(self.target)
+
+    def position(self, channel, now):
+        """
+        :param int channel: Servo channel
+        :param float now: Time in seconds
+        :return: Pulse width, 0 if the channel was never commanded
+        :rtype: int
+        """
+        t1 = self.t1[channel]
+        if now >= t1:
+            return self.target[channel]
+        t0 = self.t0[channel]
+        start = self.start[channel]
+        return int(round(start + (self.target[channel] - start)*(now - t0)/(t1 - t0)))
+
+    def positions(self, now):
+        """
+        :param float now: Time in seconds
+        :rtype: list(int)
+        """
+        return [self.position(ch, now) for ch in range(len(self.target))]
+
+    def is_moving(self, now, channels=None):
+        """
+        :param float now: Time in seconds
+        :param list channels: (Optional) Channels to check. Default: all
+        :rtype: bool
+        """
+        if channels is None:
+            return now < max(self.t1)
+        return any(now < self.t1[ch] for ch in channels)
+
+    def move(self, moves, time_ms=None, now=0.0):
+        """
+        Start a group move
+
+        :param list moves: ``(channel, pulse, speed or None)`` tuples
+        :param int time_ms: (Optional) Group time ``T`` in ms
+        :param float now: Time of the command in seconds
+        :return: Duration of the move in seconds, 0 if every servo in it jumps
+        :rtype: float
+        """
+        current = dict((ch, self.position(ch, now)) for ch, _, _ in moves)
+        duration = (time_ms or 0)/1000.0
+        for ch, pulse, speed in moves:
+            if speed and current[ch]:
+                duration = max(duration, abs(pulse - current[ch])/float(speed))
+
+        for ch, pulse, _ in moves:
+            start = current[ch]
+            self.start[ch] = start if start else pulse
+            self.target[ch] = pulse
+            self.t0[ch] = now
+            self.t1[ch] = now + duration if start else now
+            self._record(ch, now, start)
+        ## Servos without pulse jump, so only powered ones take time
+        if not any(current.values()):
+            return 0.0
+        return duration
+
+    def stop(self, channel, now):
+        """
+        Hold a channel where it is
+
+        :param int channel: Servo channel
+        :param float now: Time in seconds
+        """
+        pos = self.position(channel, now)
+        self.start[channel] = self.target[channel] = pos
+        self.t0[channel] = self.t1[channel] = now
+        self._record(channel, now, pos)
+
+    def correct(self, channel, pulse, now):
+        """
+        Replace the position at `now` by a measured one. A move in progress
+        keeps its target and end time, only its start changes.
+
+        :param int channel: Servo channel
+        :param int pulse: Measured pulse width
+        :param float now: Time of the measure in seconds
+        """
+        if now >= self.t1[channel]:
+            self.target[channel] = pulse
+            self.t1[channel] = now
+        self.start[channel] = pulse
+        self.t0[channel] = now
+        self._record(channel, now, pulse)
+
+    def _record(self, ch, now, current):
+        if self.history is None:
+            return
+        points = self.history[ch]
+        ## Drop the part of the previous trajectory that did not happen
+        while points[-1][0] > now:
+            points.pop()
+        ## Close a hold, or the next segment would ramp through it
+        if points[-1][0] < now or points[-1][1] != current:
+            points.append((now, current))
+        if self.start[ch] != current:
+            points.append((now, self.start[ch]))
+        if self.t1[ch] > now:
+            points.append((self.t1[ch], self.target[ch]))
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+SSC32 query framing and reply decoding
+"""
+
+import re
+
+__all__ = [
+    'Request',
+    'ResponseReader',
+    'ShortReadError',
+    'reply_length',
+]
+
+
+class ShortReadError(Exception):
+    """
+    Raised when the board sends fewer bytes than the command asked for
+    """
+
+    def __init__(self, line, expected, received):
+        self.line = line
+        self.expected = expected
+        self.received = received
+        super(ShortReadError, self).__init__(
+            "Short reply to {0!r}: expected {1} bytes, received {2}".format(
+                line, 'a line' if expected is None else expected, received))
+
+
+## What a background loop survives: the port failing (serial.SerialException
+## is an IOError) or a reply coming short
+PORT_ERRORS = (EnvironmentError, ShortReadError)
+
+
+## Queries answered with exactly one byte: Q, QP<n>, VA..VH, A..H, AL..HL
+_ONE_BYTE = re.compile(r'^(?:Q|QP\d+|V[A-H]|[A-H]L?)$')
+
+
+def reply_length(line):
+    """
+    Number of bytes the board answers to a command line
+
+    :param str line: Command line without CR
+    :return: Reply size in bytes, or None if the reply runs up to a CR (``VER``)
+    :rtype: int or None
+    """
+    count = 0
+    for token in line.upper().split():
+        if token == 'VER':
+            return None
+        if _ONE_BYTE.match(token):
+            count += 1
+    return count
+
+
+def _decode_text(view):
+    return view.tobytes().decode('ascii', 'replace')
+
+
+def _decode_done(view):
+    return view[0] == 0x2E  # '.'
+
+
+def _decode_pulse_widths(view):
+    return [b*10 for b in view.tolist()]
+
+
+def _decode_bytes(view):
+    return view.tolist()
+
+
+def _decode_levels(view):
+    return [b == 0x31 for b in view.tolist()]  # '1'
+
+
+class Request(object):
+    """
+    A query line together with the size and decoder of its reply
+    """
+    __slots__ = ('line', 'length', 'decode')
+
+    def __init__(self, line, decode=_decode_bytes, length=-1):
+        """
+        :param str line: Command line without CR
+        :param func decode: (Optional) Turns the reply memoryview into a value
+        :param int length: (Optional) Reply size. Default: derived from `line`
+        """
+        self.line = line
+        self.decode = decode
+        self.length = reply_length(line) if length == -1 else length
+
+    def __repr__(self):
+        return '<Request {0!r} length={1}>'.format(self.line, self.length)
+
+    @classmethod
+    def version(cls):
+        return cls('VER', _decode_text)
+
+    @classmethod
+    def movement_done(cls):
+        return cls('Q', _decode_done)
+
+    @classmethod
+    def pulse_width(cls, channels):
+        """
+        :param list channels: Servo numbers
+        """
+        return cls(' '.join('QP{0}'.format(c) for c in channels), _decode_pulse_widths)
+
+    @classmethod
+    def analog(cls, inputs):
+        """
+        :param str inputs: Input letters, eg. "AC"
+        """
+        return cls(' '.join('V' + i for i in inputs), _decode_bytes)
+
+    @classmethod
+    def digital(cls, inputs, latched=False):
+        """
+        :param str inputs: Input letters, eg. "AC"
+        :param bool latched: Read the latched state
+        """
+        lat = 'L' if latched else ''
+        return cls(' '.join(i + lat for i in inputs), _decode_levels)
+
+
+class ResponseReader(object):
+    """
+    Reads replies into a preallocated buffer
+
+    Replies are returned as memoryview slices of the buffer and are only valid
+    until the next read. The port's ``read_into`` must only return fewer bytes
+    than asked for once the line has gone quiet (see ssc32.transport.Transport),
+    so a reply that stops arriving mid-way is reported as ShortReadError
+    without waiting out the full timeout again.
+    """
+
+    def __init__(self, port, size=256):
+        """
+        :param port: Object providing ``read_into(buffer)``
+        :type port: ssc32.transport.Transport
+        :param int size: (Optional) Initial buffer size
+        """
+        self.port = port
+        self._allocate(size)
+
+    def _allocate(self, size):
+        self.buffer = bytearray(size)
+        self._view = memoryview(self.buffer)
+
+    def read_exact(self, count, line=None):
+        """
+        Read exactly `count` bytes
+
+        :param int count: Number of bytes
+        :param str line: (Optional) Command line, used in the error message
+        :rtype: memoryview
+        :raise ShortReadError: if the port returns before `count` bytes arrived
+        """
+        if count > len(self.buffer):
+            self._allocate(count)
+
+        n = self.port.read_into(self._view[:count])
+        if n < count:
+            raise ShortReadError(line, count, n)
+        return self._view[:count]
+
+    def read_line(self, line=None):
+        """
+        Read until CR. The CR is not included.
+
+        :param str line: (Optional) Command line, used in the error message
+        :rtype: memoryview
+        :raise ShortReadError: if nothing at all was received
+        """
+        view = self._view
+        got = 0
+        while True:
+            if got == len(self.buffer):
+                old = self.buffer
+                self._allocate(2*got)
+                self.buffer[:got] = old
+                view = self._view
+
+            n = self.port.read_into(view[got:got + 1])
+            if not n:
+                if got == 0:
+                    raise ShortReadError(line, None, 0)
+                return view[:got]
+            if view[got] == 0x0D:
+                return view[:got]
+            got += 1
+
+    def read_reply(self, request):
+        """
+        Read the reply to a request
+
+        :type request: ssc32.protocol.Request
+        :rtype: memoryview
+        """
+        if request.length is None:
+            return self.read_line(request.line)
+        return self.read_exact(request.length, request.line)
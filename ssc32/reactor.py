@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+Single threaded event loop driving many boards
+"""
+
+import os
+import time
+import socket
+import selectors
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+from .protocol import Request, ShortReadError
+
+__all__ = [
+    'Reactor',
+]
+
+
+class _Board(object):
+    """
+    Per board state: outgoing bytes, received bytes and requests waiting for a reply
+    """
+
+    def __init__(self, ssc):
+        self.ssc = ssc
+        self.fd = ssc.ser.fileno()
+        self.timeout = ssc.ser.timeout
+        self.outbox = bytearray()
+        self.inbox = bytearray()
+        ## (end offset in outbox, request or None, future, callback)
+        self.sending = deque()
+        ## (request, future, callback, deadline)
+        self.waiting = deque()
+
+
+class Reactor(object):
+    """
+    Reactor style driver multiplexing many SSC32 boards on one thread
+
+    Each registered board's file descriptor is watched with ``selectors``.
+    Writes are queued and flushed as the port accepts them, and replies are
+    matched to their requests in FIFO order by expected length (see
+    ssc32.protocol.reply_length). All methods except run() are thread safe.
+
+    While a board is registered, its blocking methods (queries, commit...)
+    must not be used, the reactor owns the port. A board whose port closes or
+    fails is unregistered, and its pending futures fail with the error.
+
+    Example:
+    ::
+
+        import ssc32
+        from ssc32.reactor import Reactor
+
+        reactor = Reactor()
+        boards = [ssc32.SSC32(port, 115200) for port in ports]
+        for ssc in boards:
+            reactor.register(ssc)
+        reactor.start()
+
+        futures = [reactor.submit(ssc, ssc32.Request.pulse_width([0, 1])) for ssc in boards]
+        print([f.result() for f in futures])
+    """
+
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._boards = {}
+        self._calls = deque()
+        self._thread = None
+        self._running = False
+
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+
+    ##########
+    ## THREAD SAFE API
+    ##########
+    def _call(self, func, *args):
+        self._calls.append((func, args))
+        try:
+            self._wake_w.send(b'\0')
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def register(self, ssc):
+        """
+        Let the reactor drive a board
+
+        :type ssc: ssc32.SSC32
+        """
+        self._call(self._register, ssc)
+
+    def unregister(self, ssc):
+        """
+        Stop driving a board. Requests still waiting for a reply are cancelled.
+
+        :type ssc: ssc32.SSC32
+        """
+        self._call(self._unregister, ssc)
+
+    def send(self, ssc, line, callback=None):
+        """
+        Queue a command line that has no reply
+
+        :type ssc: ssc32.SSC32
+        :param str line: Command line without CR
+        :param func callback: (Optional) Called with None once the line is written
+        :return: Future resolved once the line has been written, or failed with the callback's exception
+        :rtype: concurrent.futures.Future
+        """
+        future = Future()
+        self._call(self._queue, ssc, line, None, future, callback)
+        return future
+
+    def submit(self, ssc, request, callback=None):
+        """
+        Queue a query
+
+        :type ssc: ssc32.SSC32
+        :param request: Query to send
+        :type request: ssc32.protocol.Request or str
+        :param func callback: (Optional) Called on the reactor thread with the decoded reply
+        :return: Future resolved with the decoded reply, or failed with the callback's exception
+        :rtype: concurrent.futures.Future
+        """
+        if not isinstance(request, Request):
+            request = Request(request)
+        future = Future()
+        self._call(self._queue, ssc, request.line, request, future, callback)
+        return future
+
+    def commit(self, ssc, time=None, callback=None):
+        """
+        Queue the changed servo positions of a board, like SSC32.commit()
+
+        :type ssc: ssc32.SSC32
+        :param int time: (Optional) Time in ms for entire move
+        :rtype: concurrent.futures.Future
+        """
+        return self.send(ssc, ssc._commit_line(time), callback)
+
+    def start(self):
+        """
+        Run the loop on a background thread
+        """
+        self._thread = threading.Thread(target=self.run, name='ssc32-reactor')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the loop and wait for its thread, if started with start()
+        """
+        self._call(self._stop)
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+            self._thread = None
+
+    ##########
+    ## LOOP
+    ##########
+    def run(self):
+        """
+        Run the loop on the calling thread until stop() is called
+        """
+        self._running = True
+        while self._running:
+            self.run_once()
+
+    def run_once(self, timeout=None):
+        """
+        Wait for I/O once and dispatch everything that is ready
+
+        :param float timeout: (Optional) Maximum time to wait in seconds
+        """
+        now = time.time()
+        for board in self._boards.values():
+            if board.waiting and board.waiting[0][3] != float('inf'):
+                left = max(0.0, board.waiting[0][3] - now)
+                timeout = left if timeout is None else min(timeout, left)
+
+        for key, events in self._selector.select(timeout):
+            board = key.data
+            if board is None:
+                try:
+                    while self._wake_r.recv(4096):
+                        pass
+                except (BlockingIOError, InterruptedError):
+                    pass
+                continue
+            if events & selectors.EVENT_WRITE:
+                self._flush(board)
+            if events & selectors.EVENT_READ and self._boards.get(board.fd) is board:
+                self._receive(board)
+
+        while self._calls:
+            func, args = self._calls.popleft()
+            func(*args)
+
+        self._expire(time.time())
+
+    def _stop(self):
+        self._running = False
+
+    def _register(self, ssc):
+        board = _Board(ssc)
+        os.set_blocking(board.fd, False)
+        self._boards[board.fd] = board
+        self._selector.register(board.fd, selectors.EVENT_READ, board)
+
+    def _unregister(self, ssc):
+        board = self._boards.get(ssc.ser.fileno())
+        if board is not None:
+            self._drop(board)
+
+    def _drop(self, board, exception=None):
+        """
+        Forget a board. Its pending futures are cancelled, or failed with `exception`.
+        """
+        if self._boards.get(board.fd) is not board:
+            return
+        del self._boards[board.fd]
+        self._selector.unregister(board.fd)
+        futures = [item[2] for item in board.sending] + [item[1] for item in board.waiting]
+        board.sending.clear()
+        board.waiting.clear()
+        for future in futures:
+            if exception is None:
+                future.cancel()
+            else:
+                self._fail(future, exception)
+
+    def _queue(self, ssc, line, request, future, callback):
+        board = self._boards.get(ssc.ser.fileno())
+        if board is None:
+            self._fail(future, KeyError("Board is not registered"))
+            return
+
+        board.outbox += line.encode() + b'\r'
+        board.sending.append((len(board.outbox), request, future, callback))
+        self._flush(board)
+
+    def _flush(self, board):
+        if board.outbox:
+            try:
+                n = os.write(board.fd, board.outbox)
+            except (BlockingIOError, InterruptedError):
+                n = 0
+            except OSError as e:
+                self._drop(board, e)
+                return
+            del board.outbox[:n]
+
+            if board.timeout is None:
+                deadline = float('inf')
+            else:
+                deadline = time.time() + board.timeout
+            while board.sending and board.sending[0][0] <= n:
+                _, request, future, callback = board.sending.popleft()
+                if request is None or request.length == 0:
+                    self._resolve(future, callback, None)
+                else:
+                    board.waiting.append((request, future, callback, deadline))
+            board.sending = deque((end - n, r, f, c) for end, r, f, c in board.sending)
+
+        events = selectors.EVENT_READ
+        if board.outbox:
+            events |= selectors.EVENT_WRITE
+        self._selector.modify(board.fd, events, board)
+
+    def _receive(self, board):
+        try:
+            data = os.read(board.fd, 4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self._drop(board, e)
+            return
+        if not data:
+            self._drop(board, ConnectionError("Port of board closed"))
+            return
+        if not board.waiting:
+            ## Nobody asked, most likely the tail of an expired reply
+            return
+        board.inbox += data
+
+        while board.waiting:
+            request, future, callback, _ = board.waiting[0]
+            if request.length is None:
+                end = board.inbox.find(b'\r')
+                if end < 0:
+                    break
+                size = end + 1
+            else:
+                end = size = request.length
+                if len(board.inbox) < size:
+                    break
+
+            board.waiting.popleft()
+            ## Decode a copy: a failing decoder's traceback can keep its view
+            ## alive, and the inbox cannot be resized while it is exported
+            reply = memoryview(bytes(board.inbox[:end]))
+            del board.inbox[:size]
+            try:
+                value = request.decode(reply)
+            except Exception as e:
+                self._fail(future, e)
+            else:
+                self._resolve(future, callback, value)
+
+    def _expire(self, now):
+        for board in self._boards.values():
+            if board.waiting and board.waiting[0][3] <= now:
+                ## Replies are matched by position, so everything behind it is lost too
+                received = len(board.inbox)
+                for request, future, _, _ in board.waiting:
+                    self._fail(future, ShortReadError(request.line, request.length, received))
+                    received = 0
+                board.waiting.clear()
+                del board.inbox[:]
+
+    def _resolve(self, future, callback, value):
+        if not future.set_running_or_notify_cancel():
+            return
+        if callback is not None:
+            ## A failing callback must not stop the loop: its future reports the error
+            try:
+                callback(value)
+            except Exception as e:
+                future.set_exception(e)
+                return
+        future.set_result(value)
+
+    def _fail(self, future, exception):
+        if future.set_running_or_notify_cancel():
+            future.set_exception(exception)
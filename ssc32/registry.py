@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+Script directory with hot reload.
+
+A ScriptRegistry keeps every script of a directory parsed and, if asked
+to, compiled (see ssc32.binary). refresh() only stats the files;
+a file is read again only if its mtime or size changed, and parsed and
+compiled again only if its content hash changed too. The new set of
+scripts replaces the old one in a single assignment, so get() and run()
+always see one consistent version, and a script already running finishes
+with the version it started with. Scripts that did not change keep their
+parsed and compiled objects.
+
+Scripts are played with Script.run() by default. Compiling trades the
+constant-size ``!Repeat`` and ``!Sweep`` loops for one record per
+movement played, so it is best kept for scripts without long loops.
+
+Example:
+::
+
+    from ssc32.registry import ScriptRegistry
+
+    registry = ScriptRegistry('scripts', ssc)
+    registry.start(period=0.5)      # or call registry.refresh() yourself
+    registry.run('wave.yaml')
+"""
+
+import os
+import glob
+import yaml
+import hashlib
+import threading
+
+from .binary import compile_script
+from .script import ScriptError
+
+__all__ = [
+    'ScriptRegistry',
+    'ScriptEntry',
+]
+
+
+## What a script file can fail with: bad YAML, a bad node or value, an unconfigured joint
+LOAD_ERRORS = (yaml.YAMLError, ScriptError, ValueError, TypeError, KeyError)
+
+
+class ScriptEntry(object):
+    """
+    One script file: its stat, content hash, parsed script and compiled frames.
+    `compiled` is None unless the registry compiles, or if compilation failed (see `error`).
+    """
+    __slots__ = ('path', 'mtime', 'size', 'digest', 'script', 'compiled', 'error')
+
+    def __init__(self, path, mtime, size, digest, script, compiled=None, error=None):
+        self.path = path
+        self.mtime = mtime
+        self.size = size
+        self.digest = digest
+        self.script = script
+        self.compiled = compiled
+        self.error = error
+
+    def __repr__(self):
+        return '<ScriptEntry {0!r} compiled={1}{2}>'.format(
+            os.path.basename(self.path), self.compiled is not None,
+            ' error={0!r}'.format(self.error) if self.error else '')
+
+    @property
+    def player(self):
+        """
+        What run() plays: the compiled frames if there are any, else the script
+
+        :type: ssc32.binary.CompiledScript or ssc32.Script
+        """
+        return self.compiled if self.compiled is not None else self.script
+
+
+class ScriptRegistry(object):
+    """
+    Parsed (and compiled) scripts of a directory, reloaded when their files change
+
+    Scripts that fail to load are listed in `errors`. The watching thread
+    survives an unreadable directory and on_change exceptions: `error_count`
+    counts them and `last_error` holds the latest.
+    """
+
+    def __init__(self, directory, ssc=None, pattern='*.yaml', on_change=None, compile=False):
+        """
+        :param str directory: Directory of the scripts
+        :param ssc: (Optional) Controller to run on, and to compile for
+        :type ssc: ssc32.SSC32
+        :param str pattern: (Optional) File name pattern
+        :param func on_change: (Optional) Called after a refresh that changed something, with ``(changed names, removed names)``
+        :param bool compile: (Optional) Also compile the scripts for `ssc`, and play the compiled frames
+        """
+        self.directory = directory
+        self.ssc = ssc
+        self.compile = compile
+        self.pattern = pattern
+        self.on_change = on_change
+        self.errors = {}
+        self.error_count = 0
+        self.last_error = None
+        self._entries = {}
+        self._failed = {}      # name -> (mtime, size) of a file that did not load
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.refresh()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def __iter__(self):
+        return iter(sorted(self._entries))
+
+    def names(self):
+        """
+        :rtype: list(str)
+        """
+        return sorted(self._entries)
+
+    def entry(self, name):
+        """
+        :param str name: File name within the directory
+        :rtype: ssc32.registry.ScriptEntry
+        :raise KeyError: if there is no such script
+        """
+        return self._entries[name]
+
+    def get(self, name):
+        """
+        Current version of a script
+
+        :param str name: File name within the directory
+        :rtype: ssc32.Script
+        :raise KeyError: if there is no such script
+        """
+        return self._entries[name].script
+
+    def refresh(self):
+        """
+        Stat the directory and reload the scripts that changed. A file that no
+        longer parses keeps its previous version, its error is in `errors`.
+
+        :return: ``(changed names, removed names)``
+        :rtype: tuple(list, list)
+        """
+        with self._refresh_lock:
+            old = self._entries
+            new = {}
+            changed = []
+            for path in glob.glob(os.path.join(self.directory, self.pattern)):
+                name = os.path.basename(path)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entry = old.get(name)
+                if entry is not None and entry.mtime == st.st_mtime and entry.size == st.st_size:
+                    new[name] = entry
+                    continue
+                if self._failed.get(name) == (st.st_mtime, st.st_size):
+                    if entry is not None:
+                        new[name] = entry
+                    continue
+
+                try:
+                    with open(path, 'rb') as fd:
+                        data = fd.read()
+                except (IOError, OSError):
+                    if entry is not None:
+                        new[name] = entry
+                    continue
+                digest = hashlib.sha1(data).hexdigest()
+                if entry is not None and entry.digest == digest:
+                    ## Touched but not modified: keep the parsed and compiled script
+                    new[name] = ScriptEntry(path, st.st_mtime, st.st_size, digest, entry.script,
+                                            entry.compiled, entry.error)
+                    continue
+
+                try:
+                    loaded = self._load(path, data, st, digest)
+                except LOAD_ERRORS as e:
+                    self.errors[name] = '{0}: {1}'.format(type(e).__name__, e)
+                    self._failed[name] = (st.st_mtime, st.st_size)
+                    if entry is not None:
+                        new[name] = entry
+                    continue
+                self.errors.pop(name, None)
+                self._failed.pop(name, None)
+                new[name] = loaded
+                changed.append(name)
+
+            removed = sorted(set(old) - set(new))
+            for name in removed:
+                self.errors.pop(name, None)
+                self._failed.pop(name, None)
+            self._entries = new
+
+        changed.sort()
+        if (changed or removed) and self.on_change is not None:
+            self.on_change(changed, removed)
+        return changed, removed
+
+    def _load(self, path, data, st, digest):
+        script = yaml.load(data, Loader=yaml.Loader)
+        if not hasattr(script, 'iter_movements'):
+            raise ValueError('{0} is not a !Script'.format(path))
+        compiled = error = None
+        if self.compile and self.ssc is not None:
+            try:
+                compiled = compile_script(script, self.ssc)
+            except LOAD_ERRORS as e:
+                error = '{0}: {1}'.format(type(e).__name__, e)
+        return ScriptEntry(path, st.st_mtime, st.st_size, digest, script, compiled, error)
+
+    def run(self, name, ssc=None):
+        """
+        Play the current version of a script, compiled if the registry
+        compiles and it succeeded. A refresh during the run does not affect it.
+
+        :param str name: File name within the directory
+        :param ssc: (Optional) Default: the registry's controller
+        :type ssc: ssc32.SSC32
+        """
+        player = self._entries[name].player
+        player.run(ssc if ssc is not None else self.ssc)
+        return player
+
+    ##########
+    ## WATCHING
+    ##########
+    def _watch(self, period):
+        while not self._stop.wait(period):
+            try:
+                self.refresh()
+            except EnvironmentError as e:
+                ## The directory cannot be read: try again next period
+                self._error(e)
+            except Exception as e:
+                ## Raised by on_change, the caller's code
+                self._error(e)
+
+    def _error(self, e):
+        self.last_error = e
+        self.error_count += 1
+
+    def start(self, period=1.0):
+        """
+        Refresh every `period` seconds on a background thread
+
+        :param float period: (Optional) Seconds between two directory scans
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, args=(period,), name='ssc32-registry')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop watching
+        """
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Thread safe command scheduler owning the serial port
+"""
+
+import heapq
+import itertools
+import threading
+from concurrent.futures import Future
+
+__all__ = [
+    'CommandScheduler',
+    'PRIORITY_STOP',
+    'PRIORITY_MOTION',
+    'PRIORITY_QUERY',
+]
+
+## Lower goes first
+PRIORITY_STOP = 0
+PRIORITY_MOTION = 1
+PRIORITY_QUERY = 2
+
+
+class CommandScheduler(object):
+    """
+    Serializes every access to an SSC32's port on one worker thread
+
+    Commands wait in a priority queue: stops first, then motion frames (and
+    digital outputs), then queries. The worker sends one item at a time and
+    picks the most urgent one after each, so a stop goes out after at most
+    one in-flight item. Queries are written and answered as one item, so a
+    reply always goes back to the request that asked for it.
+
+    Usually created with SSC32.start_scheduler(), after which all SSC32
+    methods go through it and may be called from any thread.
+    """
+
+    def __init__(self, ssc):
+        """
+        :type ssc: ssc32.SSC32
+        """
+        self.ssc = ssc
+        self._queue = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def __len__(self):
+        with self._cond:
+            return len(self._queue)
+
+    @property
+    def is_worker(self):
+        """
+        True when called from the scheduler's own thread
+
+        :type: bool
+        """
+        return threading.current_thread() is self._thread
+
+    def start(self):
+        """
+        Start the worker thread
+        """
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name='ssc32-scheduler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Finish the queued commands and stop the worker thread
+        """
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None and not self.is_worker:
+            self._thread.join()
+        self._thread = None
+
+    def submit(self, line=None, requests=None, priority=PRIORITY_MOTION):
+        """
+        Queue a command line or a batch of queries
+
+        :param str line: Command line without CR, for commands without reply
+        :param list requests: Instances of ssc32.protocol.Request
+        :param int priority: PRIORITY_STOP, PRIORITY_MOTION or PRIORITY_QUERY
+        :return: Future resolved with None for a line, or the list of decoded replies
+        :rtype: concurrent.futures.Future
+        """
+        future = Future()
+        with self._cond:
+            if not self._running:
+                raise RuntimeError("Scheduler is not running")
+            heapq.heappush(self._queue, (priority, next(self._counter), line, requests, future))
+            self._cond.notify()
+        return future
+
+    def clear(self, priority=PRIORITY_MOTION):
+        """
+        Cancel every queued command of the given priority
+
+        :param int priority: Priority to drop
+        :return: Number of cancelled commands
+        :rtype: int
+        """
+        with self._cond:
+            keep = [item for item in self._queue if item[0] != priority]
+            dropped = [item for item in self._queue if item[0] == priority]
+            heapq.heapify(keep)
+            self._queue = keep
+        for item in dropped:
+            item[4].cancel()
+        return len(dropped)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._queue:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                _, _, line, requests, future = heapq.heappop(self._queue)
+
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if requests is not None:
+                    result = self.ssc._exchange(requests)
+                else:
+                    result = self.ssc._write_now(line)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
@@ -1,17 +1,58 @@
 # -*- config: utf-8 -*-
 """
 Movement scripting.
+
+Besides ``!Movement``, the movements of a ``!Script`` may hold loops, which
+are played without being expanded in memory:
+::
+
+    !Script
+    time: 0.5
+    vars: {open: 2400, shut: 1200}
+    movements:
+    - !Repeat
+      count: 10000
+      movements:
+      - !Movement {grip: {pos: $open}}
+      - !Movement {grip: {pos: $shut}}
+    - !Sweep
+      var: angle
+      start: -60
+      stop: 60
+      step: 10
+      movements:
+      - !Movement {joint0: {deg: $angle}, time: 0.2}
+
+A ``$name`` (or ``${name}``) value is replaced by a variable: from the
+script's ``vars``, a ``!Sweep`` value or a ``!Repeat`` iteration number.
+Movements without variables are played as they are; the others are bound
+to fresh movements as they are reached.
 """
 
-import time
+import json
+import math
 import yaml
 import sys
+import heapq
+import threading
 from copy import copy
 
+from .analysis import analyze
+
 __all__ = [
     'Script',
     'Movement',
+    'Repeat',
+    'Sweep',
+    'MultiTrackPlayer',
+    'StreamingScript',
+    'OptimizeReport',
     'ScriptError',
+    'ScriptLoader',
+    'iter_yaml_movements',
+    'iter_record_lines',
+    'iter_record_movements',
+    'write_records',
 ]
 
 
@@ -19,6 +60,89 @@ class ScriptError(Exception):
     pass
 
 
+if sys.version_info >= (3, 0):
+    _string_types = str
+else:
+    _string_types = basestring
+
+
+def _is_variable(value):
+    return isinstance(value, _string_types) and value.startswith('$')
+
+
+def _number(value, cast):
+    """
+    `value` converted by `cast`, or kept as is if it is a variable
+    """
+    return value if _is_variable(value) else cast(value)
+
+
+def _pulse(value):
+    return int(round(float(value)))
+
+
+def _resolve(value, env, cast):
+    """
+    `value`, or the variable it names looked up in `env`, converted by `cast`
+    """
+    if not _is_variable(value):
+        return value if value is None else cast(value)
+    name = value[1:]
+    if name.startswith('{') and name.endswith('}'):
+        name = name[1:-1]
+    try:
+        value = env[name]
+    except KeyError:
+        raise ScriptError('undefined variable "{0}"'.format(name))
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        raise ScriptError('variable "{0}" is not a number: {1!r}'.format(name, value))
+
+
+class _Scope(object):
+    """
+    Variable of a loop iteration, over the variables of the enclosing scope
+    """
+    __slots__ = ('parent', 'name', 'value')
+
+    def __init__(self, parent, name, value):
+        self.parent = parent
+        self.name = name
+        self.value = value
+
+    def __getitem__(self, name):
+        if name == self.name:
+            return self.value
+        return self.parent[name]
+
+
+def _expand(items, env):
+    """
+    Movements of `items` in playing order, loops unrolled one movement at a time
+    """
+    for item in items:
+        if isinstance(item, Movement):
+            yield item.bind(env)
+        else:
+            for move in item.iter_movements(env):
+                yield move
+
+
+def _count(items, env):
+    return sum(1 if isinstance(item, Movement) else item.movement_count(env)
+               for item in items)
+
+
+def _templates(items):
+    for item in items:
+        if isinstance(item, Movement):
+            yield item
+        else:
+            for move in _templates(item.movements):
+                yield move
+
+
 class Movement(yaml.YAMLObject):
     yaml_tag = '!Movement'
 
@@ -27,27 +151,34 @@ class Movement(yaml.YAMLObject):
         self.update(**kvargs)
 
     def update(self, **kvargs):
-        self.time = float(kvargs.pop('time', 0))
-        self.wait = float(kvargs.pop('wait', 0))
+        self.time = _number(kvargs.pop('time', 0), float)
+        self.wait = _number(kvargs.pop('wait', 0), float)
 
-        for k, v in kvargs.iteritems():
+        for k, v in kvargs.items():
             try:
                 joint, measure = k.rsplit('_', 1)
             except ValueError:
                 joint, measure = k, 'pos'
 
             if measure in ['deg', 'degrees']:
-                move = (joint, float(v), None, None)
+                move = (joint, _number(v, float), None, None)
             elif measure in ['rad', 'radians']:
-                move = (joint, None, float(v), None)
+                move = (joint, None, _number(v, float), None)
             elif measure in ['pos', 'position']:
-                move = (joint, None, None, int(v))
+                move = (joint, None, None, _number(v, int))
             else:
                 raise ScriptError('unknown measure "{0}" for servo "{1}"'.format(measure, joint))
 
             self.joints.append(move)
 
-    def run(self, ssc, time_):
+    def apply(self, ssc):
+        """
+        Set the joint targets on the servos without committing
+
+        :return: The servos touched
+        :rtype: list(ssc32.Servo)
+        """
+        servos = []
         for move in self.joints:
             joint_name, deg, rad, pos = move
             joint = ssc[joint_name]
@@ -57,14 +188,72 @@ class Movement(yaml.YAMLObject):
                 joint.radians = rad
             else:
                 joint.position = pos
+            servos.append(joint)
+        return servos
+
+    def targets(self, ssc, clamp=True):
+        """
+        Pulse widths the joints are sent to, clamped like Servo.position
+
+        :param bool clamp: (Optional) False to keep targets outside the servo limits
+        :return: ``(servo, pulse width)`` per joint
+        :rtype: list(tuple)
+        """
+        ret = []
+        for joint_name, deg, rad, pos in self.joints:
+            servo = ssc[joint_name]
+            if rad is not None:
+                deg = math.degrees(rad)
+            if deg is not None:
+                pos = servo.pwm_from_degrees(float(deg))
+            pos = int(pos)
+            if clamp:
+                pos = min(max(pos, servo.min), servo.max)
+            ret.append((servo, pos))
+        return ret
+
+    def has_variables(self):
+        """
+        :return: True if a value is a ``$name`` variable
+        :rtype: bool
+        """
+        if _is_variable(self.time) or _is_variable(self.wait):
+            return True
+        for _, deg, rad, pos in self.joints:
+            if _is_variable(deg) or _is_variable(rad) or _is_variable(pos):
+                return True
+        return False
+
+    def bind(self, env):
+        """
+        Movement with its variables replaced by their values
+
+        :param env: Variable values by name
+        :type env: dict
+        :return: A new movement, or this one if it has no variables
+        :rtype: ssc32.Movement
+        :raise ScriptError: if a variable is undefined or not a number
+        """
+        if not self.has_variables():
+            return self
+        ret = Movement.__new__(Movement)
+        ret.time = _resolve(self.time, env, float)
+        ret.wait = _resolve(self.wait, env, float)
+        ret.joints = [(joint, _resolve(deg, env, float), _resolve(rad, env, float),
+                       _resolve(pos, env, _pulse))
+                      for joint, deg, rad, pos in self.joints]
+        return ret
+
+    def run(self, ssc, time_):
+        self.apply(ssc)
 
         time_i = self.time if self.time else time_
         time_i = int(time_i * 1000)
 
         ssc.commit(time=time_i)
         while not ssc.is_done():
-            time.sleep(0.01)
-        time.sleep(self.wait)
+            ssc.clock.sleep(0.01)
+        ssc.clock.sleep(self.wait)
 
     def __cmp__(self, obj):
         if not isinstance(obj, Movement):
@@ -73,7 +262,7 @@ class Movement(yaml.YAMLObject):
 
     def __getstate__(self):
         d = {'time': self.time,
-             'wait': self.time}
+             'wait': self.wait}
         for joint, deg, rad, pos in self.joints:
             if deg is not None:
                 mv = {'deg': deg}
@@ -86,8 +275,8 @@ class Movement(yaml.YAMLObject):
 
     def __setstate__(self, data):
         self.joints = []
-        self.time = float(data.pop('time', 0))
-        self.wait = float(data.pop('wait', 0))
+        self.time = _number(data.pop('time', 0), float)
+        self.wait = _number(data.pop('wait', 0), float)
         
         if sys.version_info >= (3, 0):
             items = data.items()
@@ -106,25 +295,291 @@ class Movement(yaml.YAMLObject):
             self.time, self.wait, self.joints)
 
 
+class Repeat(yaml.YAMLObject):
+    """
+    Movements played `count` times. Iterations share the same movement
+    objects, so the node has the same size whatever the count.
+
+    ``var``, if given, names a variable holding the iteration number, from 0.
+    """
+    yaml_tag = '!Repeat'
+
+    def __init__(self, count, movements=None, var=None):
+        """
+        :param count: Number of iterations, or a ``$name`` variable
+        :type count: int or str
+        :param list movements: (Optional) Movements and loops to repeat
+        :param str var: (Optional) Variable holding the iteration number
+        """
+        self.count = _number(count, int)
+        self.var = var
+        self.movements = list(movements or [])
+
+    def iter_movements(self, env):
+        """
+        :param env: Variables of the enclosing scope
+        :rtype: iterator of ssc32.Movement
+        """
+        for i in range(_resolve(self.count, env, int)):
+            scope = env if self.var is None else _Scope(env, self.var, i)
+            for move in _expand(self.movements, scope):
+                yield move
+
+    def movement_count(self, env):
+        """
+        :param env: Variables of the enclosing scope
+        :rtype: int
+        """
+        count = _resolve(self.count, env, int)
+        if self.var is None:
+            return count*_count(self.movements, env)
+        return sum(_count(self.movements, _Scope(env, self.var, i)) for i in range(count))
+
+    def __getstate__(self):
+        d = {'count': self.count,
+             'movements': self.movements}
+        if self.var is not None:
+            d['var'] = self.var
+        return d
+
+    def __setstate__(self, data):
+        if 'count' not in data:
+            raise ScriptError('!Repeat needs a count')
+        self.count = _number(data['count'], int)
+        self.var = data.get('var')
+        self.movements = data.get('movements') or []
+
+    def __repr__(self):
+        return '<Repeat count={0} {1}>'.format(self.count, self.movements)
+
+
+class Sweep(yaml.YAMLObject):
+    """
+    Movements played once per value of a variable, from `start` to `stop`
+    included, by `step` or in `count` evenly spaced values
+    """
+    yaml_tag = '!Sweep'
+
+    def __init__(self, var, start, stop, step=None, count=None, movements=None):
+        """
+        :param str var: Variable holding the current value
+        :param float start: First value
+        :param float stop: Last value, reached if a whole number of steps away
+        :param float step: (Optional) Difference between two values
+        :param int count: (Optional) Number of values, instead of `step`
+        :param list movements: (Optional) Movements and loops played for each value
+        """
+        self.__setstate__({'var': var, 'start': start, 'stop': stop, 'step': step,
+                           'count': count, 'movements': movements})
+
+    def _range(self, env):
+        """
+        :return: ``(start, step, number of values)``
+        """
+        start = _resolve(self.start, env, float)
+        stop = _resolve(self.stop, env, float)
+        if self.count is not None:
+            count = _resolve(self.count, env, int)
+            step = (stop - start)/(count - 1) if count > 1 else 0.0
+            return start, step, max(count, 0)
+
+        step = _resolve(self.step, env, float)
+        if step == 0 or (stop - start)*step < 0:
+            raise ScriptError('!Sweep step {0} does not go from {1} to {2}'.format(step, start, stop))
+        return start, step, int(math.floor((stop - start)/step + 1e-9)) + 1
+
+    def values(self, env):
+        """
+        :param env: Variables of the enclosing scope
+        :rtype: iterator of float
+        """
+        start, step, count = self._range(env)
+        for i in range(count):
+            yield start + i*step
+
+    def iter_movements(self, env):
+        """
+        :param env: Variables of the enclosing scope
+        :rtype: iterator of ssc32.Movement
+        """
+        for value in self.values(env):
+            for move in _expand(self.movements, _Scope(env, self.var, value)):
+                yield move
+
+    def movement_count(self, env):
+        """
+        :param env: Variables of the enclosing scope
+        :rtype: int
+        """
+        return sum(_count(self.movements, _Scope(env, self.var, value)) for value in self.values(env))
+
+    def __getstate__(self):
+        d = {'var': self.var,
+             'start': self.start,
+             'stop': self.stop,
+             'movements': self.movements}
+        if self.count is not None:
+            d['count'] = self.count
+        else:
+            d['step'] = self.step
+        return d
+
+    def __setstate__(self, data):
+        for key in ('var', 'start', 'stop'):
+            if data.get(key) is None:
+                raise ScriptError('!Sweep needs a {0}'.format(key))
+        if data.get('step') is None and data.get('count') is None:
+            raise ScriptError('!Sweep needs a step or a count')
+        self.var = data['var']
+        self.start = _number(data['start'], float)
+        self.stop = _number(data['stop'], float)
+        self.step = None if data.get('step') is None else _number(data['step'], float)
+        self.count = None if data.get('count') is None else _number(data['count'], int)
+        self.movements = data.get('movements') or []
+
+    def __repr__(self):
+        return '<Sweep {0}={1}..{2} {3}>'.format(self.var, self.start, self.stop, self.movements)
+
+
 class Script(yaml.YAMLObject):
     yaml_tag = '!Script'
 
-    def __init__(self, time=None):
+    def __init__(self, time=None, vars=None):
         self.time = time
+        self.vars = dict(vars or {})
         self.movements = []
         self.on_movement_done = lambda pn, movement: None
+        self._stop = threading.Event()
 
     def add(self, **kvargs):
         self.movements.append(Movement(**kvargs))
 
+    def iter_movements(self):
+        """
+        Iterate over the movements in playing order. Loops are unrolled and
+        variables bound as the iteration goes.
+        
+        :rtype: iterator of ssc32.Movement
+        """
+        return _expand(self.movements, self.vars)
+
+    def iter_templates(self):
+        """
+        Iterate over the movements as written: once each, loops not
+        repeated and variables not bound. Joint names are the same as
+        when playing.
+
+        :rtype: iterator of ssc32.Movement
+        """
+        return _templates(self.movements)
+
+    def movement_count(self):
+        """
+        Number of movements, or None if unknown before playing
+        
+        :rtype: int or None
+        """
+        return _count(self.movements, self.vars)
+
     def run(self, ssc):
+        self._stop.clear()
         autocommit = ssc.autocommit
         ssc.autocommit = None
-        ml = len(self.movements)
-        for no, move in enumerate(self.movements):
-            move.run(ssc, self.time)
-            self.on_movement_done((no+1, ml), move)
-        ssc.autocommit = autocommit
+        ml = self.movement_count()
+        try:
+            for no, move in enumerate(self.iter_movements()):
+                if self._stop.is_set():
+                    break
+                move.run(ssc, self.time)
+                self.on_movement_done((no+1, ml), move)
+        finally:
+            ssc.autocommit = autocommit
+
+    def stop(self):
+        """
+        Stop run() after the current movement. May be called from another thread.
+        """
+        self._stop.set()
+
+    def optimize(self, ssc, merge=True):
+        """
+        Return an equivalent script that sends less
+
+        - Joints commanded to the pulse width they already hold are dropped.
+        - A movement left without joints only waits, so its wait is added to
+          the previous movement and it is removed.
+        - With `merge`, a movement that follows one with ``wait: 0``, has the
+          same time and touches other servos is sent in the same frame. The
+          two then move together instead of one after the other.
+
+        Movements are copied, this script is not modified. Loops are
+        unrolled: the optimized script holds one movement per frame.
+
+        :param ssc: Controller whose servo limits and calibrations turn angles into pulse widths
+        :type ssc: ssc32.SSC32
+        :param bool merge: (Optional) Merge zero-wait movements into shared frames
+        :return: ``(optimized script, report)``
+        :rtype: tuple(ssc32.Script, ssc32.OptimizeReport)
+        """
+        report = OptimizeReport()
+        held = {}
+        ret = Script(time=self.time)
+        out = []   # (movement, effective time, channels, targets)
+
+        for move in self.iter_movements():
+            time_ = move.time if move.time else self.time
+            targets = move.targets(ssc)
+            report._add_before(targets, time_)
+
+            joints = []
+            kept = []
+            for joint, (servo, pwm) in zip(move.joints, targets):
+                if held.get(servo.num) == pwm:
+                    report.joints_dropped += 1
+                    continue
+                held[servo.num] = pwm
+                joints.append(joint)
+                kept.append((servo, pwm))
+
+            new = Movement(time=move.time, wait=move.wait)
+            new.joints = joints
+            channels = set(servo.num for servo, _ in kept)
+
+            if not joints and out:
+                out[-1][0].wait += move.wait
+                report.collapsed += 1
+                continue
+
+            if merge and joints and out:
+                last, last_time, last_channels, last_targets = out[-1]
+                if last.wait == 0 and last.joints and last_time == time_ and \
+                        not (channels & last_channels):
+                    last.joints += joints
+                    last.wait = move.wait
+                    last_channels |= channels
+                    last_targets += kept
+                    report.merged += 1
+                    continue
+
+            out.append((new, time_, channels, kept))
+
+        for move, time_, _, targets in out:
+            ret.movements.append(move)
+            report._add_after(targets, time_)
+        return ret, report
+
+    def analyze(self, ssc, baudrate=None):
+        """
+        Time the script without a board: total duration, serial time and bytes
+        of every movement, peak traffic and movements that overrun the link.
+        See ssc32.analysis.
+
+        :param ssc: Controller whose servos resolve the joints, or a servo configuration file
+        :type ssc: ssc32.SSC32 or str
+        :param int baudrate: (Optional) Default: the controller's or the configuration's
+        :rtype: ssc32.analysis.ScriptProfile
+        """
+        return analyze(self, ssc, baudrate)
 
     def __call__(self, ssc):
         self.run(ssc)
@@ -136,7 +591,7 @@ class Script(yaml.YAMLObject):
                 cmp(self.movements, obj.movements)
 
     def __add__(self, obj):
-        cls = Script(time=self.time)
+        cls = Script(time=self.time, vars=self.vars)
         cls.movements = copy(self.movements)
 
         if isinstance(obj, dict):
@@ -145,6 +600,7 @@ class Script(yaml.YAMLObject):
             cls.movements.append(obj)
         elif isinstance(obj, Script):
             cls.movements += obj.movements
+            cls.vars.update(obj.vars)
         elif isinstance(obj, (tuple, list)):
             for i in obj:
                 self.__add__(i)
@@ -154,13 +610,476 @@ class Script(yaml.YAMLObject):
         return cls
 
     def __getstate__(self):
-        return {'time': self.time,
-                'movements': self.movements}
+        d = {'time': self.time,
+             'movements': self.movements}
+        if self.vars:
+            d['vars'] = self.vars
+        return d
 
     def __setstate__(self, data):
         self.time = data.pop('time', 0)
+        self.vars = data.pop('vars', None) or {}
         self.movements = data.pop('movements', [])
+        self.on_movement_done = lambda pn, movement: None
+        self._stop = threading.Event()
 
     def __repr__(self):
         return '<Script time={0} {1}>'.format(
             self.time, self.movements)
+
+
+def _frame_cost(targets, time_):
+    """
+    Bytes written and read by Movement.run() for one movement, assuming one Q poll
+    """
+    line = ''.join('#{0}P{1}'.format(servo.num, pwm) for servo, pwm in targets)
+    if line != '' and time_:
+        line += 'T{0}'.format(int(time_*1000))
+    return len(line) + 1 + len('Q\r') + 1
+
+
+class OptimizeReport(object):
+    """
+    What Script.optimize() changed. Bytes count both directions; each
+    movement costs at least one round trip, its movement-done poll.
+    """
+
+    def __init__(self):
+        self.joints_dropped = 0
+        self.merged = 0
+        self.collapsed = 0
+        self.movements_before = 0
+        self.movements_after = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+
+    def _add_before(self, targets, time_):
+        self.movements_before += 1
+        self.bytes_before += _frame_cost(targets, time_)
+
+    def _add_after(self, targets, time_):
+        self.movements_after += 1
+        self.bytes_after += _frame_cost(targets, time_)
+
+    @property
+    def bytes_saved(self):
+        """
+        :type: int
+        """
+        return self.bytes_before - self.bytes_after
+
+    @property
+    def round_trips_saved(self):
+        """
+        :type: int
+        """
+        return self.movements_before - self.movements_after
+
+    def __repr__(self):
+        return ('<OptimizeReport movements={0.movements_before}->{0.movements_after} '
+                'joints_dropped={0.joints_dropped} merged={0.merged} collapsed={0.collapsed} '
+                'bytes_saved={0.bytes_saved} round_trips_saved={0.round_trips_saved}>').format(self)
+
+
+class MultiTrackPlayer(object):
+    """
+    Plays several scripts at once on disjoint groups of servos
+
+    Each script claims a set of servos, by default every joint its movements
+    use. Overlapping claims are rejected when the script is added. Playback
+    merges the movements of all scripts onto one timeline: a movement starts
+    `time` + `wait` seconds after the previous one of the same script, and all
+    movements starting together go out as one frame. Since a frame has a
+    single ``T``, each servo gets its own speed (``S``) instead, so every
+    script keeps its own movement times.
+
+    Unlike Script.run(), movements are not waited on with is_done(): the
+    board only reports completion for all servos at once.
+
+    Example:
+    ::
+
+        player = ssc32.MultiTrackPlayer(ssc)
+        player.add(grip_script, claim=['grip'])
+        player.add(arm_script)
+        player.run()
+    """
+
+    def __init__(self, ssc):
+        """
+        :type ssc: ssc32.SSC32
+        """
+        self.ssc = ssc
+        self.tracks = []
+
+    def _claim(self, script):
+        names = set()
+        for move in script.iter_templates():
+            for joint in move.joints:
+                names.add(joint[0])
+        return names
+
+    def add(self, script, claim=None):
+        """
+        Add a script to play
+
+        :type script: ssc32.Script
+        :param list claim: (Optional) Servo names or numbers the script may move. Default: the joints it uses
+        :return: Claimed channels
+        :rtype: set(int)
+        :raise ScriptError: if a servo is already claimed, or the script moves a servo outside its claim
+        """
+        channels = set(self.ssc[c].num for c in (claim if claim is not None else self._claim(script)))
+        used = set(self.ssc[c].num for c in self._claim(script))
+        if not used <= channels:
+            raise ScriptError('script moves unclaimed servos {0}'.format(sorted(used - channels)))
+
+        for no, (_, other_channels) in enumerate(self.tracks):
+            taken = channels & other_channels
+            if taken:
+                raise ScriptError('servos {0} are already claimed by track {1}'.format(sorted(taken), no))
+
+        self.tracks.append((script, channels))
+        return channels
+
+    def _duration(self, i, move):
+        script = self.tracks[i][0]
+        return move.time if move.time else script.time or 0
+
+    def _timeline(self):
+        """
+        Yield ``(start, [(track, number, movement), ...])`` for every start time, in order
+        """
+        heap = []
+        for i, (script, _) in enumerate(self.tracks):
+            movements = script.iter_movements()
+            for move in movements:
+                heap.append((0.0, i, 1, move, movements))
+                break
+        heapq.heapify(heap)
+
+        while heap:
+            start = heap[0][0]
+            group = []
+            while heap and heap[0][0] == start:
+                _, i, no, move, movements = heapq.heappop(heap)
+                group.append((i, no, move))
+                for nxt in movements:
+                    end = start + self._duration(i, move) + move.wait
+                    heapq.heappush(heap, (end, i, no + 1, nxt, movements))
+                    break
+            yield start, group
+
+    def _frame(self, group):
+        """
+        Command line for the movements of one start time, each servo timed by its own script
+        """
+        cmd = ''
+        for i, _, move in group:
+            time_ = self._duration(i, move)
+            before = dict((s.num, s._pos) for s in (self.ssc[j[0]] for j in move.joints))
+            for servo in move.apply(self.ssc):
+                speed = None
+                if time_ > 0 and before[servo.num] is not None:
+                    delta = abs(servo._pos - before[servo.num])
+                    if delta > 0:
+                        speed = max(1, int(delta/time_))
+                cmd += servo._get_cmd_string(speed)
+        return cmd
+
+    def run(self):
+        """
+        Play all scripts until the last one ends. Each script's
+        on_movement_done is called once the movement's time and wait are over.
+        """
+        autocommit = self.ssc.autocommit
+        self.ssc.autocommit = None
+        counts = [script.movement_count() for script, _ in self.tracks]
+        ending = []
+        t0 = self.ssc.clock.time()
+        try:
+            for start, group in self._timeline():
+                self._wait(start, t0)
+                self._report(ending, start, counts)
+
+                cmd = self._frame(group)
+                if cmd != '':
+                    self.ssc._send(cmd)
+
+                for i, no, move in group:
+                    heapq.heappush(ending, (start + self._duration(i, move) + move.wait, i, no, move))
+
+            while ending:
+                self._wait(ending[0][0], t0)
+                self._report(ending, ending[0][0], counts)
+        finally:
+            self.ssc.autocommit = autocommit
+
+    def _report(self, ending, now, counts):
+        while ending and ending[0][0] <= now:
+            _, i, no, move = heapq.heappop(ending)
+            self.tracks[i][0].on_movement_done((no, counts[i]), move)
+
+    def _wait(self, at, t0):
+        delay = t0 + at - self.ssc.clock.time()
+        if delay > 0:
+            self.ssc.clock.sleep(delay)
+
+
+class ScriptLoader(yaml.SafeLoader):
+    """
+    YAML loader building scripts and plain data only, for files from
+    untrusted sources (``yaml.Loader`` would build any Python object)
+    """
+
+for _cls in (Movement, Repeat, Sweep, Script):
+    ScriptLoader.add_constructor(_cls.yaml_tag, _cls.from_yaml)
+del _cls
+
+
+def iter_yaml_movements(stream, script=None):
+    """
+    Parse the movements of a ``!Script`` document one at a time
+
+    Only the movement being built is held in memory (plus anchored nodes,
+    which aliases may refer to later).
+
+    :param stream: Open file or string holding a ``!Script`` document
+    :param script: (Optional) Object whose `time` and `vars` are set when the document's keys are read
+    :return: Movements and loops (Repeat, Sweep), as written
+    :rtype: iterator
+    :raise ScriptError: if the document is not a mapping
+    """
+    loader = yaml.Loader(stream)
+    try:
+        loader.get_event()  # StreamStart
+        loader.get_event()  # DocumentStart
+        if not loader.check_event(yaml.MappingStartEvent):
+            raise ScriptError('expected a !Script mapping')
+        loader.get_event()
+
+        while not loader.check_event(yaml.MappingEndEvent):
+            key = loader.construct_object(loader.compose_node(None, None))
+            if key == 'movements' and loader.check_event(yaml.SequenceStartEvent):
+                loader.get_event()
+                while not loader.check_event(yaml.SequenceEndEvent):
+                    move = loader.construct_object(loader.compose_node(None, None), deep=True)
+                    loader.constructed_objects = {}
+                    yield move
+                loader.get_event()
+            else:
+                value = loader.construct_object(loader.compose_node(None, None), deep=True)
+                if key in ('time', 'vars') and script is not None:
+                    setattr(script, key, value)
+    finally:
+        loader.dispose()
+
+
+def iter_record_lines(stream):
+    """
+    Decode line-delimited records. Lines are JSON, or YAML flow mappings.
+
+    :param stream: Open file or iterable of lines
+    :rtype: iterator of dict
+    """
+    for line in stream:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield yaml.safe_load(line)
+
+
+def iter_record_movements(stream, script=None):
+    """
+    Parse line-delimited movement records, one flow mapping per line:
+    ::
+
+        {"script": {"time": 1.0}}
+        {"time": 0.5, "wait": 0, "joint0": {"deg": -60}, "grip": {"pos": 2400}}
+
+    Blank lines and lines starting with ``#`` are skipped.
+
+    :param stream: Open file or iterable of lines
+    :param script: (Optional) Object whose attributes are set by ``script`` records
+    :rtype: iterator of ssc32.Movement
+    """
+    for data in iter_record_lines(stream):
+        if 'script' in data:
+            if script is not None:
+                for k, v in data['script'].items():
+                    setattr(script, k, v)
+            continue
+
+        move = Movement.__new__(Movement)
+        move.__setstate__(data)
+        yield move
+
+
+def write_records(script, stream):
+    """
+    Write a script as line-delimited movement records
+
+    :type script: ssc32.Script
+    :param stream: Open text file
+    """
+    stream.write(json.dumps({'script': {'time': script.time}}) + '\n')
+    for move in script.iter_movements():
+        stream.write(json.dumps(move.__getstate__(), sort_keys=True) + '\n')
+
+
+class StreamingScript(Script):
+    """
+    Script read from a file while it plays
+
+    Movements are parsed lazily, so playback starts as soon as the first one
+    is read and memory use does not depend on the script length. The file can
+    be a ``!Script`` YAML document or line-delimited records (see
+    iter_record_movements()); the format is detected from the first line.
+
+    Example:
+    ::
+
+        script = ssc32.StreamingScript('recorded.yaml')
+        script.run(ssc)
+    """
+
+    def __init__(self, filename, time=None):
+        """
+        :param str filename: Script file
+        :param float time: (Optional) Default movement time, overrides the file's
+        """
+        self.filename = filename
+        self._time = time
+        self._vars = None
+        self.on_movement_done = lambda pn, movement: None
+        self._stop = threading.Event()
+
+    @property
+    def time(self):
+        """
+        Default movement time. Documents written by yaml.dump() store it after
+        the movements, in which case the file is scanned for it on first use.
+
+        :type: float
+        """
+        if self._time is None:
+            self._time = float(self._scan('time') or 0)
+        return self._time
+
+    @time.setter
+    def time(self, value):
+        self._time = value
+
+    @property
+    def vars(self):
+        """
+        Script variables, scanned for on first use like `time`
+
+        :type: dict
+        """
+        if self._vars is None:
+            self._vars = self._scan('vars') or {}
+        return self._vars
+
+    @vars.setter
+    def vars(self, value):
+        self._vars = value
+
+    @property
+    def movements(self):
+        """
+        Fresh iterator over the movements
+
+        :type: iterator of ssc32.Movement
+        """
+        return self.iter_movements()
+
+    def _is_records(self, fd):
+        for line in fd:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                fd.seek(0)
+                return line.startswith('{')
+        fd.seek(0)
+        return False
+
+    def _items(self):
+        with open(self.filename, 'r') as fd:
+            if self._is_records(fd):
+                parse = iter_record_movements
+            else:
+                parse = iter_yaml_movements
+            for item in parse(fd, self if self._time is None else None):
+                yield item
+
+    def iter_movements(self):
+        ## Variables are looked up once a movement needs them
+        env = _LazyVars(self)
+        for item in self._items():
+            for move in _expand((item,), env):
+                yield move
+
+    def iter_templates(self):
+        return _templates(self._items())
+
+    def movement_count(self):
+        return None
+
+    def _scan(self, key):
+        """
+        Value of a top level key of the file, None if it is missing
+        """
+        with open(self.filename, 'r') as fd:
+            if self._is_records(fd):
+                for data in iter_record_lines(fd):
+                    if 'script' in data:
+                        return data['script'].get(key)
+                return None
+
+            ## Walk the top level mapping keys without building any movement
+            loader = yaml.Loader(fd)
+            try:
+                loader.get_event()  # StreamStart
+                loader.get_event()  # DocumentStart
+                if not loader.check_event(yaml.MappingStartEvent):
+                    return None
+                loader.get_event()
+                while not loader.check_event(yaml.MappingEndEvent):
+                    name = loader.construct_object(loader.compose_node(None, None))
+                    if name == key:
+                        return loader.construct_object(loader.compose_node(None, None), deep=True)
+                    depth = 0
+                    while True:
+                        event = loader.get_event()
+                        if isinstance(event, yaml.CollectionStartEvent):
+                            depth += 1
+                        elif isinstance(event, yaml.CollectionEndEvent):
+                            depth -= 1
+                        if depth == 0:
+                            break
+            finally:
+                loader.dispose()
+        return None
+
+    def __getstate__(self):
+        return {'time': self.time,
+                'movements': list(self.iter_movements())}
+
+    def __repr__(self):
+        return '<StreamingScript {0!r} time={1}>'.format(self.filename, self._time)
+
+
+class _LazyVars(object):
+    """
+    Variables of a StreamingScript, read from the file on first lookup
+    """
+    __slots__ = ('script',)
+
+    def __init__(self, script):
+        self.script = script
+
+    def __getitem__(self, name):
+        return self.script.vars[name]
@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+Shared-memory servo targets for controllers in other processes.
+
+A ControlBlock is a small ``multiprocessing.shared_memory`` segment:
+::
+
+    offset  0   8s        magic
+            8   I I       version, channels
+           16   Q         sequence: odd while a writer is updating
+           24   Q         last sequence applied by the driver
+           32   I I       dirty mask (bit n: channel n has a new target), move time (ms, 0 for none)
+           40   32 i      target pulse widths (0: none)
+          168   32 i      speeds (0: none)
+
+Other processes write targets straight into the segment, with no
+serialization; a SharedTargetDriver in the process owning the SSC32 picks
+them up and commits them. The sequence counter works as a seqlock, so the
+driver never applies a half-written update. A writer starts a new dirty
+mask once the driver has acknowledged the previous one, and adds to it
+otherwise, so no update is lost between two driver ticks.
+
+There must be one writer at a time; writers in several processes share a
+``multiprocessing.Lock`` passed as `lock`.
+
+Example:
+::
+
+    ## In the process owning the board
+    driver = SharedTargetDriver(ssc, name='arm')
+    driver.start()
+
+    ## In the vision process
+    block = ControlBlock('arm')
+    block.set_targets({0: 1500, 1: 1800}, time=100)
+"""
+
+import os
+import sys
+import struct
+import threading
+
+try:
+    from multiprocessing import shared_memory, resource_tracker
+except ImportError:
+    shared_memory = resource_tracker = None
+
+from .protocol import PORT_ERRORS
+
+__all__ = [
+    'ControlBlock',
+    'SharedTargetDriver',
+]
+
+MAGIC = b'SSC32SHM'
+VERSION = 1
+CHANNELS = 32
+
+_HEADER = struct.Struct('<8sII')
+_SEQ = 16
+_ACK = 24
+_DIRTY = 32
+_TIME = 36
+_TARGETS = 40
+_SPEEDS = _TARGETS + 4*CHANNELS
+SIZE = _SPEEDS + 4*CHANNELS
+
+
+def _require_shared_memory():
+    if shared_memory is None:
+        raise ImportError("multiprocessing.shared_memory (Python 3.8+) is required for control blocks")
+
+
+class _NoTracker(object):
+    """
+    Stands in for the resource tracker, like ``track=False`` on Python 3.13+
+    """
+
+    @staticmethod
+    def register(name, rtype):
+        pass
+
+    @staticmethod
+    def unregister(name, rtype):
+        pass
+
+
+_tracker_lock = threading.Lock()
+
+
+def _untracked(func, *args, **kwargs):
+    """
+    Call `func` without telling this process's resource tracker. The
+    tracker may be the creator's (forked or spawned processes share it),
+    and it would unlink the segment when the process exits.
+    """
+    with _tracker_lock:
+        tracker = shared_memory.resource_tracker
+        shared_memory.resource_tracker = _NoTracker
+        try:
+            return func(*args, **kwargs)
+        finally:
+            shared_memory.resource_tracker = tracker
+
+
+class ControlBlock(object):
+    """
+    Servo targets in shared memory
+    """
+
+    def __init__(self, name=None, create=False, lock=None):
+        """
+        :param str name: (Optional) Segment name. Default with `create`: a generated one, see `name`
+        :param bool create: (Optional) Create the segment instead of attaching to it
+        :param lock: (Optional) Lock shared by the writers, eg. a multiprocessing.Lock
+        :raise ValueError: if an existing segment is not a control block
+        """
+        _require_shared_memory()
+        self._created = create
+        if create:
+            self._shm = shared_memory.SharedMemory(name, create=True, size=SIZE)
+            self._shm.buf[:SIZE] = b'\0'*SIZE
+            _HEADER.pack_into(self._shm.buf, 0, MAGIC, VERSION, CHANNELS)
+        elif sys.version_info >= (3, 13):
+            ## Only the creator unlinks the segment
+            self._shm = shared_memory.SharedMemory(name, track=False)
+        else:
+            self._shm = _untracked(shared_memory.SharedMemory, name)
+
+        magic, version, channels = _HEADER.unpack_from(self._shm.buf, 0)
+        if magic != MAGIC or version != VERSION:
+            self._shm.close()
+            raise ValueError('{0} is not an SSC32 control block'.format(name))
+
+        self.name = self._shm.name
+        self.lock = lock
+        self._unlinked = False
+        buf = self._shm.buf
+        self._words = buf[_SEQ:_DIRTY].cast('Q')
+        self._head = buf[_DIRTY:_TARGETS].cast('I')
+        self.targets = buf[_TARGETS:_SPEEDS].cast('i')
+        self.speeds = buf[_SPEEDS:SIZE].cast('i')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __repr__(self):
+        return '<ControlBlock {0!r} seq={1}>'.format(self.name, self.sequence)
+
+    @property
+    def sequence(self):
+        """
+        Number of updates written, times two
+
+        :type: int
+        """
+        return self._words[0]
+
+    ##########
+    ## WRITER SIDE
+    ##########
+    def set_targets(self, targets, speeds=None, time=None):
+        """
+        Publish new targets
+
+        :param dict targets: Pulse width per servo number
+        :param dict speeds: (Optional) Speed per servo number, 0 to clear
+        :param int time: (Optional) Move time in ms for the commit
+        """
+        mask = 0
+        if self.lock is not None:
+            self.lock.acquire()
+        try:
+            self._begin()
+            for channel, pulse in targets.items():
+                self.targets[channel] = int(pulse)
+                mask |= 1 << channel
+            for channel, speed in (speeds or {}).items():
+                self.speeds[channel] = int(speed)
+                mask |= 1 << channel
+            self._end(mask, time)
+        finally:
+            if self.lock is not None:
+                self.lock.release()
+
+    def _begin(self):
+        seq = self._words[0]
+        if self._words[1] == seq:
+            ## The driver has applied everything: start a new mask
+            self._head[0] = 0
+        self._words[0] = seq + 1
+
+    def _end(self, mask, time):
+        self._head[0] |= mask
+        self._head[1] = int(time or 0)
+        self._words[0] += 1
+
+    ##########
+    ## DRIVER SIDE
+    ##########
+    def read(self, since=None):
+        """
+        Take a consistent copy of the block if it changed, and acknowledge it
+
+        :param int since: (Optional) Sequence of the last update read
+        :return: ``(sequence, dirty mask, time, targets, speeds)``, or None if
+            nothing changed or a writer is busy
+        :rtype: tuple or None
+        """
+        seq = self._words[0]
+        if seq & 1 or seq == since:
+            return None
+        dirty, time_ms = self._head[0], self._head[1]
+        targets = self.targets.tolist()
+        speeds = self.speeds.tolist()
+        if self._words[0] != seq:
+            return None
+        self._words[1] = seq
+        return seq, dirty, time_ms, targets, speeds
+
+    def close(self):
+        """
+        Detach from the segment
+        """
+        for view in (self._words, self._head, self.targets, self.speeds):
+            view.release()
+        self._shm.close()
+
+    def unlink(self):
+        """
+        Destroy the segment. Called by its creator once every process is done.
+        A segment already destroyed is ignored.
+        """
+        if self._unlinked:
+            return
+        self._unlinked = True
+        try:
+            if self._created:
+                self._shm.unlink()
+            else:
+                _untracked(self._shm.unlink)
+        except FileNotFoundError:
+            ## Destroyed by another process: stop tracking it
+            if self._created and os.name == 'posix':
+                resource_tracker.unregister(self._shm._name, 'shared_memory')
+
+
+class SharedTargetDriver(object):
+    """
+    Commits the targets written to a ControlBlock, from the process owning the SSC32
+
+    A failed commit does not stop the thread: `error_count` counts them and
+    `last_error` holds the latest.
+    """
+
+    def __init__(self, ssc, name=None, period=0.005, block=None):
+        """
+        :type ssc: ssc32.SSC32
+        :param str name: (Optional) Name of the segment to create. Default: generated, see `name`
+        :param float period: (Optional) Poll period in seconds
+        :param block: (Optional) Existing block to read instead of creating one
+        :type block: ssc32.shm.ControlBlock
+        """
+        self.ssc = ssc
+        self.period = period
+        self._own = block is None
+        self.block = ControlBlock(name, create=True) if block is None else block
+        self.name = self.block.name
+        self.sequence = None
+        self.error_count = 0
+        self.last_error = None
+        self._servos = dict((s.num, s) for s in ssc._servos)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def poll(self):
+        """
+        Apply and commit the latest update, if any
+
+        :return: Servo numbers moved
+        :rtype: list(int)
+        """
+        update = self.block.read(self.sequence)
+        if update is None:
+            return []
+        self.sequence, dirty, time_ms, targets, speeds = update
+
+        moved = []
+        autocommit = self.ssc.autocommit
+        self.ssc.autocommit = None
+        try:
+            for num, servo in self._servos.items():
+                if not dirty >> num & 1:
+                    continue
+                servo._speed = speeds[num] or None
+                if targets[num]:
+                    servo.position = targets[num]
+                    moved.append(num)
+            self.ssc.commit(time_ms or None)
+        finally:
+            self.ssc.autocommit = autocommit
+        return moved
+
+    def _run(self):
+        while not self._stop.wait(self.period):
+            try:
+                self.poll()
+            except PORT_ERRORS as e:
+                self.last_error = e
+                self.error_count += 1
+
+    def start(self):
+        """
+        Poll on a background thread. Starts the controller's scheduler so
+        the commits can share the port with other threads.
+        """
+        if self._thread is not None:
+            return
+        self.ssc.start_scheduler()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='ssc32-shm')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop polling. A block created by the driver is closed and destroyed.
+        """
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        if self._own:
+            self.block.close()
+            self.block.unlink()
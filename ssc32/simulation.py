@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Run scripts against a simulated board on a virtual clock.
+
+Every wait in the library goes through ``SSC32.clock``; a VirtualClock
+advances instantly on sleep(), so a script plays as fast as its commands
+can be interpreted. The board follows ssc32.motion.MotionModel and keeps
+each trajectory, returned as arrays by SimulatedSSC32.timeline()
+(requires NumPy).
+
+Example:
+::
+
+    from ssc32.simulation import SimulatedSSC32
+
+    sim = SimulatedSSC32(config='examples/arm.cfg')
+    script = yaml.load(open('examples/present_joints.yaml'), Loader=yaml.Loader)
+    script.run(sim)
+
+    timeline = sim.timeline(step=0.01)
+    ## The first sample is taken before anything is sent
+    assert (timeline['joint1'][1:] >= sim['joint1'].min).all()
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .emulator import BoardEmulator, EmulatedPort, EmulatedSSC32
+
+__all__ = [
+    'VirtualClock',
+    'SimulatedPort',
+    'SimulatedSSC32',
+    'Timeline',
+]
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("NumPy is required for simulation timelines")
+
+
+class VirtualClock(object):
+    """
+    Clock whose sleep() only moves time forward
+    """
+
+    def __init__(self, start=0.0):
+        """
+        :param float start: (Optional) Initial time in seconds
+        """
+        self.now = float(start)
+
+    def time(self):
+        """
+        :return: Virtual time in seconds
+        :rtype: float
+        """
+        return self.now
+
+    def sleep(self, seconds):
+        """
+        :param float seconds: Time to skip
+        """
+        if seconds > 0:
+            self.now += seconds
+
+
+class SimulatedPort(EmulatedPort):
+    """
+    EmulatedPort charging the serial transfer time to the virtual clock:
+    10 bits per byte at the port's baud rate, each way
+    """
+
+    def __init__(self, board, clock, port='simulation', baudrate=115200, timeout=1):
+        super(SimulatedPort, self).__init__(board, port, baudrate, timeout)
+        self.clock = clock
+        self.bytes_written = 0
+        self.bytes_read = 0
+
+    def _transfer(self, count):
+        if self.baudrate:
+            self.clock.sleep(count*10.0/self.baudrate)
+
+    def write(self, data):
+        self._transfer(len(data))
+        self.bytes_written += len(data)
+        return super(SimulatedPort, self).write(data)
+
+    def read_into(self, b):
+        n = super(SimulatedPort, self).read_into(b)
+        self._transfer(n)
+        self.bytes_read += n
+        return n
+
+
+class Timeline(object):
+    """
+    Sampled joint states of a simulation
+
+    `pulses` has one row per entry of `times` and one column per entry of
+    `channels`. Columns can also be looked up by servo name or number.
+    """
+
+    def __init__(self, ssc, times, channels, pulses):
+        self.ssc = ssc
+        self.times = times
+        self.channels = list(channels)
+        self.pulses = pulses
+
+    def __len__(self):
+        return len(self.times)
+
+    def __repr__(self):
+        return '<Timeline samples={0} duration={1}s channels={2}>'.format(
+            len(self.times), self.times[-1] if len(self.times) else 0, self.channels)
+
+    def __getitem__(self, servo):
+        """
+        Pulse widths of one servo
+
+        :param servo: Servo index, name or instance
+        :rtype: numpy.ndarray
+        """
+        return self.pulses[:, self.channels.index(self.ssc[servo].num)]
+
+    def degrees(self, servo):
+        """
+        Angles of one servo, through its calibration if any
+
+        :param servo: Servo index, name or instance
+        :rtype: numpy.ndarray
+        """
+        servo = self.ssc[servo]
+        deg = (self[servo] - servo.pwm_center)/servo.pwm_per_degree
+        if servo.calibration is not None:
+            deg = np.array([servo.calibration.measured(d) for d in deg])
+        return deg
+
+
+class SimulatedSSC32(EmulatedSSC32):
+    """
+    EmulatedSSC32 on a VirtualClock, recording every trajectory
+    """
+
+    def __init__(self, port='simulation', baudrate=115200, count=32, timeout=1, config=None,
+                 autocommit=None, clock=None):
+        """
+        Same as SSC32. The baud rate sets the simulated transfer time.
+
+        :param clock: (Optional) Default: a new VirtualClock starting at 0
+        """
+        self.clock = clock if clock is not None else VirtualClock()
+        board = BoardEmulator(count, self.clock, record=True)
+        super(SimulatedSSC32, self).__init__(port, baudrate, count, timeout, config,
+                                             autocommit, self.clock, board)
+
+    def _transport(self, port, baudrate, timeout):
+        return SimulatedPort(self.board, self.clock, port, baudrate, timeout)
+
+    def timeline(self, step=0.01, channels=None, end=None):
+        """
+        Sample the recorded trajectories
+
+        :param float step: (Optional) Sample period in seconds
+        :param list channels: (Optional) Servos to include. Default: every named servo, or all if none has a name
+        :param float end: (Optional) Last sample time. Default: when the last move ends, or now if later
+        :rtype: ssc32.simulation.Timeline
+        """
+        _require_numpy()
+        if channels is None:
+            servos = [s for s in self._servos if s.name is not None] or self._servos
+        else:
+            servos = [self[c] for c in channels]
+        nums = [s.num for s in servos]
+
+        history = self.board.motion.history
+        if end is None:
+            end = max([self.clock.time()] + [history[ch][-1][0] for ch in nums])
+        times = np.arange(0.0, end + step/2, step)
+
+        pulses = np.empty((len(times), len(nums)), dtype=np.int64)
+        for k, ch in enumerate(nums):
+            t, p = np.array(history[ch], dtype=float).T
+            pulses[:, k] = np.rint(np.interp(times, t, p))
+        return Timeline(self, times, nums, pulses)
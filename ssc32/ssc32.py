@@ -6,11 +6,18 @@ SSC32 controlling library
 import serial
 import math
 import sys
-import struct
 import time
 import os
 import warnings
 import yaml
+from concurrent.futures import Future, CancelledError
+from .protocol import Request, ResponseReader, ShortReadError
+from .scheduler import CommandScheduler, PRIORITY_STOP, PRIORITY_MOTION, PRIORITY_QUERY
+from .calibration import Calibration
+from .transport import Transport, write_fd, read_fd_into
+from .estimator import PositionEstimator
+from .events import EventBus
+from .filters import FilterChain
 warnings.simplefilter("once")
 
 try:
@@ -19,7 +26,7 @@ except NameError:
     xrange = range
 
 __all__ = [
-    'SSC32', "Servo"
+    'SSC32', "Servo", "Pipeline"
 ]
 
 class SSC32(object):
@@ -44,42 +51,76 @@ class SSC32(object):
     
     
 
-    def __init__(self, port=None, baudrate=None, count=32, timeout=1, config=None, autocommit=None):
+    def __init__(self, port=None, baudrate=None, count=32, timeout=1, config=None, autocommit=None, clock=None,
+                 transport=None):
         """
         :param str port: (Optional if config not specified) Serial port
         :param int baudrate: (Optional if config not specified) Serial speed
         :param int count: (Optional) Servo count. On original SSC32 need to be set to 32
         :param str config: (Optional)  Configuration file which contains servo names and limits
         :param bool autocommit: (Optional) Autocommit changes as soon as the servo postion is changed
+        :param clock: (Optional) Object with ``time()`` and ``sleep()`` used by every wait. Default: the time module
+        :param transport: (Optional) Link to the board, instead of opening `port` (or the config's port) with SSC32Serial
+        :type transport: ssc32.transport.Transport
         
         :raise Exception: if "SSC32" not detected in the board's firmware version
         """
+        self.clock = clock if clock is not None else time
         self.config = None
         self.description = None
+        self.scheduler = None
+        self.estimator = None
+        self.events = None
+        self.filters = None
+        self._outputs = []
         self.autocommit = autocommit
+        self.ser = None
+        if transport is not None:
+            self._attach(transport)
         
         if config:
             self.load_config(config)
             
-        else:
-            self.ser = SSC32Serial(port, baudrate, timeout=timeout)
+        elif transport is None:
+            self._open_serial(port, baudrate, timeout)
         
         ## Create serial connection
         self.ser.flush()
-        self.ser.flushInput()
+        self.ser.reset_input()
         
         ## Check that this is actually an SSC32 board
-        version = self.get_firmware_version()
+        try:
+            version = self.get_firmware_version()
+        except ShortReadError:
+            version = ''
         if (not "SSC32" in version):
             raise Exception("Device on port {} is not a valid SSC32 board. Make sure the board is powered and baud rate is correct. Received firmware version: ".format(self.ser.port, version))
         
         if not config:
             self._servos = [Servo(self, self._servo_on_changed, i) for i in xrange(count)]
 
+    def _open_serial(self, port, baudrate, timeout):
+        """
+        Open the serial connection and the reply reader attached to it
+        """
+        self._attach(SSC32Serial(port, baudrate, timeout=timeout))
+    
+    def _attach(self, transport):
+        self.ser = transport
+        self._reader = ResponseReader(transport)
+
     def close(self):
         """
         Close serial port
         """
+        try:
+            self.stop_events()
+        except:
+            pass
+        try:
+            self.stop_scheduler()
+        except:
+            pass
         try:
             self.ser.close()
         except:
@@ -147,6 +188,90 @@ class SSC32(object):
         if self.autocommit is not None:
             self.commit(self.autocommit)   
             
+    def _request(self, request):
+        """
+        Send a query and decode its reply
+        
+        :type request: ssc32.protocol.Request
+        :raise ShortReadError: if the reply is incomplete
+        """
+        return self._requests([request])[0]
+            
+    def _requests(self, requests):
+        """
+        Send several queries back-to-back in one write and decode their replies,
+        which arrive in the same order. Goes through the scheduler if one is running.
+        
+        :param list requests: Instances of ssc32.protocol.Request
+        :return: Decoded replies
+        :rtype: list
+        :raise ShortReadError: if a reply is incomplete
+        """
+        if self.scheduler is not None and not self.scheduler.is_worker:
+            return self.scheduler.submit(requests=requests, priority=PRIORITY_QUERY).result()
+        return self._exchange(requests)
+    
+    def _send(self, line, priority=PRIORITY_MOTION):
+        """
+        Write a command line without reply. Goes through the scheduler if one is running.
+        Frames dropped by emergency_stop() are silently discarded.
+        
+        :param str line: Command line without CR
+        :param int priority: (Optional) Scheduler priority
+        """
+        if self.estimator is not None:
+            self.estimator.observe(line)
+        if self.scheduler is not None and not self.scheduler.is_worker:
+            try:
+                return self.scheduler.submit(line, priority=priority).result()
+            except CancelledError:
+                return None
+        return self._write_now(line)
+    
+    def _write_now(self, line):
+        self.ser.write_line(line)
+        ## Counted once written, so a poll queued after it also follows the move
+        if self.events is not None:
+            self.events.observe(line)
+    
+    def _exchange(self, requests):
+        """
+        Port side of _requests(). Stale input is dropped first so replies line up.
+        """
+        self.ser.reset_input()
+        self.ser.write_line('\r'.join(r.line for r in requests))
+        
+        lengths = [r.length for r in requests]
+        if None in lengths:
+            ## Some reply runs up to a CR, read them one by one
+            return [r.decode(self._reader.read_reply(r)) for r in requests]
+        
+        view = self._reader.read_exact(sum(lengths), ' '.join(r.line for r in requests))
+        ret = []
+        offset = 0
+        for r in requests:
+            ret.append(r.decode(view[offset:offset + r.length]))
+            offset += r.length
+        return ret
+    
+    def pipeline(self):
+        """
+        Collect queries and send them all at once
+        
+        :rtype: ssc32.Pipeline
+        
+        Example:
+        ::
+        
+            with ssc.pipeline() as p:
+                done = p.is_done()
+                pulses = [p.query_pulse_width(s) for s in range(4)]
+                inputs = p.read_analog_input("AB")
+            
+            print(done.result(), [f.result() for f in pulses], inputs.result())
+        """
+        return Pipeline(self)
+            
     
     ##########
     ## SSC32 MOTOR COMMANDS
@@ -157,14 +282,34 @@ class SSC32(object):
         
         :param int time: (Optional) Time in ms for entire move. Max: 65535
         """
+        line = self._commit_line(time)
+        outputs = self._take_outputs()
+        if outputs:
+            ## Same write as the move, outputs first
+            line = outputs + '\r' + line if line else outputs
+        elif line == '' and self.filters is not None:
+            ## Everything was filtered out
+            return
+        self._send(line)
+        
+        
+    def _commit_line(self, time=None):
+        """
+        Build the command line for all changed servos and mark them as sent
+        
+        :param int time: (Optional) Time in ms for entire move. Max: 65535
+        :rtype: str
+        """
+        if self.filters is not None:
+            return self.filters.commit_line(time)
         
         cmd = ''.join([self._servos[i]._get_cmd_string()
                        for i in xrange(len(self._servos))])
         
         if time is not None and cmd != '':
             cmd += 'T{0}'.format(time)
-
-        self.ser.write_line(cmd)
+        
+        return cmd
         
         
     def move_all_servos(self, time=None):
@@ -189,43 +334,85 @@ class SSC32(object):
         if time is not None and cmd != '':
             cmd += 'T{0}'.format(time)
 
-        self.ser.write_line(cmd)
+        self._send(cmd)
         
     
-    def set_binary_output(self, channel, level):
+    def set_binary_output(self, channel, level, defer=False):
         """
         Set the signal line on one of the servos to be HIGH or LOW
         
         :param channel: Servo index, name or instance
         :type channel: int or str or ssc32.Servo
         :param int level: Zero sets output to LOW, any other value sets to HIGH
+        :param bool defer: (Optional) Send with the next commit(), in the same write as the move
         """
+        self.set_outputs(pins={channel: level}, defer=defer)
         
-        if (level==0):
-            L = "L"
-        else:
-            L = "H"
-        
-        serv = self[channel]
-        self.ser.write_line('#{}{}'.format(serv.num, L))
-        
-    def set_byte_output(self, bank, value):
+    def set_byte_output(self, bank, value, defer=False):
         """
         Sets 8 digital pins to the specified byte value.
         
         :param int bank: Bank of pins to set. (**0:** `Channels 0-7`, **1:** `Channels 8-15`, **2:** `Channels 16-23`, **3:** `Channels 24-31`)
         :param byte value: A byte between 0 and 255 that detemines how the 8bits in the bank should be set.
+        :param bool defer: (Optional) Send with the next commit(), in the same write as the move
         
         :raises ValueError: if `bank` not in the range [0,3]
         :raises ValueError: if `value` not in the range [0,255]
         """
-        if (type(bank) != int or bank >= len(self._servos)//8 or bank < 0):
-            raise ValueError("Bank must be an integer between 0 and {}".format(len(self._servos)//8))
-        if (type(value) != int or value > 255 or value < 0):
-            raise ValueError("Value must be an integer between 0 and 255")
+        self.set_outputs(banks={bank: value}, defer=defer)
+    
+    def set_outputs(self, pins=None, banks=None, defer=False):
+        """
+        Set several output pins and banks in one write. Banks are set before pins.
+        
+        :param dict pins: (Optional) Level per servo index, name or instance, see set_binary_output()
+        :param dict banks: (Optional) Byte per bank, see set_byte_output()
+        :param bool defer: (Optional) Send with the next commit(), in the same write as the move.
+            A later change of the same pin or bank replaces a deferred one.
         
-        self.ser.write_line('#{}:{}'.format(bank, value))
+        :raises ValueError: if a bank or a byte value is out of range
+        
+        Example:
+        ::
         
+            ssc.set_outputs(pins={'valve': 1}, banks={3: 0x0F}, defer=True)
+            ssc['grip'].position = 2000
+            ssc.commit(500)     # "#3:15#12H" and "#10P2000T500" in one write
+        """
+        changes = []
+        for bank, value in sorted((banks or {}).items()):
+            if (type(bank) != int or bank >= len(self._servos)//8 or bank < 0):
+                raise ValueError("Bank must be an integer between 0 and {}".format(len(self._servos)//8))
+            if (type(value) != int or value > 255 or value < 0):
+                raise ValueError("Value must be an integer between 0 and 255")
+            changes.append((('bank', bank), '#{}:{}'.format(bank, value)))
+        for channel, level in (pins or {}).items():
+            serv = self[channel]
+            changes.append((('pin', serv.num), '#{}{}'.format(serv.num, 'L' if level == 0 else 'H')))
+        
+        if not defer:
+            if changes:
+                self._send(''.join(cmd for _, cmd in changes))
+            return
+        
+        for key, cmd in changes:
+            ## The last change of a pin wins, and a bank overrides its pins set before it
+            if key[0] == 'bank':
+                pins_of_bank = range(8*key[1], 8*key[1] + 8)
+                self._outputs = [(k, c) for k, c in self._outputs
+                                 if not (k[0] == 'pin' and k[1] in pins_of_bank)]
+            self._outputs = [(k, c) for k, c in self._outputs if k != key]
+            self._outputs.append((key, cmd))
+    
+    def _take_outputs(self):
+        """
+        Deferred output commands as one line, emptying the queue
+        
+        :rtype: str
+        """
+        outputs, self._outputs = self._outputs, []
+        return ''.join(cmd for _, cmd in outputs)
+    
     
     def get_firmware_version(self):
         """
@@ -234,9 +421,7 @@ class SSC32(object):
         :return: Firmware version of board
         :rtype: str
         """
-        self.ser.write_line('VER')
-        r = self.ser.read_line()
-        return r
+        return self._request(Request.version())
 
 
     def is_done(self, verbose=False):
@@ -250,9 +435,7 @@ class SSC32(object):
         :return: True if movement is finished, False otherwise
         :rtype: bool
         """
-        self.ser.flushInput()
-        self.ser.write_line('Q')
-        done = (self.ser.read(1) == '.')
+        done = self._request(Request.movement_done())
         
         if done:
             return True
@@ -279,11 +462,7 @@ class SSC32(object):
         :rtype: int
         """
         serv = self[servo]
-        self.ser.write_line("QP{}".format(serv.num))
-        
-        r = self.ser.read(1)
-        r = struct.unpack('B', r)[0]*10
-        return r
+        return self._request(Request.pulse_width([serv.num]))[0]
         
     
     def stop_servo(self, servo):
@@ -294,8 +473,21 @@ class SSC32(object):
         :type servo: int or str or ssc32.Servo
         """
         serv = self[servo]
-        self.ser.write_line('STOP {}'.format(serv.num))
+        self._send('STOP {}'.format(serv.num), PRIORITY_STOP)
         serv.is_moving = False
+        
+    
+    def emergency_stop(self):
+        """
+        Stop every servo where it is. With a scheduler running, motion frames
+        still waiting in its queue are dropped first.
+        """
+        if self.scheduler is not None:
+            self.scheduler.clear(PRIORITY_MOTION)
+        
+        self._send('\r'.join('STOP {}'.format(s.num) for s in self._servos), PRIORITY_STOP)
+        for s in self._servos:
+            s.is_moving = False
 
     ##########
     ## SSC32 I/O COMMANDS
@@ -318,28 +510,13 @@ class SSC32(object):
             ## [240, 30, 196]
         """
         
-        cmd = ""
-        count = 0
-        
-        for input in inputs:
-            input = input.upper()
-            if (input >= "A" and input <= "D"):
-                cmd += "V" + input + " "
-                count += 1
-
-        if (cmd == ""):
+        names = _input_names(inputs)
+        if (names == ""):
             return None
         
-        
-        self.ser.write_line(cmd)
-        vals = self.ser.read(count)
-        
-        ret = []
-        for v in vals:
-            v = struct.unpack('B', v)[0]
-            ret.append(v)
+        ret = self._request(Request.analog(names))
             
-        if (count == 1):
+        if (len(ret) == 1):
             return ret[0]
         
         return ret
@@ -365,31 +542,13 @@ class SSC32(object):
             ## [True, False, True]
         """
         
-        cmd = ""
-        count = 0
-        
-        lat = ""
-        if (latched):
-            lat = "L"
-        
-        for input in inputs:
-            input = input.upper()
-            if (input >= "A" and input <= "D"):
-                cmd += input + lat + " "
-                count += 1
-
-        if (cmd == ""):
+        names = _input_names(inputs)
+        if (names == ""):
             return None
         
-        
-        self.ser.write_line(cmd)
-        vals = self.ser.read(count)
-        
-        ret = []
-        for v in vals:
-            ret.append(v == "1")
+        ret = self._request(Request.digital(names, latched))
             
-        if (count == 1):
+        if (len(ret) == 1):
             return ret[0]
         
         return ret
@@ -398,6 +557,81 @@ class SSC32(object):
     ##########
     ## QUALITY OF LIFE FUNCTIONS
     ##########
+    def start_scheduler(self):
+        """
+        Hand the port over to a CommandScheduler thread. Afterwards every
+        method of this object may be called from any thread: stops jump the
+        queue, then motion frames, then queries.
+        
+        :rtype: ssc32.scheduler.CommandScheduler
+        """
+        if self.scheduler is None:
+            self.scheduler = CommandScheduler(self)
+            self.scheduler.start()
+        return self.scheduler
+    
+    def stop_scheduler(self):
+        """
+        Flush the scheduler's queue and go back to direct port access
+        """
+        if self.scheduler is not None:
+            self.scheduler.stop()
+            self.scheduler = None
+    
+    def start_estimator(self, resync_interval=None):
+        """
+        Track servo positions from the commands sent, see ssc32.estimator.
+        Afterwards Servo.current_position and Servo.is_done() answer without
+        querying the board, except to re-sync.
+        
+        :param float resync_interval: (Optional) Seconds between re-syncs. Default: only when PositionEstimator.sync() is called
+        :rtype: ssc32.estimator.PositionEstimator
+        """
+        if self.estimator is None:
+            self.estimator = PositionEstimator(self, resync_interval)
+        else:
+            self.estimator.resync_interval = resync_interval
+        return self.estimator
+    
+    def stop_estimator(self):
+        """
+        Go back to querying positions
+        """
+        self.estimator = None
+    
+    def start_events(self, period=0.02, inputs='ABCD'):
+        """
+        Poll the board for movement completion and input edges on one
+        background loop and publish them, see ssc32.events
+        
+        :param float period: (Optional) Poll period in seconds
+        :param str inputs: (Optional) Digital inputs watched for edges
+        :rtype: ssc32.events.EventBus
+        """
+        if self.events is None:
+            self.events = EventBus(self, period, inputs)
+            self.events.start()
+        return self.events
+    
+    def stop_events(self):
+        """
+        Stop the event poll loop
+        """
+        if self.events is not None:
+            self.events.stop()
+            self.events = None
+    
+    def set_filters(self, *filters):
+        """
+        Filter the servo targets at each commit, see ssc32.filters. Without
+        arguments, targets are sent unfiltered again.
+        
+        :param filters: ssc32.filters.LowPass, SlewLimit or Deadband instances, applied in order
+        :rtype: ssc32.filters.FilterChain or None
+        """
+        self.filters = FilterChain(self, filters) if filters else None
+        return self.filters
+    
     def wait_for_movement_completion(self, verbose=False):
         """
         Wait for movement to end
@@ -406,7 +640,7 @@ class SSC32(object):
         """
         
         while not self.is_done(verbose):
-            time.sleep(0.01)
+            self.clock.sleep(0.01)
 
 
     ##########
@@ -421,15 +655,16 @@ class SSC32(object):
         self.config = config
         
         with open(config, 'r') as f:
-            data = yaml.load(f.read())
+            data = yaml.safe_load(f.read())
             
         self.description = data["description"]
         self.autocommit = data["autocommit"]
         
-        self.ser = SSC32Serial(
-            data["serial"]["port"],
-            data["serial"]["baud"],
-            timeout=data["serial"]["timeout"])
+        if self.ser is None:
+            self._open_serial(
+                data["serial"]["port"],
+                data["serial"]["baud"],
+                data["serial"]["timeout"])
         
         self._servos = []
         for entry in data["servos"]:
@@ -439,6 +674,8 @@ class SSC32(object):
             servo.pwm_per_degree = entry["pwm_per_degree"]
             servo.deg_max = entry["degrees_min"]
             servo.deg_min = entry["degrees_max"]
+            if entry.get("calibration"):
+                servo.calibration = Calibration.from_dict(entry["calibration"])
             servo._update_pwm_limits()
             servo._pos = 1500
             
@@ -475,20 +712,145 @@ class SSC32(object):
             entry["degrees_max"] = s.deg_max
             entry["degrees_min"] = s.deg_min
             entry["inverted"] = s.is_inverted
+            if s.calibration is not None:
+                entry["calibration"] = s.calibration.to_dict()
             data["servos"].append(entry)
         
         with open(config, 'w') as f:
             yaml.dump(data, f, default_flow_style=False)
 
 
-class SSC32Serial(serial.Serial):
+def _input_names(inputs):
+    """
+    Keep the valid input letters ("A" to "D") of a string, upper cased
+    """
+    names = ""
+    for input in inputs:
+        input = input.upper()
+        if (input >= "A" and input <= "D"):
+            names += input
+    return names
+
+
+class Pipeline(object):
+    """
+    Batch of queries sent in a single write, costing one round trip
+    
+    Each query method returns a concurrent.futures.Future that is resolved by
+    execute(), or when leaving the ``with`` block.
+    """
+    
+    def __init__(self, ssc):
+        self.ssc = ssc
+        self._requests = []
+        self._futures = []
+        
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.execute()
+    
+    def __len__(self):
+        return len(self._requests)
+    
+    def _add(self, request, convert=None):
+        future = Future()
+        self._requests.append(request)
+        self._futures.append((future, convert))
+        return future
+    
+    def get_firmware_version(self):
+        """
+        :rtype: concurrent.futures.Future of str
+        """
+        return self._add(Request.version())
+    
+    def is_done(self):
+        """
+        Board-wide movement status only, without SSC32.is_done's per-servo fallback
+        
+        :rtype: concurrent.futures.Future of bool
+        """
+        return self._add(Request.movement_done())
+    
+    def query_pulse_width(self, servo):
+        """
+        :param servo: Servo index, name or instance
+        :type servo: int or str or ssc32.Servo
+        :rtype: concurrent.futures.Future of int
+        """
+        return self._add(Request.pulse_width([self.ssc[servo].num]), lambda r: r[0])
+    
+    def read_analog_input(self, inputs):
+        """
+        :param str inputs: The names of the channel(s) to read (eg. "A" or "ABCD")
+        :rtype: concurrent.futures.Future of int or list(int)
+        """
+        return self._add(Request.analog(_input_names(inputs)), _single)
+    
+    def read_digital_input(self, inputs, latched=False):
+        """
+        :param str inputs: The names of the channel(s) to read (eg. "A" or "ABCD")
+        :param bool latched: Ask for latched input data. False by default.
+        :rtype: concurrent.futures.Future of bool or list(bool)
+        """
+        return self._add(Request.digital(_input_names(inputs), latched), _single)
+    
+    def execute(self):
+        """
+        Write all queued queries back-to-back and read the replies in order
+        
+        :return: The results, in the order the queries were added
+        :rtype: list
+        :raise ShortReadError: if a reply is incomplete. All futures get the exception.
+        """
+        requests, self._requests = self._requests, []
+        futures, self._futures = self._futures, []
+        if not requests:
+            return []
+        
+        try:
+            replies = self.ssc._requests(requests)
+        except Exception as e:
+            for future, _ in futures:
+                future.set_exception(e)
+            raise
+        
+        ret = []
+        for (future, convert), reply in zip(futures, replies):
+            if convert is not None:
+                reply = convert(reply)
+            future.set_result(reply)
+            ret.append(reply)
+        return ret
+
+
+def _single(values):
+    if (len(values) == 1):
+        return values[0]
+    return values
+
+
+class SSC32Serial(serial.Serial, Transport):
     """
     Serial interfacing class. Particularly useful for automatically adding 
     carriage return (CR, \r, 0x0D) and reading until CR is reached
+    
+    Reads give up once the line has been silent for a few character times
+    after the first byte (`inter_byte_timeout`), so a truncated reply is
+    detected right away instead of after the full `timeout`.
+    
+    The default ssc32.transport.Transport. On POSIX, writes go straight from
+    the caller's buffer to the port without a copy.
     """
 
     def __init__(self, port, baudrate, timeout=1):
-        super(SSC32Serial, self).__init__(port, baudrate, timeout=timeout)
+        ## 5 characters of 10 bits, but no less than 5ms for USB latency
+        inter_byte_timeout = max(0.005, 50.0/baudrate)
+        super(SSC32Serial, self).__init__(port, baudrate, timeout=timeout,
+                                          inter_byte_timeout=inter_byte_timeout)
 
         # for baudrate detection on Open Robotics controllers
         self.write_line('\r'*10)
@@ -509,6 +871,54 @@ class SSC32Serial(serial.Serial):
         self.write(val)
     
     
+    def write(self, data):
+        """
+        Write a bytes-like object without copying it
+        
+        Args:
+            data (bytes, bytearray or memoryview): Data to send
+        
+        Returns:
+            int: Number of bytes written.
+        """
+        if os.name != 'posix':
+            return super(SSC32Serial, self).write(data)
+        
+        try:
+            return write_fd(self.fileno(), data, self.write_timeout)
+        except (IOError, OSError) as e:
+            raise serial.SerialTimeoutException(str(e))
+    
+    
+    def read_into(self, b):
+        """
+        Read into a writable buffer. Waits up to `timeout` for the first byte,
+        then only `inter_byte_timeout` for each following one.
+        
+        Args:
+            b (bytearray or memoryview): Destination buffer
+        
+        Returns:
+            int: Number of bytes read.
+        """
+        if os.name != 'posix':
+            return super(SSC32Serial, self).readinto(b)
+        
+        try:
+            return read_fd_into(self.fileno(), b, self.timeout, self.inter_byte_timeout)
+        except IOError as e:
+            raise serial.SerialException(str(e))
+    
+    readinto = read_into
+    
+    
+    def reset_input(self):
+        """
+        Drop unread input
+        """
+        self.reset_input_buffer()
+    
+    
     def read_line(self, size=500):
         """
         Read line until a CR (carriage return) is detected
@@ -520,11 +930,10 @@ class SSC32Serial(serial.Serial):
             str: Read string.
         """
         
-        val = self.read_until('\r', size)
+        val = self.read_until(b'\r', size)
         
-        if (len(val) > 0):
-            if (val[-1] == "\r"):
-                val = val[0:-1]
+        if (val.endswith(b'\r')):
+            val = val[0:-1]
                 
         if sys.version_info >= (3, 0):
             val = val.decode()
@@ -573,7 +982,7 @@ class Servo(object):
         
         if(pos is not None and type(pos) != int):
             raise TypeError("Position must be an integer")
-        self.position = pos
+        self._pos = pos
         
         #####
         ## INTERNAL
@@ -585,6 +994,7 @@ class Servo(object):
         
         self.pwm_center = 1500
         self.pwm_per_degree = 5.56
+        self.calibration = None
         self.deg_max = 180
         self.deg_min = -180
         self._update_pwm_limits()
@@ -654,10 +1064,13 @@ class Servo(object):
     @property
     def current_position(self):
         """
-        Current position using PWM.
+        Current position using PWM. Estimated without a query when the
+        controller runs a PositionEstimator.
 
         :type: int
         """
+        if self.ssc.estimator is not None:
+            return self.ssc.estimator.position(self)
         return self.ssc.query_pulse_width(self)
         
 
@@ -695,6 +1108,30 @@ class Servo(object):
         else:
             self._name = None
 
+    def pwm_from_degrees(self, deg):
+        """
+        Pulse width for an angle, through the calibration table if there is one.
+        Not clamped to the servo limits.
+        
+        :param float deg: Angle in degrees
+        :rtype: int
+        """
+        if self.calibration is not None:
+            deg = self.calibration.commanded(deg)
+        return int(deg*self.pwm_per_degree + self.pwm_center)
+    
+    def degrees_from_pwm(self, pos):
+        """
+        Angle for a pulse width, the inverse of pwm_from_degrees()
+        
+        :param int pos: Pulse width
+        :rtype: float
+        """
+        deg = (pos - self.pwm_center)/self.pwm_per_degree
+        if self.calibration is not None:
+            deg = self.calibration.measured(deg)
+        return deg
+
     @property
     def degrees(self):
         """
@@ -703,7 +1140,7 @@ class Servo(object):
         :type: float
         """
         
-        return (self._pos - self.pwm_center)/self.pwm_per_degree
+        return self.degrees_from_pwm(self._pos)
         
         
         """
@@ -722,7 +1159,7 @@ class Servo(object):
     def degrees(self, deg):
         deg = float(deg)
         
-        pos = int(deg*self.pwm_per_degree + self.pwm_center)
+        pos = self.pwm_from_degrees(deg)
         self.position = pos
         
         """
@@ -760,7 +1197,7 @@ class Servo(object):
         :rtype: bool
         """
         if (self.is_moving):
-            reached = abs(self.position == self.current_position) < self.reached_threshold
+            reached = abs(self.position - self.current_position) < self.reached_threshold
             if (reached):
                 self.is_moving = False
                 
@@ -770,10 +1207,11 @@ class Servo(object):
             ## Not moving
             return True
 
-    def _get_cmd_string(self):
+    def _get_cmd_string(self, speed=None):
         """
         Create the command string to send to the control board for this particular servo
         
+        :param int speed: (Optional) Speed for this move only, instead of `speed`
         :return: Command string
         :rtype: str
         """
@@ -785,8 +1223,10 @@ class Servo(object):
                 channel=self.num,
                 pulse_width=self._pos)
             
-            if (self._speed):
-                cmd += "S{speed}".format(speed=self._speed)
+            if speed is None:
+                speed = self._speed
+            if (speed):
+                cmd += "S{speed}".format(speed=speed)
             
             return cmd
         else:
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Background pulse width telemetry (requires NumPy).
+
+A TelemetryPoller samples selected channels at a fixed rate, one batched
+``QP`` query per tick, into a ring buffer of timestamps and pulse widths.
+The buffer is mirrored: every sample is written twice, ``capacity`` rows
+apart, so the last n samples are always one contiguous slice. latest()
+hands out read-only views of it, never copies.
+
+Example:
+::
+
+    from ssc32.telemetry import TelemetryPoller
+
+    poller = TelemetryPoller(ssc, ['joint0', 'joint1'], rate=50)
+    poller.start()
+    ...
+    times, pulses = poller.latest(100)
+    print(poller.velocity())            # pulse width per second, per channel
+    print(poller.stalled())             # channels not moving toward their target
+    poller.stop()
+"""
+
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .protocol import Request, PORT_ERRORS
+
+__all__ = [
+    'TelemetryPoller',
+]
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("NumPy is required for telemetry")
+
+
+class TelemetryPoller(object):
+    """
+    Samples servo pulse widths on a thread into a mirrored ring buffer
+
+    Errors on the thread do not stop it: `error_count` counts them and
+    `last_error` holds the latest, for failed polls and on_stall exceptions.
+    """
+
+    def __init__(self, ssc, channels=None, rate=50.0, capacity=1024, on_stall=None):
+        """
+        :type ssc: ssc32.SSC32
+        :param list channels: (Optional) Servos to sample. Default: every named servo, or all if none has a name
+        :param float rate: (Optional) Samples per second
+        :param int capacity: (Optional) Samples kept
+        :param func on_stall: (Optional) Called on the poller thread with the list of stalled servo numbers, see stalled()
+        """
+        _require_numpy()
+        self.ssc = ssc
+        if channels is None:
+            servos = [s for s in ssc._servos if s.name is not None] or ssc._servos
+        else:
+            servos = [ssc[c] for c in channels]
+        self.channels = [s.num for s in servos]
+        self._servos = servos
+        self.period = 1.0/rate
+        self.capacity = capacity
+        self.on_stall = on_stall
+        self.count = 0
+        self.error_count = 0
+        self.last_error = None
+
+        self._times = np.zeros(2*capacity)
+        self._pulses = np.zeros((2*capacity, len(self.channels)), dtype=np.int32)
+        self._request = Request.pulse_width(self.channels)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        """
+        Number of samples held
+        """
+        return min(self.count, self.capacity)
+
+    def poll(self):
+        """
+        Take one sample now
+
+        :return: The pulse widths, in the order of `channels`
+        :rtype: list(int)
+        """
+        pulses = self.ssc._request(self._request)
+        now = self.ssc.clock.time()
+        with self._lock:
+            row = self.count % self.capacity
+            for i in (row, row + self.capacity):
+                self._times[i] = now
+                self._pulses[i] = pulses
+            self.count += 1
+        return pulses
+
+    def latest(self, n=None):
+        """
+        The last `n` samples, oldest first, as read-only views of the ring
+        buffer. Rows are overwritten once `capacity` newer samples have been
+        taken: copy them to keep them longer.
+
+        :param int n: (Optional) Number of samples. Default: all held
+        :return: ``(times, pulses)``, shapes ``(n,)`` and ``(n, len(channels))``
+        :rtype: tuple(numpy.ndarray, numpy.ndarray)
+        """
+        with self._lock:
+            held = min(self.count, self.capacity)
+            n = held if n is None else min(n, held)
+            end = (self.count - 1) % self.capacity + self.capacity + 1 if self.count else 0
+            times = self._times[end - n:end]
+            pulses = self._pulses[end - n:end]
+        times.flags.writeable = False
+        pulses.flags.writeable = False
+        return times, pulses
+
+    def velocities(self, n=None):
+        """
+        Velocity between consecutive samples
+
+        :param int n: (Optional) Number of samples to use. Default: all held
+        :return: Pulse width per second, shape ``(n - 1, len(channels))``
+        :rtype: numpy.ndarray
+        """
+        times, pulses = self.latest(n)
+        dt = np.diff(times)
+        dt[dt == 0] = np.nan
+        return np.diff(pulses, axis=0)/dt[:, None]
+
+    def velocity(self, window=5):
+        """
+        Current velocity of every channel: least squares slope of the last `window` samples
+
+        :param int window: (Optional) Number of samples, at least 2
+        :return: Pulse width per second, one per channel. Zeros until two samples are held.
+        :rtype: numpy.ndarray
+        """
+        times, pulses = self.latest(window)
+        if len(times) < 2:
+            return np.zeros(len(self.channels))
+        t = times - times.mean()
+        denom = (t*t).sum()
+        if denom == 0:
+            return np.zeros(len(self.channels))
+        return (t[:, None]*(pulses - pulses.mean(axis=0))).sum(axis=0)/denom
+
+    def stalled(self, window=5, min_speed=20.0, tolerance=20):
+        """
+        Channels away from their target that have stopped moving
+
+        :param int window: (Optional) Samples used for the velocity, see velocity()
+        :param float min_speed: (Optional) Pulse width per second under which a channel counts as stopped
+        :param int tolerance: (Optional) Distance to the target, in pulse width, counting as arrived
+        :return: Servo numbers
+        :rtype: list(int)
+        """
+        if len(self) < window:
+            return []
+        _, pulses = self.latest(1)
+        speed = np.abs(self.velocity(window))
+        targets = np.array([s._pos or 0 for s in self._servos])
+        away = np.abs(targets - pulses[0]) > tolerance
+        moving = np.array([s.is_moving for s in self._servos], dtype=bool)
+        stuck = away & moving & (speed < min_speed)
+        return [self.channels[i] for i in np.flatnonzero(stuck)]
+
+    ##########
+    ## THREAD
+    ##########
+    def _run(self):
+        while not self._stop.wait(self.period):
+            try:
+                self.poll()
+            except PORT_ERRORS as e:
+                self._error(e)
+                continue
+            if self.on_stall is not None:
+                try:
+                    stalled = self.stalled()
+                    if stalled:
+                        self.on_stall(stalled)
+                except Exception as e:
+                    ## on_stall is the caller's code: keep sampling whatever it raises
+                    self._error(e)
+
+    def _error(self, e):
+        """
+        Keep the error for the caller, see `last_error` and `error_count`
+        """
+        self.last_error = e
+        self.error_count += 1
+
+    def start(self):
+        """
+        Sample on a background thread. Starts the controller's scheduler so
+        the polls can share the port with other threads.
+        """
+        if self._thread is not None:
+            return
+        self.ssc.start_scheduler()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='ssc32-telemetry')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop sampling and wait for the thread
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
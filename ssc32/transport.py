@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Byte transports between SSC32 and a board
+"""
+
+import io
+import os
+import select
+
+__all__ = [
+    'Transport',
+    'FdTransport',
+    'write_fd',
+    'read_fd_into',
+]
+
+
+class Transport(object):
+    """
+    What SSC32 needs from the link to the board
+
+    Subclasses implement write() and read_into(), and fileno() if the link
+    has a file descriptor (ssc32.reactor.Reactor needs one). `port`,
+    `baudrate` and `timeout` are reported in repr() and saved configs.
+
+    Buffers may be ``bytes``, ``bytearray``, ``memoryview`` or anything else
+    exposing the buffer protocol, and must not be copied, so encoders can
+    build a frame in place and hand it over.
+    """
+    port = None
+    baudrate = None
+    timeout = None
+
+    def write(self, data):
+        """
+        Write all of `data`
+
+        :param data: Bytes-like object
+        :return: Number of bytes written
+        :rtype: int
+        """
+        raise NotImplementedError
+
+    def read_into(self, buf):
+        """
+        Read into a writable buffer. Waits up to `timeout` for the first byte,
+        then returns early once the line goes quiet.
+
+        :param buf: Writable bytes-like object
+        :return: Number of bytes read
+        :rtype: int
+        """
+        raise NotImplementedError
+
+    def flush(self):
+        """
+        Wait until everything written has been sent
+        """
+        pass
+
+    def fileno(self):
+        """
+        :rtype: int
+        :raise io.UnsupportedOperation: if the transport has no file descriptor
+        """
+        raise io.UnsupportedOperation('fileno')
+
+    def reset_input(self):
+        """
+        Drop input received but not read yet
+        """
+        pass
+
+    def close(self):
+        pass
+
+    def write_line(self, line):
+        """
+        Write a command line with its CR terminator
+
+        :param str line: Command line
+        """
+        self.write((line + '\r').encode())
+
+    ## pyserial names, used by code written against SSC32Serial
+    def readinto(self, buf):
+        return self.read_into(buf)
+
+    def flushInput(self):
+        self.reset_input()
+
+
+def write_fd(fd, data, timeout=None):
+    """
+    Write a whole buffer to a file descriptor, blocking or not, without copying it
+
+    :param int fd: File descriptor
+    :param data: Bytes-like object
+    :param float timeout: (Optional) Maximum time to wait for the descriptor to accept more
+    :return: Number of bytes written
+    :rtype: int
+    :raise IOError: if the descriptor stays full for `timeout`
+    """
+    view = memoryview(data)
+    if view.format != 'B' or view.ndim != 1:
+        view = view.cast('B')
+    sent = 0
+    while sent < len(view):
+        try:
+            sent += os.write(fd, view[sent:])
+        except (BlockingIOError, InterruptedError):
+            _, ready, _ = select.select([], [fd], [], timeout)
+            if not ready:
+                raise IOError('Write timeout')
+    return sent
+
+
+def read_fd_into(fd, buf, timeout, inter_byte_timeout):
+    """
+    Read from a file descriptor into a buffer. Waits up to `timeout` for the
+    first byte, then only `inter_byte_timeout` for each following one.
+
+    :param int fd: File descriptor
+    :param buf: Writable bytes-like object
+    :param float timeout: Time to wait for the first byte, None for ever
+    :param float inter_byte_timeout: Time the line may stay quiet once data arrived
+    :return: Number of bytes read
+    :rtype: int
+    :raise IOError: if the descriptor reports data but returns none
+    """
+    view = memoryview(buf)
+    size = len(view)
+    wait = timeout
+    got = 0
+    while got < size:
+        ready, _, _ = select.select([fd], [], [], wait)
+        if not ready:
+            break
+        if hasattr(os, 'readv'):
+            n = os.readv(fd, [view[got:]])
+        else:
+            data = os.read(fd, size - got)
+            n = len(data)
+            view[got:got + n] = data
+        if n == 0:
+            raise IOError('device reports readiness to read but returned no data')
+        got += n
+        wait = inter_byte_timeout
+    return got
+
+
+class FdTransport(Transport):
+    """
+    Transport over any file descriptor: a pty, a pipe pair, a socket...
+
+    Example:
+    ::
+
+        import os, pty
+        master, slave = pty.openpty()
+        ssc = ssc32.SSC32(transport=FdTransport(master))
+    """
+
+    def __init__(self, fd, out_fd=None, timeout=1, inter_byte_timeout=0.005, port=None):
+        """
+        :param int fd: Descriptor to read from (and write to, unless `out_fd` is given)
+        :param int out_fd: (Optional) Separate descriptor to write to
+        :param float timeout: (Optional) Time to wait for a reply
+        :param float inter_byte_timeout: (Optional) Time the line may stay quiet within a reply
+        :param str port: (Optional) Name reported as the port
+        """
+        self.fd = fd
+        self.out_fd = fd if out_fd is None else out_fd
+        self.timeout = timeout
+        self.inter_byte_timeout = inter_byte_timeout
+        self.port = port if port is not None else 'fd:{0}'.format(fd)
+
+    def write(self, data):
+        return write_fd(self.out_fd, data, self.timeout)
+
+    def read_into(self, buf):
+        return read_fd_into(self.fd, buf, self.timeout, self.inter_byte_timeout)
+
+    def fileno(self):
+        return self.fd
+
+    def reset_input(self):
+        while select.select([self.fd], [], [], 0)[0]:
+            if not os.read(self.fd, 4096):
+                break
+
+    def close(self):
+        os.close(self.fd)
+        if self.out_fd != self.fd:
+            os.close(self.out_fd)
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+Trajectory validation before anything is sent (requires NumPy).
+
+The Servo.position setter clamps out-of-range targets one servo at a time,
+while a script runs. A TrajectoryValidator checks a whole trajectory at
+once instead, as a ``(frames, channels)`` array of pulse widths:
+
+- pulse widths within each servo's ``min`` and ``max``,
+- per-joint velocity and acceleration limits, in pulse width per second
+  (and per second squared),
+- exclusion rules: two joints that must not be in given ranges together.
+
+Each check is one vectorized pass and reports the offending frame indices.
+Scripts are validated as the positions reached at the end of each
+movement, held during its wait. Exclusions are checked at those
+positions, not along the way.
+
+Example:
+::
+
+    from ssc32.validate import TrajectoryValidator
+
+    validator = TrajectoryValidator(ssc, max_velocity=1500)
+    validator.add_exclusion('joint1', (870, 1100), 'joint2', (500, 900))
+    report = validator.check_script(script)
+    if not report.ok:
+        print(report.frames, report.details)
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .script import ScriptError
+from .ssc32 import Servo
+
+__all__ = [
+    'TrajectoryValidator',
+    'ValidationReport',
+    'ValidationError',
+    'script_trajectory',
+]
+
+CHECKS = ('limits', 'velocity', 'acceleration', 'exclusion')
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("NumPy is required for trajectory validation")
+
+
+class ValidationError(ScriptError):
+    """
+    Raised by TrajectoryValidator.validate() for a trajectory that fails a check
+    """
+
+    def __init__(self, report):
+        super(ValidationError, self).__init__(
+            'trajectory fails validation at frames {0}'.format([int(f) for f in report.frames]))
+        self.report = report
+
+
+class ValidationReport(object):
+    """
+    Offending frames of each check
+
+    `limits`, `velocity`, `acceleration` and `exclusion` are sorted arrays
+    of frame indices. `details` lists ``(check, frame, servo number)`` for
+    every violation; exclusions name the first servo of the rule.
+    """
+
+    def __init__(self, frame_count):
+        self.frame_count = frame_count
+        self.details = []
+        for check in CHECKS:
+            setattr(self, check, np.zeros(0, dtype=np.intp))
+
+    def _add(self, check, frames, channels):
+        setattr(self, check, np.union1d(getattr(self, check), frames))
+        self.details.extend((check, int(f), int(c)) for f, c in zip(frames, channels))
+
+    @property
+    def frames(self):
+        """
+        Every offending frame
+
+        :type: numpy.ndarray
+        """
+        ret = np.zeros(0, dtype=np.intp)
+        for check in CHECKS:
+            ret = np.union1d(ret, getattr(self, check))
+        return ret
+
+    @property
+    def ok(self):
+        """
+        :type: bool
+        """
+        return not self.details
+
+    def __repr__(self):
+        return '<ValidationReport frames={0} {1}>'.format(self.frame_count, ' '.join(
+            '{0}={1}'.format(check, len(getattr(self, check))) for check in CHECKS))
+
+
+def script_trajectory(script, ssc):
+    """
+    Positions reached by each movement of a script, unclamped
+
+    :param script: Script, or compiled script (see ssc32.binary)
+    :param ssc: Controller whose servo names and calibrations resolve the joints
+    :type ssc: ssc32.SSC32
+    :return: ``(channels, pulses, times, waits)``: servo numbers, pulse widths
+        of shape ``(movements, channels)`` with NaN before a channel's first
+        target, then movement times and waits in seconds
+    :rtype: tuple
+    """
+    _require_numpy()
+    if hasattr(script, 'arrays'):
+        times, waits, masks, pwm = script.arrays()
+        channels = list(script.channels)
+        bits = np.asarray(masks)[:, None] >> np.arange(len(channels)) & 1
+        raw = np.where(bits.astype(bool), pwm, np.nan)
+        times = np.asarray(times)/1000.0
+        waits = np.asarray(waits)/1000.0
+    else:
+        columns = {}
+        rows = []
+        times = []
+        waits = []
+        for move in script.iter_movements():
+            row = {}
+            for servo, pwm in move.targets(ssc, clamp=False):
+                columns.setdefault(servo.num, len(columns))
+                row[servo.num] = pwm
+            rows.append(row)
+            times.append(move.time if move.time else script.time)
+            waits.append(move.wait)
+        channels = sorted(columns)
+        raw = np.full((len(rows), len(channels)), np.nan)
+        for i, row in enumerate(rows):
+            for k, c in enumerate(channels):
+                if c in row:
+                    raw[i, k] = row[c]
+        times = np.asarray(times, dtype=float)
+        waits = np.asarray(waits, dtype=float)
+
+    ## Hold every channel at its last target
+    set_ = ~np.isnan(raw)
+    last = np.where(set_, np.arange(len(raw))[:, None], -1)
+    last = np.maximum.accumulate(last, axis=0)
+    pulses = raw[np.maximum(last, 0), np.arange(raw.shape[1])]
+    pulses[last < 0] = np.nan
+    return channels, pulses, times, waits
+
+
+class TrajectoryValidator(object):
+    """
+    Vectorized limit, velocity, acceleration and exclusion checks
+    """
+
+    def __init__(self, ssc, max_velocity=None, max_acceleration=None):
+        """
+        :param ssc: Controller whose servo limits are checked
+        :type ssc: ssc32.SSC32
+        :param max_velocity: (Optional) Pulse width per second, for every servo or as ``{servo: limit}``
+        :type max_velocity: float or dict
+        :param max_acceleration: (Optional) Pulse width per second squared, same forms
+        :type max_acceleration: float or dict
+        """
+        _require_numpy()
+        self.ssc = ssc
+        ## Indexed by servo number
+        self.min = np.full(Servo.MAX_CHANNEL + 1, -np.inf)
+        self.max = np.full(Servo.MAX_CHANNEL + 1, np.inf)
+        for servo in ssc._servos:
+            self.min[servo.num] = servo.min
+            self.max[servo.num] = servo.max
+        self.max_velocity = self._per_channel(max_velocity)
+        self.max_acceleration = self._per_channel(max_acceleration)
+        self.exclusions = []
+
+    def _per_channel(self, limit):
+        ret = np.full(Servo.MAX_CHANNEL + 1, np.inf)
+        if isinstance(limit, dict):
+            for servo, value in limit.items():
+                ret[self.ssc[servo].num] = value
+        elif limit is not None:
+            ret[:] = limit
+        return ret
+
+    def add_exclusion(self, servo_a, range_a, servo_b, range_b):
+        """
+        Forbid two servos from being in the given ranges at the same time
+
+        :param servo_a: Servo index, name or instance
+        :param tuple range_a: ``(low, high)`` pulse widths, inclusive
+        :param servo_b: Servo index, name or instance
+        :param tuple range_b: ``(low, high)`` pulse widths, inclusive
+        """
+        self.exclusions.append((self.ssc[servo_a].num, tuple(range_a),
+                                self.ssc[servo_b].num, tuple(range_b)))
+
+    def check(self, pulses, durations, channels=None, frames=None):
+        """
+        Check a trajectory
+
+        :param pulses: Pulse widths, shape ``(samples, channels)``. NaN for unknown.
+        :type pulses: numpy.ndarray
+        :param durations: Time taken to reach each sample from the previous one, in seconds. A scalar for a fixed rate.
+        :type durations: numpy.ndarray or float
+        :param list channels: (Optional) Servo of each column. Default: 0, 1, ...
+        :param frames: (Optional) Frame index reported for each sample. Default: the sample index
+        :type frames: numpy.ndarray
+        :rtype: ssc32.validate.ValidationReport
+        """
+        pulses = np.asarray(pulses, dtype=float)
+        if pulses.ndim == 1:
+            pulses = pulses[:, None]
+        n, width = pulses.shape
+        if channels is None:
+            channels = range(width)
+        nums = np.array([self.ssc[c].num for c in channels], dtype=np.intp)
+        durations = np.broadcast_to(np.asarray(durations, dtype=float), (n,))
+        frames = np.arange(n) if frames is None else np.asarray(frames)
+        report = ValidationReport(int(frames[-1]) + 1 if n else 0)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            bad = (pulses < self.min[nums]) | (pulses > self.max[nums])
+            rows, cols = np.nonzero(bad)
+            report._add('limits', frames[rows], nums[cols])
+
+            ## Velocity of the segment ending at each sample; jumps in no time are infinite
+            step = np.diff(pulses, axis=0)
+            velocity = step/durations[1:, None]
+            velocity[(step == 0) & (durations[1:, None] == 0)] = 0
+            rows, cols = np.nonzero(np.abs(velocity) > self.max_velocity[nums])
+            report._add('velocity', frames[rows + 1], nums[cols])
+
+            ## From rest before the first segment
+            full = np.vstack([np.zeros((1, width)), velocity]) if n else np.zeros((0, width))
+            change = np.diff(full, axis=0)
+            acceleration = change/durations[1:, None]
+            acceleration[(change == 0) & (durations[1:, None] == 0)] = 0
+            rows, cols = np.nonzero(np.abs(acceleration) > self.max_acceleration[nums])
+            report._add('acceleration', frames[rows + 1], nums[cols])
+
+        index = dict((c, k) for k, c in enumerate(nums))
+        for a, (a_low, a_high), b, (b_low, b_high) in self.exclusions:
+            if a not in index or b not in index:
+                continue
+            pa = pulses[:, index[a]]
+            pb = pulses[:, index[b]]
+            rows = np.flatnonzero((pa >= a_low) & (pa <= a_high) & (pb >= b_low) & (pb <= b_high))
+            report._add('exclusion', frames[rows], np.full(len(rows), a))
+        return report
+
+    def check_script(self, script):
+        """
+        Check every movement of a script or compiled script
+
+        :param script: Script, or compiled script (see ssc32.binary)
+        :rtype: ssc32.validate.ValidationReport
+        """
+        channels, pulses, times, waits = script_trajectory(script, self.ssc)
+
+        ## A sample where each movement arrives, and one where its wait ends
+        held = waits > 0
+        counts = 1 + held
+        first = np.cumsum(counts) - counts
+        frames = np.repeat(np.arange(len(pulses)), counts)
+        durations = np.empty(len(frames))
+        durations[first] = times
+        durations[first[held] + 1] = waits[held]
+
+        servos = dict((s.num, s) for s in self.ssc._servos)
+        report = self.check(pulses[frames], durations, [servos[c] for c in channels], frames)
+        report.frame_count = len(pulses)
+        return report
+
+    def validate(self, script):
+        """
+        Check a script and refuse it if anything fails
+
+        :param script: Script, or compiled script (see ssc32.binary)
+        :return: The report of a valid script
+        :rtype: ssc32.validate.ValidationReport
+        :raise ValidationError: if a check fails
+        """
+        report = self.check_script(script)
+        if not report.ok:
+            raise ValidationError(report)
+        return report
@@ -3,18 +3,23 @@
 
 import os
 import sys
-import yaml
-import ssc32
+import json
+import socket
 from optparse import OptionParser
 
+## yaml and ssc32 are imported where needed so the client mode starts fast
+
 
 DEFAULT_CFG = os.path.abspath('../examples/example.cfg')
+DAEMON_COMMANDS = ('run', 'stop', 'status', 'pose')
 
 def load_yaml(filename):
+    import yaml
     with open(filename, 'r') as fd:
-        return yaml.load(fd)
+        return yaml.load(fd, Loader=yaml.Loader)
 
 def save_yaml(filename, data):
+    import yaml
     d = yaml.dump(data)
     with open(filename, 'w') as fd:
         fd.write(d.encode('utf-8'))
@@ -34,6 +39,41 @@ def load_config(cfg_fname=DEFAULT_CFG):
     cfg = load_yaml(cfg_fname)
     return cfg
 
+def send_command(path, request):
+    """
+    Send one request to a running daemon and return its decoded reply
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        reply = sock.makefile('rb').readline()
+    finally:
+        sock.close()
+    if not reply:
+        return {'ok': False, 'error': 'daemon closed the connection'}
+    return json.loads(reply.decode('utf-8'))
+
+def client(path, args, wait):
+    if not args or args[0] not in DAEMON_COMMANDS:
+        print('Error: expected one of {0}'.format(', '.join(DAEMON_COMMANDS)))
+        return 1
+
+    request = {'cmd': args[0]}
+    if args[0] == 'run':
+        if len(args) != 2:
+            print('Error: run needs a script')
+            return 1
+        request['script'] = abspath(args[1])
+        request['wait'] = wait
+
+    reply = send_command(path, request)
+    if not reply['ok']:
+        sys.stderr.write(reply['error'] + '\n')
+        return 1
+    print(json.dumps(reply['result'], indent=2, sort_keys=True))
+    return 0
+
 def main():
     parser = OptionParser()
     parser.add_option('-c', '--cofig', dest='cfg_fname', default=DEFAULT_CFG, help='config file')
@@ -41,13 +81,31 @@ def main():
     parser.add_option('-b', '--baudrate', dest='baud', help='baudrate', default=None)
     parser.add_option('-s', '--servo-config', dest='servoconfig', help='servo config', default=None)
     parser.add_option('-u', '--update-config', dest='upconf', action='store_true', default=False, help='Update config file')
+    parser.add_option('--compile', dest='compile', default=None, help='Compile the script to a binary file instead of running it')
+    parser.add_option('--stream', dest='stream', action='store_true', default=False, help='Parse the script while playing it')
+    parser.add_option('-S', '--socket', dest='socket', default=None, help='Daemon socket. Without --daemon, send run/stop/status/pose to it')
+    parser.add_option('-d', '--daemon', dest='daemon', action='store_true', default=False, help='Keep the board open and serve requests on --socket')
+    parser.add_option('--script-dir', dest='script_dir', default=None, help='With --daemon: only run scripts from this directory')
+    parser.add_option('-w', '--wait', dest='wait', action='store_true', default=False, help='With run: return once the script has finished')
+    parser.add_option('-n', '--dry-run', dest='dry_run', action='store_true', default=False, help='Time the script without opening the board')
+    parser.add_option('--profile', dest='profile', action='store_true', default=False, help='With --dry-run: print the timing of every movement')
 
     options, args = parser.parse_args()
 
-    if len(args) != 1:
+    if options.socket is not None and not options.daemon:
+        return client(abspath(options.socket), args, options.wait)
+
+    if options.daemon and options.socket is None:
+        print('Error: --daemon needs --socket')
+        return 1
+
+    if len(args) != (0 if options.daemon else 1):
         print('Error args: ', args)
         return 1
 
+    import ssc32
+    from ssc32.binary import BinaryScript, yaml_to_binary
+
     conf = load_config(options.cfg_fname)
     if options.port is not None:
         conf['port'] = options.port
@@ -56,14 +114,52 @@ def main():
     if options.servoconfig is not None:
         conf['config'] = abspath(options.servoconfig)
 
-    ssc = ssc32.SSC32(conf['port'], conf['baud'], config=conf['config'])
+    if options.dry_run:
+        from ssc32.emulator import EmulatedSSC32
+        ssc = EmulatedSSC32(conf['port'], conf['baud'], config=conf['config'])
+    else:
+        ssc = ssc32.SSC32(conf['port'], conf['baud'], config=conf['config'])
 
     if options.upconf:
         save_yaml(abspath(options.cfg_fname), conf)
 
+    if options.daemon:
+        from ssc32.daemon import ScriptDaemon
+        try:
+            ScriptDaemon(ssc, abspath(options.socket), options.script_dir).serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
     filename = os.path.abspath(args[0])
 
-    script = load_yaml(filename)
+    if options.compile is not None:
+        yaml_to_binary(filename, abspath(options.compile), ssc)
+        return 0
+
+    if filename.endswith('.ssb'):
+        script = BinaryScript(filename)
+    elif options.stream:
+        script = ssc32.StreamingScript(filename)
+    else:
+        script = load_yaml(filename)
+
+    if options.dry_run:
+        if isinstance(script, BinaryScript):
+            script = script.to_script()
+        profile = script.analyze(ssc)
+        if options.profile:
+            print(profile.report())
+            print('')
+        print('duration:     {0:.3f} s'.format(profile.duration))
+        print('commands:     {0} bytes, {1:.3f} s on the wire at {2} baud'.format(
+            profile.bytes, profile.wire_time, profile.baudrate))
+        print('polls:        {0} ({1} bytes)'.format(profile.polls, profile.poll_bytes))
+        print('peak rate:    {0:.0f} B/s of {1:.0f} B/s'.format(profile.peak_rate, profile.link_rate or 0))
+        print('overruns:     {0}'.format(
+            ', '.join(str(f.index) for f in profile.overruns) or 'none'))
+        return 1 if profile.overruns else 0
+
     script(ssc)
 
     return 0
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+
+import yaml
+
+from ssc32.binary import BinaryScript, compile_script
+from ssc32.simulation import SimulatedSSC32
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples')
+
+
+def _example(name):
+    return os.path.join(EXAMPLES, name)
+
+
+class TestCompiledRun(unittest.TestCase):
+    """
+    examples/arm.cfg puts the servos on channels 0, 1, 2, 8, 9 and 10
+    """
+
+    def setUp(self):
+        self.sim = SimulatedSSC32(config=_example('arm.cfg'))
+        with open(_example('present_joints.yaml')) as fd:
+            self.script = yaml.load(fd, Loader=yaml.Loader)
+
+    def test_channels(self):
+        compiled = compile_script(self.script, self.sim)
+        self.assertEqual(list(compiled.channels), [0, 1, 2, 8, 9, 10])
+
+    def test_run(self):
+        compiled = compile_script(self.script, self.sim)
+        compiled.run(self.sim)
+
+        last = compiled.record(len(compiled) - 1)
+        for k, channel in enumerate(compiled.channels):
+            if last[2] >> k & 1:
+                self.assertEqual(self.sim.board.motion.target[channel], last[3][k])
+
+    def test_run_binary(self):
+        fd, path = tempfile.mkstemp(suffix='.ssb')
+        os.close(fd)
+        compile_script(self.script, self.sim).save(path)
+        try:
+            with BinaryScript(path) as script:
+                script.run(self.sim)
+                self.assertEqual(self.sim.board.motion.target[8], self.sim['joint0']._pos)
+        finally:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    unittest.main()